@@ -0,0 +1,61 @@
+"""
+Build the local index of the model runs that are on the server. Once a
+model run is in the index, the download scripts get its grid and urls
+from the index instead of the server, and model runs that aren't on the
+server are skipped without trying to open them
+
+Usage:
+    python ADCIRC_Cycle_Index.py build                          (every model run on the server)
+    python ADCIRC_Cycle_Index.py build --start 20170430 --end 20180504 --hours 00 12
+    python ADCIRC_Cycle_Index.py build --root saved_catalogs    (folder of saved catalog.xml files)
+    python ADCIRC_Cycle_Index.py show YYYYMMDDHH
+"""
+
+import functions as func
+import argparse
+import datetime as dt
+
+
+parser = argparse.ArgumentParser(description='Build or look at the local index of ADCIRC model runs')
+parser.add_argument('command', choices=['build', 'show'])
+parser.add_argument('date', nargs='?', help='Model run to show (YYYYMMDDHH)')
+parser.add_argument('--start', help='First day to crawl (YYYYMMDD)')
+parser.add_argument('--end', help='Day to stop crawling at, not included (YYYYMMDD)')
+parser.add_argument('--hours', nargs='+', default=['00', '06', '12', '18'], help='Hours to crawl for every day')
+parser.add_argument('--no-times', action='store_true', help="Don't read the length of the time axis")
+parser.add_argument('--refresh', action='store_true', help='Crawl model runs that are already in the index again')
+parser.add_argument('--root', default=func.CATALOG_ROOT,
+                    help='daily/nam catalog url or a local folder of saved catalog.xml files')
+parser.add_argument('--concurrency', type=int, default=func.CATALOG_CONCURRENCY,
+                    help='How many catalogs to download at the same time')
+parser.add_argument('--index-file', default=func.CYCLE_INDEX_FILE, help='SQLite file to store the index in')
+args = parser.parse_args()
+
+if args.command == 'build':
+    dates = None
+    if args.start or args.end:
+        if not (args.start and args.end):
+            parser.error('--start and --end have to be used together')
+        start_date = dt.datetime.strptime(args.start, '%Y%m%d')
+        end_date = dt.datetime.strptime(args.end, '%Y%m%d')
+        dates = func.make_cycles(start_date, end_date, args.hours)
+
+    num_crawled = func.build_cycle_index(dates, args.index_file, with_times=not args.no_times,
+                                         refresh=args.refresh, root=args.root,
+                                         max_concurrency=args.concurrency)
+    print('Crawled %d model runs into %s' % (num_crawled, args.index_file))
+
+elif args.command == 'show':
+    if args.date is None:
+        parser.error('a date (YYYYMMDDHH) is needed to show a model run')
+
+    for cast in ['forecast', 'nowcast']:
+        crawled, cycle = func.lookup_cycle(args.date, cast, index_file=args.index_file)
+        if not crawled:
+            print('%s is not in the index' % args.date)
+            break
+        elif cycle is None:
+            print('%s %-8s: not on the server' % (args.date, cast))
+        else:
+            print('%s %-8s: %s grid, %s time steps, %s' % (args.date, cast, cycle['grid'], cycle['num_times'],
+                                                          ', '.join(cycle['files'])))
@@ -6,66 +6,77 @@ Michael Itzkin, 10/19/2018
 """
 
 import functions as func
-import csv
 
 
-# Print out an intro to the console
-func.intro_prompt()
+# Set the format of the output file: 'csv', 'parquet' (needs the pyarrow
+# package), or 'netcdf'. Every format has the same columns, one row per
+# node per time step
+# CAN BE CHANGED !!
+output_format = 'csv'
 
-# Set the dates, nodes, time zone, and datum to use
-Start_date, Start_date_dt, End_date, End_date_dt, use_gmt, use_navd88, nodes_used = func.make_date_range()
+# Set how many model runs to download at the same time. Set
+# this to 1 to download them one at a time
+# CAN BE CHANGED !!
+num_workers = 4
 
-# Keep a running log of any date that didn't work. This file appends dates that don't work
-# if a dat works than nothing happens with it
-bad_dates_log_fname = 'bad_dates_log.txt'
-bad_dates_log = open(bad_dates_log_fname, 'a')
+# The model runs are downloaded by a pool of processes so everything
+# has to be inside this if-statement (otherwise every process would
+# re-run the whole script)
+if __name__ == '__main__':
 
-# Setup and open a .csv file to write data to. Add a header to the columns
-# for the first node
-date_file_fname = func.make_data_filename(Start_date, use_gmt, use_navd88, ext='csv')
-with open(date_file_fname, 'w+') as adcirc_file:
-    writer = csv.writer(adcirc_file, delimiter=',')
-    writer.writerow(['Date', 'Depth', 'Elevation', 'Max Hs', 'Tp', 'Deep Node Lon', 'Deep Node Lat'])
+    # Write how long every stage of every model run took (and how much
+    # was downloaded) to this file, one line per model run, for example
+    # 'adcirc_metrics.jsonl'. This also prints a progress line while the
+    # model runs download. If this is None the ADCIRC_METRICS_FILE
+    # environment variable is used (no metrics if that isn't set either)
+    # CAN BE CHANGED !!
+    metrics_file = None
+    if metrics_file is not None:
+        func.use_metrics(metrics_file)
 
-    # Lood through every day in the range of dates used. Note that the start and end dates are returned as
-    # a string type (*_date) and a datetime object (*_date_dt). Pass the datetime object to this loop
-    for date in func.daterange(Start_date_dt, End_date_dt):
-    
-        # Convert the date into a string from a datetime object.
-        # Format: yyyymmdd
-        date = date.strftime('%Y%m%d')
-    
-        # Set a list of the hours to loop through. For every day in the
-        # date range, this program will try to download the data for
-        # every hour in this list. You can try adding new times;
-        # Separate the values with a comma and put them in quotes
-        hours = ['00', '06', '12', '18']
-        for hour in hours:
-    
-            # Add the hour to the date string.
-            # New Format: yyyymmddhh
-            date += hour
-        
-            # Write a header row for the .csv file. The "depth", "Max Hs",
-            # and "Tp" columns are repeated for every well but the header will
-            # only print for the first one
-        
-            # Download the data
-            hs_data, tp_data, z_data, status, grid = func.adcirc_full_data_download(date)
-        
-            # Before downloading the forecast data, check if a nowcast
-            # exists for the current date. If so, collect the nowcast
-            # data first before collecting the forecast data
-            if func.find_nowcast(date):
-                func.download_nowcast_data_known_node(date, nodes_used, writer, bad_dates_log, use_gmt, use_navd88)
+    # Print out an intro to the console
+    func.intro_prompt()
 
-            # Clear the hour from the date string
-            # Return to: yyyymmdd
-            date = date[:-2]
-            
-# Close the ADCIRC .csv file and the bad_dates_log.txt file and then print
-# closing messages to the console
-bad_dates_log.close()
-adcirc_file.close()
-print('\r\n\r\nData is finished downloading')
-print('Data was stored in the file: %s\r\n' % date_file_fname)
\ No newline at end of file
+    # Set the dates, nodes, time zone, and datum to use
+    Start_date, Start_date_dt, End_date, End_date_dt, use_gmt, use_navd88, nodes_used = func.make_date_range()
+
+    # Keep a running log of any date that didn't work. This file appends dates that don't work
+    # if a dat works than nothing happens with it
+    bad_dates_log_fname = 'bad_dates_log.txt'
+    bad_dates_log = open(bad_dates_log_fname, 'a')
+
+    # Setup and open the output file to write data to. The header (see
+    # OUTPUT_COLUMNS in functions.py) is written by open_output()
+    date_file_fname = func.make_data_filename(Start_date, use_gmt, use_navd88,
+                                              ext=func.OUTPUT_EXTENSIONS[output_format])
+    adcirc_file = func.open_output(date_file_fname, output_format, func.output_attributes(use_gmt, use_navd88))
+
+    # Set a list of the hours to loop through. For every day in the
+    # date range, this program will try to download the data for
+    # every hour in this list. You can try adding new times;
+    # Separate the values with a comma and put them in quotes
+    hours = ['00', '06', '12', '18']
+
+    # Every model run in the range of dates as yyyymmddhh. Note that the start and end dates
+    # are returned as a string type (*_date) and a datetime object (*_date_dt). Pass the datetime
+    # objects here
+    cycles = [(date, nodes_used, use_gmt, use_navd88)
+              for date in func.make_cycles(Start_date_dt, End_date_dt, hours)]
+
+    # If a nowcast exists for the date, its data is collected. The blocks
+    # of rows come back in date order as soon as they are ready. Dates that
+    # failed with an error that can go away are tried again at the end, the
+    # dates after the first one of those are held back until then so the
+    # output stays in date order
+    for date, status, blocks, log in func.run_cycles(func.extract_known_node_cycle, cycles, num_workers,
+                                                     retry=func.cycle_failed):
+        for block in blocks:
+            func.write_output_block(adcirc_file, block)
+        bad_dates_log.write(log)
+
+    # Close the ADCIRC output file and the bad_dates_log.txt file and then print
+    # closing messages to the console
+    bad_dates_log.close()
+    func.close_output(adcirc_file)
+    print('\r\n\r\nData is finished downloading')
+    print('Data was stored in the file: %s\r\n' % date_file_fname)
@@ -0,0 +1,57 @@
+"""
+Check or rebuild the local mesh cache (x, y, depth) used by the download
+scripts. The mesh is downloaded from the model run for the date given
+
+Usage:
+    python ADCIRC_Mesh_Cache.py list
+    python ADCIRC_Mesh_Cache.py validate YYYYMMDDHH
+    python ADCIRC_Mesh_Cache.py rebuild YYYYMMDDHH
+"""
+
+import functions as func
+import argparse
+import os
+
+
+parser = argparse.ArgumentParser(description='Check or rebuild the local ADCIRC mesh cache')
+parser.add_argument('command', choices=['list', 'validate', 'rebuild'])
+parser.add_argument('date', nargs='?', help='Model run to compare against (YYYYMMDDHH)')
+parser.add_argument('--cache-dir', default=func.MESH_CACHE_DIR, help='Folder the mesh cache is stored in')
+args = parser.parse_args()
+
+if args.command == 'list':
+    # Print the fingerprint of every grid in the cache
+    grids = sorted(os.listdir(args.cache_dir)) if os.path.isdir(args.cache_dir) else []
+    for grid in grids:
+        mesh = func.load_mesh_cache(grid, cache_dir=args.cache_dir)
+        if mesh is None:
+            print('%-8s (incomplete, rebuild it)' % grid)
+        else:
+            print('%-8s %9d nodes  %s' % (grid, mesh['fingerprint']['num_nodes'], mesh['fingerprint']['checksum']))
+    if not grids:
+        print('The mesh cache is empty')
+
+else:
+    if args.date is None:
+        parser.error('a date (YYYYMMDDHH) is needed to %s the mesh cache' % args.command)
+
+    # Open the model run to compare the cache against
+    hs_data, tp_data, z_data, status, grid = func.adcirc_full_data_download(args.date)
+    if status != 'good':
+        raise SystemExit('ERROR: Could not load data for %s' % args.date)
+
+    valid, cached, fresh = func.validate_mesh_cache(hs_data, grid, args.cache_dir)
+    if valid:
+        print('The %s mesh cache matches the model run for %s' % (grid, args.date))
+    elif cached is None:
+        print('There is no %s mesh in the cache' % grid)
+    else:
+        print('The %s mesh cache does NOT match the model run for %s' % (grid, args.date))
+        print('  cached: %d nodes, %s' % (cached['num_nodes'], cached['checksum']))
+        print('  server: %d nodes, %s' % (fresh['num_nodes'], fresh['checksum']))
+
+    if args.command == 'rebuild':
+        func.rebuild_mesh_cache(hs_data, grid, args.cache_dir)
+        print('The %s mesh cache was rebuilt' % grid)
+    elif not valid:
+        raise SystemExit('Run "python ADCIRC_Mesh_Cache.py rebuild %s" to rebuild it' % args.date)
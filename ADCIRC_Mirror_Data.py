@@ -0,0 +1,49 @@
+"""
+Copy model runs from the server into a local folder (a mirror) with the same
+layout as the server, or check the files in a mirror against their checksums.
+
+To have the download scripts read from the mirror instead of the server, set
+the ADCIRC_MIRROR_DIR environment variable to the mirror folder (or call
+func.use_mirror(folder) before downloading)
+
+Usage:
+    python ADCIRC_Mirror_Data.py sync mirror --start 20170430 --end 20170502
+    python ADCIRC_Mirror_Data.py sync mirror --start 20170430 --end 20170502 --hours 00 --variables swan_HS zeta
+    python ADCIRC_Mirror_Data.py verify mirror
+"""
+
+import functions as func
+import argparse
+import datetime as dt
+
+
+parser = argparse.ArgumentParser(description='Copy ADCIRC model runs into a local mirror folder')
+parser.add_argument('command', choices=['sync', 'verify'])
+parser.add_argument('folder', help='Mirror folder')
+parser.add_argument('--start', help='First day to copy (YYYYMMDD)')
+parser.add_argument('--end', help='Day to stop copying at, not included (YYYYMMDD)')
+parser.add_argument('--hours', nargs='+', default=['00', '06', '12', '18'], help='Hours to copy for every day')
+parser.add_argument('--variables', nargs='+', choices=sorted(func.VARIABLE_FILES),
+                    help='Variables to copy (default: all of them)')
+parser.add_argument('--casts', nargs='+', default=['forecast', 'nowcast'], choices=['forecast', 'nowcast'])
+args = parser.parse_args()
+
+if args.command == 'sync':
+    if not (args.start and args.end):
+        parser.error('--start and --end are needed to sync')
+    start_date = dt.datetime.strptime(args.start, '%Y%m%d')
+    end_date = dt.datetime.strptime(args.end, '%Y%m%d')
+    dates = func.make_cycles(start_date, end_date, args.hours)
+
+    num_files, failed_paths = func.mirror_cycles(dates, args.folder, args.variables, args.casts)
+    print('Copied %d files into %s' % (num_files, args.folder))
+    if failed_paths:
+        raise SystemExit('%d files could not be copied, run sync again' % len(failed_paths))
+
+elif args.command == 'verify':
+    bad_paths = func.verify_mirror(args.folder)
+    for path in bad_paths:
+        print('BAD: %s' % path)
+    if bad_paths:
+        raise SystemExit('%d files in %s are missing or changed, run sync again' % (len(bad_paths), args.folder))
+    print('Every file in %s matches its checksum' % args.folder)
@@ -2,26 +2,56 @@
 Download ADCIRC+SWAN ouput from a selected date range and store the maximum
 values for the desired variables
 
+The status of every model run is kept in a checkpoint file next to the output
+file. If the script stops part way through, run it again with --resume to keep
+the output file and only download the model runs that aren't done yet
+
+Usage:
+    python ADCIRC_Multiday_Data_Download.py
+    python ADCIRC_Multiday_Data_Download.py --resume
+
 Michael Itzkin, 2/21/2018
 """
 
 import functions as func
 #import plots as plot
+import argparse
 import datetime as dt
-import csv 
-
-# Create a .txt file with the dates that didn't work in it.
-bad_dates_file = open('bad_dates.txt', 'w+')
-bad_date_count = 0
 
-date_file = 'adcirc_output_data.csv'
-with open(date_file, 'w', newline='') as adcirc_file:
-    writer=csv.writer(adcirc_file, delimiter=',')
 
-    # Write a header row for the .csv file. The "depth", "Max Hs",
-    # and "Tp" columns are repeated for every well but the header will
-    # only print for the first one
-    writer.writerow(['Date', 'Depth', 'Elevation', 'Max Hs', 'Tp', 'Node Lon', 'Node Lat'])
+# The model runs are downloaded by a pool of processes so everything
+# has to be inside this if-statement (otherwise every process would
+# re-run the whole script)
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Download the maximum ADCIRC values for a range of dates')
+    parser.add_argument('--resume', action='store_true',
+                        help="Add to the output of a run that stopped instead of starting again")
+    args = parser.parse_args()
+
+    # Set the format of the output file: 'csv', 'parquet' (needs the pyarrow
+    # package), or 'netcdf'. Every format has the same columns, one row per
+    # well per model run
+    # CAN BE CHANGED !!
+    output_format = 'csv'
+
+    date_file = 'adcirc_output_data.' + func.OUTPUT_EXTENSIONS[output_format]
+
+    # The sites (wells) to pull out of the model runs. A .csv file with name,
+    # lon, lat, and orientation (EW, NS, or DIAG) columns or a .geojson file of
+    # points, see load_sites() in functions.py. Add a line to the file for a
+    # new site, all the sites are done in the same run
+    # CAN BE CHANGED !!
+    sites_file = 'sites.csv'
+    sites = func.load_sites(sites_file)
+
+    # How the sites are matched to the mesh: 'node' uses the nearest node at
+    # the 20m contour, 'isobath' puts every site on the 20m contour line and
+    # interpolates the values from the nodes around it, and 'barycentric'
+    # interpolates the values at the site itself (the same place on every
+    # grid, see SITE_METHODS in functions.py)
+    # CAN BE CHANGED !!
+    site_method = 'node'
 
     # Load the bounding box. You can change the bounding box by
     # going to this function in "functions.py" and changing the
@@ -33,117 +63,94 @@ with open(date_file, 'w', newline='') as adcirc_file:
     # Format: dt.date(YYYY, mm, dd)
     start_date = dt.date(2017,4,30)     # Default: 2017,4,30
     end_date = dt.date(2018,5,4)        # Default: 2018,5,4
-    
-    for date in func.daterange(start_date, end_date):
-
-        # Convert the date into a string from a datetime object.
-        # Format: yyymmdd
-        date=date.strftime('%Y%m%d')
-
-        # Set a list of the hours to loop through. For every day in the
-        # date range, this program will try to download the data for
-        # every hour in this list. You can try adding new times;
-        # Separate the values with a comma and put them in quotes
-        hours = ['00', '12']
-        for hour in hours:
-
-            # Add the hour to the date string.
-            # New Format: yyyymmddhh
-            date += hour
-
-            # Download the data
-            hs_data, tp_data, z_data, status = func.adcirc_data_download(date)
-            
-            if status == 'good':
-
-                # Print the date and status to the console
-                print('Current Date: %s (Status = %s)' % (date, status))
-        
-                x = hs_data['x']
-                y = hs_data['y']
-
-                # Narrow down the lat/lon
-                start, end = func.find_search_indexes(left_lon, right_lon, x)
-                x, y = func.x_y_refine(x, y, start, end)
-
-                # Download the appropriate Hs,TPS, depth values.
-                # The indexes where the netCDF is using the "nc6b" url
-                # path returns the start and end indexes in reverse order
-                # so swap them here
-                if start > end:
-                    max_Hs = hs_data['swan_HS_max'][end:start]
-                    swan_TPS_max = tp_data['swan_TPS_max'][end:start]
-                    depth = hs_data['depth'][end:start]
-                    elev = z_data['zeta_max'][end:start]
-                    # Put in vew variable here "end:start"
-                elif start <= end:
-                    max_Hs = hs_data['swan_HS_max'][start:end]
-                    swan_TPS_max = tp_data['swan_TPS_max'][start:end]
-                    depth = hs_data['depth'][start:end]
-                    elev = z_data['zeta_max'][start:end]
-                    # Put in new variable here "start:end"
-
-                #find 20m contour nodes, 20m is standard 
-                contour = 20 #this value can be changed 
-                use_depths, use_indexes = func.deep_water_nodes(depth, contour)
-                max_Hs = max_Hs[use_indexes]
-                swan_TPS_max = swan_TPS_max[use_indexes]
-                max_elev = elev[use_indexes]
-                nodes_used=func.finding_well_points(use_indexes, x, y)
-                # Add new variable here-just copy and change variable names
-            
-                line=[]
-                line.append(date)
-                for node in nodes_used:
-                    line.append(depth[node])
-                    line.append(max_elev[node])
-                    line.append(max_Hs[node])
-                    line.append(swan_TPS_max[node])
-                    # Add new variable here as "line.append(___[node])"
-                    line.append(x[node])
-                    line.append(y[node])
-
-                    
-                writer.writerow(line)
-            
-            elif status!='good':
-                # Print the current date and status to the console
-                print('Current Date: %s (Status = %s)' % (date, status))
-
-                bad_dates_file.write('%s fail \r\n'%(date))
-                bad_date_count+=1
-                line=[]
-                line.append(date)
-                for node in nodes_used:
-                    line.append(0)
-                    line.append(0)
-                    line.append(0)
-                    line.append(0)
-                    line.append(0)
-                    line.append(0)
-                    #add new variable as "line.append(0)"
-                    
-                writer.writerow(line)
-
-            # Clear the hour from the date string
-            # Return to: yyyymmdd
-            date=date[:-2]
-
-# At the end of the data collection, write the total amount of bad dates
-# at the end of the .txt file
-bad_dates_file.write('\r\ntotal %d'%(bad_date_count))
-
-# Close the ADCIRC .csv file and the bad dates .txt file and then print
-# "done" to the console
-adcirc_file.close()
-bad_dates_file.close()
-print('done')
-       
-        
-
-
-
-
-
-
 
+    # Set a list of the hours to loop through. For every day in the
+    # date range, this program will try to download the data for
+    # every hour in this list. You can try adding new times;
+    # Separate the values with a comma and put them in quotes
+    hours = ['00', '12']
+
+    # Set how many model runs to download at the same time. Set
+    # this to 1 to download them one at a time
+    # CAN BE CHANGED !!
+    num_workers = 4
+
+    # Write how long every stage of every model run took (and how much
+    # was downloaded) to this file, one line per model run, for example
+    # 'adcirc_metrics.jsonl'. This also prints a progress line while the
+    # model runs download. If this is None the ADCIRC_METRICS_FILE
+    # environment variable is used (no metrics if that isn't set either)
+    # CAN BE CHANGED !!
+    metrics_file = None
+    if metrics_file is not None:
+        func.use_metrics(metrics_file)
+
+    # A run can only be resumed with the same settings
+    dates = func.make_cycles(start_date, end_date, hours)
+    settings = {'dates': dates, 'bounding_box': [bottom_lat, upper_lat, left_lon, right_lon],
+                'sites': func.site_settings(sites), 'site_method': site_method}
+
+    # Open the output file and the checkpoint. The maximum values are stored
+    # in MSL. The header (see OUTPUT_COLUMNS in functions.py) is written by
+    # open_output(). When resuming, the output file is cut back to the end of
+    # the last model run the checkpoint has a good record of
+    checkpoint_file = func.checkpoint_filename(date_file)
+    attributes = func.output_attributes(True, False)
+    if args.resume:
+        checkpoint = func.load_checkpoint(checkpoint_file)
+        if checkpoint is None:
+            raise SystemExit('ERROR: There is no checkpoint (%s) to resume' % checkpoint_file)
+        if checkpoint['settings'] != settings:
+            raise SystemExit('ERROR: The dates, bounding box, sites, or site method are not the same as the run in %s' %
+                             checkpoint_file)
+        offset = func.resume_checkpoint(checkpoint, date_file)
+        adcirc_file = func.open_output(date_file, output_format, attributes, resume_offset=offset)
+    else:
+        adcirc_file = func.open_output(date_file, output_format, attributes)
+        checkpoint = func.new_checkpoint(settings, adcirc_file)
+        func.save_checkpoint(checkpoint_file, checkpoint)
+
+    # Create a .txt file with the dates that didn't work in it. Dates from
+    # before a resume that won't be tried again are written first
+    bad_dates_file = open('bad_dates.txt', 'w+')
+    to_run = func.cycles_to_run(checkpoint, dates)
+    for date, entry in checkpoint['cycles'].items():
+        if entry['status'] != 'done' and date not in to_run:
+            bad_dates_file.write('%s %s \r\n'%(date, entry['status']))
+    print('%d of %d model runs to download' % (len(to_run), len(dates)))
+
+    # Every model run as yyyymmddhh, the nodes at the 20m contour are used
+    cycles = [(date, (bottom_lat, upper_lat, left_lon, right_lon), 20, sites, site_method) for date in to_run]
+
+    # The rows come back in date order as soon as they are ready. Dates
+    # that didn't work get one placeholder row (no site and NaN values, see
+    # make_failed_block() in functions.py) and are written to the bad dates
+    # file. Dates that failed with an error that can go away (not "missing")
+    # are tried again at the end, the dates after the first one of those are
+    # held back until then so the output stays in date order. The checkpoint
+    # is saved after every model run that is written
+    for date, status, block in func.run_cycles(func.extract_max_cycle, cycles, num_workers,
+                                               retry=func.cycle_failed):
+
+        # Print the date and status to the console
+        print('Current Date: %s (Status = %s)' % (date, status))
+
+        if status == 'good':
+            func.write_output_block(adcirc_file, block)
+
+        elif status!='good':
+            bad_dates_file.write('%s %s \r\n'%(date, status))
+            func.write_output_block(adcirc_file, func.make_failed_block(date, 'max'))
+
+        func.record_cycle(checkpoint_file, checkpoint, date, status, adcirc_file)
+
+    # At the end of the data collection, write the total amount of bad dates
+    # at the end of the .txt file
+    bad_date_count = sum(entry['status'] != 'done' for entry in checkpoint['cycles'].values())
+    bad_dates_file.write('\r\ntotal %d'%(bad_date_count))
+
+    # Close the ADCIRC output file and the bad dates .txt file and then print
+    # "done" to the console
+    func.close_output(adcirc_file)
+    bad_dates_file.close()
+    print('done')
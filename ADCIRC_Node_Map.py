@@ -0,0 +1,51 @@
+"""
+Show or rebuild the node map: the equivalent node of every site on every
+grid (nc6b and hsofs), with the distance and the depth difference between
+the grids. The map is built from the meshes in the mesh cache (see
+ADCIRC_Mesh_Cache.py) and the download scripts use it when the grid changes.
+Sites whose depths are more than NODE_MAP_DEPTH_TOLERANCE meters apart on
+two grids are flagged
+
+Usage:
+    python ADCIRC_Node_Map.py show [--sites sites.csv]
+    python ADCIRC_Node_Map.py rebuild [--sites sites.csv]
+"""
+
+import functions as func
+import argparse
+
+
+parser = argparse.ArgumentParser(description='Show or rebuild the node map of the sites')
+parser.add_argument('command', choices=['show', 'rebuild'])
+parser.add_argument('--sites', default=func.SITES_FILE, help='Sites file (see load_sites() in functions.py)')
+parser.add_argument('--cache-dir', default=func.MESH_CACHE_DIR, help='Folder the mesh cache is stored in')
+args = parser.parse_args()
+
+sites = func.load_sites(args.sites)
+if args.command == 'rebuild':
+    node_map = func.build_node_map(sites, args.cache_dir)
+    func.save_node_map(node_map, args.cache_dir)
+else:
+    node_map = func.get_node_map(sites, args.cache_dir)
+
+print('Node map version %d, built %s' % (node_map['version'], node_map['created']))
+for grid, fingerprint in sorted(node_map['grids'].items()):
+    if fingerprint is None:
+        print('  %-6s not in the mesh cache' % grid)
+    else:
+        print('  %-6s %9d nodes  %s' % (grid, fingerprint['num_nodes'], fingerprint['checksum']))
+
+# One line per site per grid, flag the depths that don't match
+print('\r\n%-20s %-6s %9s %11s %10s %8s %9s %10s' %
+      ('site', 'grid', 'node', 'lon', 'lat', 'depth', 'dist (km)', 'depth diff'))
+flagged = 0
+for name, entries in node_map['sites'].items():
+    for grid, entry in sorted(entries.items()):
+        difference = entry['depth_difference']
+        mismatch = difference is not None and abs(difference) > func.NODE_MAP_DEPTH_TOLERANCE
+        flagged += mismatch
+        print('%-20s %-6s %9d %11.5f %10.5f %8.2f %9.3f %10s%s' %
+              (name, grid, entry['node'], entry['lon'], entry['lat'], entry['depth'], entry['distance_km'],
+               '' if difference is None else '%.2f' % difference, '  <-- CHECK' if mismatch else ''))
+
+print('\r\n%d site(s) with depths more than %g m apart' % (flagged, func.NODE_MAP_DEPTH_TOLERANCE))
@@ -0,0 +1,126 @@
+"""
+Check and time the 'barycentric' site method (see barycentric_operator() in
+functions.py) on synthetic meshes of different sizes:
+
+- the element locator finds the same element as checking every element
+  (for random points, some of them outside the mesh)
+- a linear field is interpolated exactly at the sites
+- a smooth field at the sites changes less between meshes than with the
+  nearest node (what the 'node' methods and the known nodes do)
+
+and time building the locator and the weights (only done once per grid)
+and interpolating a forecast (102 time steps) with them
+
+Run from the repository folder: python benchmarks/barycentric_benchmark.py [--sites 200]
+"""
+
+import argparse
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import functions as func
+import synthetic_adcirc as syn
+from isobath_benchmark import cached_mesh
+from node_find_benchmark import make_sites, time_call
+
+
+def smooth_field(x, y):
+    """
+    A field that changes over a few tenths of a degree, like the wave heights near the coast
+    """
+    return np.sin(8 * x) * np.cos(6 * y) + 0.5 * x
+
+
+def brute_force(x, y, element, lons, lats, tolerance=1e-9):
+    """
+    Find the element every point is in by checking every element
+    """
+    found = np.full(len(lons), -1)
+    for i, (lon, lat) in enumerate(zip(lons, lats)):
+        weights = func.barycentric_weights(lon, lat, x[element], y[element])
+        inside = np.flatnonzero((weights >= -tolerance).all(axis=1))
+        if len(inside):
+            found[i] = inside[0]
+    return found
+
+
+def same_elements(x, y, element, lons, lats, found, expected):
+    """
+    Points on an edge are in both elements, so the element found only has to
+    hold the point (and be found for the same points as checking every element)
+    """
+    if not np.array_equal(found < 0, expected < 0):
+        return False
+    inside = found >= 0
+    corners = element[found[inside]]
+    weights = func.barycentric_weights(lons[inside], lats[inside], x[corners], y[corners])
+    return bool((weights >= -1e-9).all())
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Check and time barycentric interpolation at the sites')
+    parser.add_argument('--sites', type=int, default=200, help='number of random sites')
+    args = parser.parse_args()
+
+    sites = make_sites(args.sites)
+    truth = smooth_field(sites['lon'], sites['lat'])
+    cache_dir = tempfile.mkdtemp(prefix='adcirc_barycentric_')
+    results = {}
+
+    try:
+        for num_nodes in [1813443, 600000, 200000]:
+            mesh = cached_mesh(num_nodes, cache_dir)
+            element = np.load(os.path.join(cache_dir, 'hsofs', 'element_%s.npy' % mesh['fingerprint']['checksum']))
+            func.loaded_elements.clear()
+            func.loaded_operators.clear()
+            func.loaded_locators.clear()
+
+            # Random points over the default bounding box and past the edge of the mesh
+            rng = np.random.default_rng(1)
+            lons = np.concatenate([sites['lon'][:50], rng.uniform(syn.MESH_LON[1] - 0.5, syn.MESH_LON[1] + 0.5, 10)])
+            lats = np.concatenate([sites['lat'][:50], rng.uniform(*syn.MESH_LAT, size=10)])
+            locator_time, locator = time_call(func.build_element_locator, mesh['x'], mesh['y'], element, repeats=1)
+            found, weights = func.locate_points(locator, mesh['x'], mesh['y'], element, lons, lats)
+            expected = brute_force(mesh['x'], mesh['y'], element, lons, lats)
+
+            func.loaded_locators.clear()
+            first_time, operator = time_call(func.barycentric_operator, None, mesh, sites, cache_dir, repeats=1)
+            cached_time, operator = time_call(func.barycentric_operator, None, mesh, sites, cache_dir)
+            plan = func.operator_plan(operator, mesh, sites)
+            values = np.random.default_rng(0).uniform(0, 3, (syn.FORECAST_TIMES, len(plan['nodes'])))
+            apply_time, interpolated = time_call(func.apply_operator, plan['operator'], values)
+
+            # A linear field is interpolated exactly at the sites
+            linear = 2 * mesh['x'] + 3 * mesh['y']
+            at_sites = func.apply_operator(plan['operator'], linear[plan['nodes']][None])[0]
+            linear_error = np.abs(at_sites - (2 * sites['lon'] + 3 * sites['lat'])).max()
+
+            field = smooth_field(mesh['x'], mesh['y'])
+            nearest, dists = func.nearest_nodes(func.build_node_tree(mesh['x'], mesh['y']), sites['lon'], sites['lat'])
+            results[len(mesh['x'])] = {
+                'barycentric': func.apply_operator(plan['operator'], field[plan['nodes']][None])[0],
+                'nearest node': field[nearest],
+            }
+
+            print('%7d nodes | locator: %6.3f s | weights: %7.3f s | after that: %8.5f s | forecast at %d sites: '
+                  '%8.6f s | same elements as checking all: %s | linear field error: %.1e' %
+                  (len(mesh['x']), locator_time, first_time, cached_time, args.sites, apply_time,
+                   same_elements(mesh['x'], mesh['y'], element, lons, lats, found, expected), linear_error))
+
+        # How far the values at the sites are from the field, and how much they change between meshes
+        finest = max(results)
+        print('')
+        for method in ['nearest node', 'barycentric']:
+            for num_nodes in sorted(results, reverse=True):
+                error = np.abs(results[num_nodes][method] - truth)
+                change = np.abs(results[num_nodes][method] - results[finest][method])
+                print('%-12s %7d nodes | error: mean %.5f max %.5f | change from the %d node mesh: mean %.5f max %.5f' %
+                      (method, num_nodes, error.mean(), error.max(), finest, change.mean(), change.max()))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
@@ -0,0 +1,51 @@
+"""
+Benchmark the depth contour search in deep_water_nodes() against the old
+loop (deep_water_nodes_OLD in old_versions.py) on synthetic meshes, with the
+cases from contour_cases.py. tests/test_contour.py checks that both find the
+same nodes, run that after changing the search.
+
+Also times contour_nodes(), which only searches the first time it is called
+for a mesh, bounding box, contour, and pads
+
+Run from the repository folder: python benchmarks/contour_benchmark.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import functions as func
+import synthetic_adcirc as syn
+from contour_cases import contour_cases, loop_nodes, same_nodes
+from node_find_benchmark import time_call
+
+
+if __name__ == '__main__':
+
+    bounding_box = func.load_bounding_box()
+
+    for num_nodes in [200000, 600000, 1813443]:
+        mesh = syn.make_mesh(num_nodes)
+        mesh['fingerprint'] = func.mesh_fingerprint('hsofs', mesh['x'], mesh['y'])
+        nodes = np.flatnonzero(func.box_mask(mesh['x'], mesh['y'], bounding_box))
+        box = {'nodes': nodes, 'bounding_box': tuple(bounding_box)}
+        box_depth = mesh['depth'][nodes]
+
+        cases = contour_cases(mesh, nodes)
+        print('%d nodes in the mesh, %d in the bounding box' % (len(mesh['x']), len(nodes)))
+        for name, depths, contour in cases:
+            loop_time, loop_result = time_call(loop_nodes, depths, contour, repeats=1)
+            array_time, array_result = time_call(func.deep_water_nodes, depths, contour)
+            print('    %-15s | %7d nodes found | loop: %8.4f s | array: %8.6f s | speedup: %5.0fx | same nodes: %s' %
+                  (name, len(array_result[1]), loop_time, array_time, loop_time / array_time,
+                   same_nodes(loop_result, array_result)))
+
+        # The first call searches, every call after that is a dictionary lookup
+        func.loaded_contours.clear()
+        first_time, first_result = time_call(func.contour_nodes, mesh, box, 20, repeats=1)
+        cached_time, cached_result = time_call(func.contour_nodes, mesh, box, 20, repeats=100)
+        print('    contour_nodes   | first call: %8.6f s | after that: %10.8f s | same nodes: %s\r\n' %
+              (first_time, cached_time, np.array_equal(first_result[1], cached_result[1]) and
+               np.array_equal(first_result[1], func.deep_water_nodes(box_depth, 20)[1])))
@@ -0,0 +1,61 @@
+"""
+The cases the depth contour search in deep_water_nodes() is checked
+(tests/test_contour.py) and timed (contour_benchmark.py) with: the 20m
+contour, a contour with no nodes within 0.5m (the +-3m fallback), depths
+with missing values and the first node on the contour, and a few small edge
+cases.
+
+The old loop (deep_water_nodes_OLD() in old_versions.py) never looks at the
+first node, so loop_nodes() gives it the depths with one extra node in
+front and moves its indexes back by one
+"""
+
+import numpy as np
+
+from old_versions import deep_water_nodes_OLD
+
+
+def loop_nodes(depths, contour):
+    """
+    Run the old loop on the depths with an extra (missing) node in front so
+    it looks at every node, and return its depths and indexes as arrays
+    """
+    depths = np.ma.concatenate([np.ma.masked_array([0.0], mask=[True]), np.ma.asarray(depths, dtype=float)])
+    use_depths, use_indexes = deep_water_nodes_OLD(depths, contour)
+    return np.array(use_depths, dtype=float), np.array(use_indexes, dtype=int) - 1
+
+
+def same_nodes(loop_result, array_result):
+    return all(np.array_equal(loop, array) for loop, array in zip(loop_result, array_result))
+
+
+def contour_cases(mesh, nodes):
+    """
+    Return the (name, depths, contour) cases for a mesh and the nodes in its bounding box
+    """
+
+    box_depth = mesh['depth'][nodes]
+
+    # Missing depths (like the fill values in the files) and a first
+    # node right on the contour, which the old loop missed
+    masked = np.ma.masked_array(box_depth.copy(), mask=np.arange(len(box_depth)) % 7 == 3)
+    masked[0] = 20
+
+    return [
+        ('20m contour', box_depth, 20),
+        ('+-3m fallback', box_depth, float(np.max(box_depth)) + 2),
+        ('missing depths', masked, 20),
+        ('whole mesh', mesh['depth'], 20),
+    ]
+
+
+# Small cases: no nodes, every depth missing, nothing within 3m, and nodes
+# right on the edges of the +-0.5m and +-3m ranges (which aren't included)
+EDGE_CASES = [
+    ('no nodes', np.array([]), 20),
+    ('all missing', np.ma.masked_array([20.0, 20.1, 19.9], mask=[True, True, True]), 20),
+    ('nothing near', np.array([1.0, 2.0, 50.0]), 20),
+    ('range edges', np.array([19.5, 20.5, 17.0, 23.0, 19.6, 22.9]), 20),
+    ('fallback only', np.array([17.5, 40.0, 22.5]), 20),
+]
+
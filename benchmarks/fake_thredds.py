@@ -0,0 +1,513 @@
+"""
+A local stand-in for the RENCI THREDDS server to load test the download code
+against. It serves catalog.html and catalog.xml pages, OPeNDAP (DAP2) .dds,
+.das, and .dods responses, and fileServer downloads from a folder laid out like
+the server (see synthetic_adcirc.py or ADCIRC_Mirror_Data.py).
+
+The server works as an HTTP proxy so the urls in functions.py don't have to
+change: set the http_proxy environment variable to the server's address and
+every request for tds.renci.org or opendap.renci.org (from requests and from
+netCDF4) goes to this server instead. The network can be made slower and less
+reliable with a profile (see PROFILES) or the options below:
+
+    --latency      seconds to wait before answering every request
+    --bandwidth    bytes per second to send on every connection
+    --max-connections  connections allowed at once, more are answered with a 503
+    --error-rate   fraction of requests answered with a 500/502/503
+    --timeout-rate fraction of requests that hang for --hang seconds and are then dropped
+
+The server counts what it did, GET /stats returns the counts as JSON.
+
+Run from the repository folder:
+    python benchmarks/fake_thredds.py FOLDER [--port 8081] [--profile wan]
+"""
+
+import argparse
+import email.utils
+import hashlib
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+import netCDF4 as nc
+import numpy as np
+
+
+# The url roots of the server, everything after them is a path in the folder
+CATALOG_PATH = '/thredds/catalog/daily/nam/'
+DODS_PATH = '/thredds/dodsC/daily/nam/'
+FILESERVER_PATH = '/thredds/fileServer/daily/nam/'
+
+# Network profiles. bandwidth is bytes per second per connection, None
+# means no limit. hang is how long a request that "times out" hangs for
+PROFILES = {
+    'local': {'latency': 0.0, 'bandwidth': None, 'max_connections': None,
+              'error_rate': 0.0, 'timeout_rate': 0.0, 'hang': 0.0},
+    'lan': {'latency': 0.002, 'bandwidth': 100e6, 'max_connections': None,
+            'error_rate': 0.0, 'timeout_rate': 0.0, 'hang': 0.0},
+    'wan': {'latency': 0.05, 'bandwidth': 10e6, 'max_connections': 16,
+            'error_rate': 0.0, 'timeout_rate': 0.0, 'hang': 0.0},
+    'slow': {'latency': 0.2, 'bandwidth': 2e6, 'max_connections': 8,
+             'error_rate': 0.0, 'timeout_rate': 0.0, 'hang': 0.0},
+    'flaky': {'latency': 0.05, 'bandwidth': 10e6, 'max_connections': 16,
+              'error_rate': 0.05, 'timeout_rate': 0.01, 'hang': 30.0},
+}
+
+# DAP2 names and XDR encodings for the netCDF types. XDR sends 8 and 16 bit
+# integers as 32 bit integers (Byte arrays are sent as bytes, padded to 4)
+DAP_TYPES = {
+    'f8': ('Float64', '>f8'),
+    'f4': ('Float32', '>f4'),
+    'i4': ('Int32', '>i4'),
+    'u4': ('UInt32', '>u4'),
+    'i2': ('Int16', '>i4'),
+    'u2': ('UInt16', '>u4'),
+    'i1': ('Byte', 'u1'),
+    'u1': ('Byte', 'u1'),
+}
+
+SEND_BLOCK = 64 * 1024
+
+# netCDF isn't thread safe, only one thread reads a file at a time
+netcdf_lock = threading.Lock()
+
+
+class FakeThreddsServer(http.server.ThreadingHTTPServer):
+    """
+    The server. Holds the folder being served, the network settings, and the counts
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, folder, settings, seed=None):
+        http.server.ThreadingHTTPServer.__init__(self, address, FakeThreddsHandler)
+        self.folder = os.path.abspath(folder)
+        self.settings = dict(PROFILES['local'], **settings)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.datasets = {}
+        self.stats = {'requests': 0, 'catalog': 0, 'dds': 0, 'das': 0, 'dods': 0, 'file': 0,
+                      'not_found': 0, 'bytes_sent': 0, 'rejected': 0, 'errors': 0, 'timeouts': 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def roll(self, rate):
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def open_dataset(self, fname):
+        """
+        Return the (already open) netCDF file. Values are read without masking
+        so the fill values are sent the same way THREDDS sends them
+        """
+        with netcdf_lock:
+            if fname not in self.datasets:
+                data = nc.Dataset(fname)
+                data.set_auto_maskandscale(False)
+                self.datasets[fname] = data
+            return self.datasets[fname]
+
+
+class FakeThreddsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers one connection. Connections are kept open between requests
+    """
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeTHREDDS/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        # Count the connection and refuse it if there are too many
+        server = self.server
+        with server.lock:
+            server.connections += 1
+            limit = server.settings['max_connections']
+            self.rejected = limit is not None and server.connections > limit
+        try:
+            http.server.BaseHTTPRequestHandler.handle(self)
+        finally:
+            with server.lock:
+                server.connections -= 1
+
+    def do_GET(self):
+        server = self.server
+        settings = server.settings
+        server.count('requests')
+
+        # Proxy requests have the whole url in them
+        parts = urlsplit(self.path)
+        path, query = unquote(parts.path), unquote(parts.query)
+
+        if path == '/stats':
+            with server.lock:
+                stats = dict(server.stats)
+            return self.send_body(200, json.dumps(stats).encode(), 'application/json', throttle=False)
+
+        if self.rejected:
+            server.count('rejected')
+            self.close_connection = True
+            return self.send_body(503, dap_error(503, 'Too many connections'), 'text/plain', throttle=False)
+
+        # Hang then drop the connection without answering
+        if server.roll(settings['timeout_rate']):
+            server.count('timeouts')
+            time.sleep(settings['hang'])
+            self.close_connection = True
+            return
+
+        time.sleep(settings['latency'])
+
+        if server.roll(settings['error_rate']):
+            server.count('errors')
+            status = server.random.choice([500, 502, 503])
+            return self.send_body(status, dap_error(status, 'Injected error'), 'text/plain')
+
+        try:
+            if path.startswith(CATALOG_PATH):
+                self.send_catalog(path[len(CATALOG_PATH):])
+            elif path.startswith(DODS_PATH):
+                self.send_dap(path[len(DODS_PATH):], query)
+            elif path.startswith(FILESERVER_PATH):
+                self.send_file(path[len(FILESERVER_PATH):])
+            else:
+                self.send_not_found()
+        except (IOError, KeyError, ValueError, IndexError) as error:
+            if isinstance(error, (BrokenPipeError, ConnectionResetError)):
+                raise
+            self.send_body(500, dap_error(500, str(error)), 'text/plain')
+
+    def local_path(self, path):
+        """
+        Return the file in the folder for a path after one of the url roots,
+        or None if the path leaves the folder
+        """
+        local = os.path.normpath(os.path.join(self.server.folder, *[part for part in path.split('/') if part]))
+        if local != self.server.folder and not local.startswith(self.server.folder + os.sep):
+            return None
+        return local
+
+    def send_body(self, status, body, content_type, headers=None, throttle=True):
+        """
+        Send a response, no faster than the bandwidth setting allows
+        """
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.send_stream([body], throttle)
+
+    def send_stream(self, blocks, throttle=True):
+        """
+        Write blocks of bytes to the connection, sleeping between them to keep
+        to the bandwidth setting
+        """
+        bandwidth = self.server.settings['bandwidth'] if throttle else None
+        start = time.perf_counter()
+        sent = 0
+        for block in blocks:
+            for i in range(0, len(block), SEND_BLOCK):
+                piece = block[i:i + SEND_BLOCK]
+                self.wfile.write(piece)
+                sent += len(piece)
+                if bandwidth:
+                    wait = sent / bandwidth - (time.perf_counter() - start)
+                    if wait > 0:
+                        time.sleep(wait)
+        self.server.count('bytes_sent', sent)
+
+    def send_not_found(self):
+        self.server.count('not_found')
+        self.send_body(404, dap_error(404, 'File not found: %s' % self.path), 'text/plain')
+
+    def send_catalog(self, path):
+        """
+        Send a catalog.html or catalog.xml page for a folder
+        """
+
+        folder, page = path.rsplit('/', 1) if '/' in path else ('', path)
+        local = self.local_path(folder)
+        if page not in ['catalog.html', 'catalog.xml'] or local is None or not os.path.isdir(local):
+            return self.send_not_found()
+        self.server.count('catalog')
+
+        names = sorted(os.listdir(local))
+        folders = [name for name in names if os.path.isdir(os.path.join(local, name))]
+        files = [name for name in names if os.path.isfile(os.path.join(local, name))]
+        url_path = 'daily/nam/' + (folder + '/' if folder else '')
+
+        # The page only changes when the folder does
+        modified = os.path.getmtime(local)
+        etag = '"%s"' % hashlib.sha1(('%s %r' % (modified, names)).encode()).hexdigest()
+        headers = {'ETag': etag, 'Last-Modified': email.utils.formatdate(modified, usegmt=True)}
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if page == 'catalog.html':
+            body = catalog_html(url_path, folders, files)
+            self.send_body(200, body.encode(), 'text/html; charset=UTF-8', headers)
+        else:
+            sizes = [os.path.getsize(os.path.join(local, name)) for name in files]
+            times = [os.path.getmtime(os.path.join(local, name)) for name in files]
+            body = catalog_xml(url_path, folders, files, sizes, times)
+            self.send_body(200, body.encode(), 'application/xml', headers)
+
+    def send_dap(self, path, query):
+        """
+        Send the .dds, .das, or .dods response for a netCDF file
+        """
+
+        match = re.match(r'^(.*)\.(dds|das|dods)$', path)
+        local = self.local_path(match.group(1)) if match else None
+        if local is None or not os.path.isfile(local):
+            return self.send_not_found()
+        suffix = match.group(2)
+        self.server.count(suffix)
+
+        # Make the whole response before sending anything so errors can still
+        # be sent (netCDF isn't thread safe so this is done under the lock)
+        data = self.server.open_dataset(local)
+        name = os.path.basename(local)
+        headers = {'Content-Description': 'dods-' + suffix, 'XDODS-Server': 'opendap/3.7'}
+        with netcdf_lock:
+            if suffix == 'das':
+                blocks = [make_das(data).encode()]
+            else:
+                projections = parse_constraint(data, query)
+                blocks = [make_dds(data, name, projections).encode()]
+            if suffix == 'dods':
+                headers['Content-Description'] = 'dods-data'
+                blocks[0] += b'\nData:\n'
+                blocks += [xdr_encode(data[var_name], data[var_name][index] if index else data[var_name][...])
+                           for var_name, index in projections]
+
+        if suffix != 'dods':
+            return self.send_body(200, blocks[0], 'text/plain', headers)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(sum(len(block) for block in blocks)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.send_stream(blocks)
+
+    def send_file(self, path):
+        """
+        Send a whole file, the way the fileServer does
+        """
+
+        local = self.local_path(path)
+        if local is None or not os.path.isfile(local):
+            return self.send_not_found()
+        self.server.count('file')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-netcdf')
+        self.send_header('Content-Length', str(os.path.getsize(local)))
+        self.end_headers()
+        with open(local, 'rb') as local_file:
+            self.send_stream(iter(lambda: local_file.read(SEND_BLOCK), b''))
+
+
+def dap_error(code, message):
+    """
+    Make a DAP2 error response
+    """
+    return ('Error {\n    code = %d;\n    message = "%s";\n};\n' % (code, message.replace('"', "'"))).encode()
+
+
+def catalog_html(url_path, folders, files):
+    """
+    Make a catalog.html page like the ones THREDDS makes
+    """
+    rows = ["<tr><td><a href='%s/catalog.html'><tt>%s/</tt></a></td></tr>" % (name, name) for name in folders]
+    rows += ["<tr><td><a href='catalog.html?dataset=%s%s'><tt>%s</tt></a></td></tr>" % (url_path, name, name)
+             for name in files]
+    return ('<!DOCTYPE html>\n<html><head><title>Catalog %s</title></head><body>\n'
+            '<h1>Catalog %s</h1>\n<table>\n%s\n</table>\n</body></html>\n' %
+            (url_path, url_path, '\n'.join(rows)))
+
+
+def catalog_xml(url_path, folders, files, sizes, times):
+    """
+    Make a catalog.xml document like the ones THREDDS makes
+    """
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<catalog xmlns="http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink" version="1.0.1">',
+        '  <service name="dap" serviceType="OpenDAP" base="/thredds/dodsC/" />',
+        '  <dataset name="%s" ID="%s">' % (url_path, url_path),
+    ]
+    for name in folders:
+        lines.append('    <catalogRef xlink:href="%s/catalog.xml" xlink:title="%s" ID="%s%s" name="" />' %
+                     (name, name, url_path, name))
+    for name, size, modified in zip(files, sizes, times):
+        lines += [
+            '    <dataset name="%s" ID="%s%s" urlPath="%s%s">' % (name, url_path, name, url_path, name),
+            '      <dataSize units="bytes">%d</dataSize>' % size,
+            '      <date type="modified">%s</date>' % time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(modified)),
+            '    </dataset>',
+        ]
+    lines += ['  </dataset>', '</catalog>', '']
+    return '\n'.join(lines)
+
+
+def parse_constraint(data, query):
+    """
+    Turn a DAP2 constraint (i.e; "x,swan_HS[0:1:11][100:1:200]") into a list of
+    (variable name, index) pairs. index is a tuple of slices, or None for the
+    whole variable. An empty constraint is every variable
+    """
+
+    projection = query.split('&')[0]
+    if not projection:
+        return [(name, None) for name in data.variables]
+
+    projections = []
+    for part in projection.split(','):
+        match = re.match(r'^([^\[]+)((\[[^\]]*\])*)$', part.strip())
+        if match is None or match.group(1) not in data.variables:
+            raise KeyError('Unknown variable in constraint: %s' % part)
+        name = match.group(1)
+        index = []
+        for hyperslab in re.findall(r'\[([^\]]*)\]', match.group(2)):
+            numbers = [int(number) for number in hyperslab.split(':')]
+            if len(numbers) == 1:
+                start, stride, stop = numbers[0], 1, numbers[0]
+            elif len(numbers) == 2:
+                start, stride, stop = numbers[0], 1, numbers[1]
+            else:
+                start, stride, stop = numbers
+            index.append(slice(start, stop + 1, stride))
+        if index and len(index) != data[name].ndim:
+            raise ValueError('Wrong number of dimensions in constraint: %s' % part)
+        projections.append((name, tuple(index) or None))
+
+    return projections
+
+
+def make_dds(data, name, projections=None):
+    """
+    Make the DDS (the description of the variables) for the projected variables,
+    with the sizes of the dimensions after the constraint
+    """
+
+    lines = ['Dataset {']
+    for var_name, index in projections or [(var_name, None) for var_name in data.variables]:
+        var = data[var_name]
+        dap_type = DAP_TYPES[var.dtype.str[1:]][0]
+        dims = []
+        for i, (dim, length) in enumerate(zip(var.dimensions, var.shape)):
+            if index:
+                length = len(range(*index[i].indices(length)))
+            dims.append('[%s = %d]' % (dim, length))
+        lines.append('    %s %s%s;' % (dap_type, var_name, ''.join(dims)))
+    lines.append('} %s;' % name)
+    return '\n'.join(lines) + '\n'
+
+
+def das_value(value):
+    """
+    Return the DAP2 type and the text for an attribute value
+    """
+    if isinstance(value, str):
+        return 'String', '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+    values = np.atleast_1d(value)
+    dap_type = DAP_TYPES.get(values.dtype.str[1:], ('Float64',))[0]
+    if dap_type.startswith('Float'):
+        return dap_type, ', '.join(repr(float(item)) for item in values)
+    return dap_type, ', '.join(str(int(item)) for item in values)
+
+
+def make_das(data):
+    """
+    Make the DAS (the attributes of the variables and the file)
+    """
+
+    lines = ['Attributes {']
+    groups = [(var_name, data[var_name]) for var_name in data.variables] + [('NC_GLOBAL', data)]
+    for group_name, group in groups:
+        lines.append('    %s {' % group_name)
+        for attr in group.ncattrs():
+            dap_type, text = das_value(group.getncattr(attr))
+            lines.append('        %s %s %s;' % (dap_type, attr, text))
+        lines.append('    }')
+    unlimited = [dim for dim in data.dimensions if data.dimensions[dim].isunlimited()]
+    if unlimited:
+        lines += ['    DODS_EXTRA {', '        String Unlimited_Dimension "%s";' % unlimited[0], '    }']
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def xdr_encode(var, value):
+    """
+    Encode the values of a variable the way DAP2 sends them: arrays start with
+    their length (twice) and every value is big-endian
+    """
+
+    value = np.asarray(value)
+    encoding = DAP_TYPES[var.dtype.str[1:]][1]
+    body = np.ascontiguousarray(value, dtype=encoding).tobytes()
+    if value.ndim == 0:
+        return body
+    if encoding == 'u1':
+        body += b'\0' * (-len(body) % 4)
+    return np.array([value.size, value.size], dtype='>u4').tobytes() + body
+
+
+def make_server(folder, port=0, settings=None, seed=None):
+    """
+    Make (but don't start) a server for folder on port (0 picks a free port)
+    """
+    return FakeThreddsServer(('127.0.0.1', port), folder, settings or {}, seed)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Serve a folder like the RENCI THREDDS server')
+    parser.add_argument('folder', help='folder laid out like the server (i.e; a mirror)')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='local')
+    parser.add_argument('--latency', type=float, help='seconds before every answer')
+    parser.add_argument('--bandwidth', type=float, help='bytes per second per connection')
+    parser.add_argument('--max-connections', type=int, help='connections allowed at once')
+    parser.add_argument('--error-rate', type=float, help='fraction of requests answered with a 5xx')
+    parser.add_argument('--timeout-rate', type=float, help='fraction of requests that hang and are dropped')
+    parser.add_argument('--hang', type=float, help='seconds a timed out request hangs for')
+    parser.add_argument('--seed', type=int, help='seed for the injected errors')
+    args = parser.parse_args()
+
+    # Start from the profile and change anything given on the command line
+    settings = dict(PROFILES[args.profile])
+    for name in settings:
+        if getattr(args, name) is not None:
+            settings[name] = getattr(args, name)
+
+    server = make_server(args.folder, args.port, settings, args.seed)
+    print('Serving %s on http://127.0.0.1:%d (%s)' % (args.folder, server.server_address[1], settings))
+    print('Set http_proxy=http://127.0.0.1:%d to send the scripts here' % server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
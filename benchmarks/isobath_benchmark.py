@@ -0,0 +1,113 @@
+"""
+Compare putting the sites on the 20m contour line (the 'isobath' site method,
+see isobath_operator() in functions.py) with matching them to the nearest
+node at the contour (the 'node' method) on synthetic meshes of different
+sizes. For every mesh this prints how far the depth at the sites is from
+20m and how far the sites move from where they are on the biggest mesh,
+and checks that the interpolation gets a linear field exactly right.
+
+Also times working out the contour and the interpolation weights (only done
+once per grid) and interpolating a forecast (102 time steps) with them
+
+Run from the repository folder: python benchmarks/isobath_benchmark.py [--sites 200]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import functions as func
+import synthetic_adcirc as syn
+from node_find_benchmark import make_sites, time_call
+
+
+def cached_mesh(num_nodes, cache_dir):
+    """
+    Make a synthetic mesh and put its elements in the mesh cache folder
+    (so get_elements() doesn't need a dataset). Returns the mesh the way
+    get_mesh() does
+    """
+    mesh = syn.make_mesh(num_nodes)
+    mesh['fingerprint'] = func.mesh_fingerprint('hsofs', mesh['x'], mesh['y'])
+    fname = os.path.join(cache_dir, 'hsofs', 'element_%s.npy' % mesh['fingerprint']['checksum'])
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    np.save(fname, mesh.pop('element') - 1)
+    return mesh
+
+
+def isobath_plan(mesh, bounding_box, sites, cache_dir):
+    """
+    The parts of the plan for the 'isobath' method (see make_extraction_plan())
+    """
+    return func.operator_plan(func.isobath_operator(None, mesh, bounding_box, 20, sites, cache_dir), mesh, sites)
+
+
+def node_method(mesh, bounding_box, sites):
+    """
+    The nodes the 'node' method picks for the sites (see make_max_block())
+    """
+    nodes = np.flatnonzero(func.box_mask(mesh['x'], mesh['y'], bounding_box))
+    use_depths, use_indexes = func.deep_water_nodes(mesh['depth'][nodes], 20)
+    return nodes[func.finding_well_points(use_indexes, mesh['x'][nodes], mesh['y'][nodes], sites)]
+
+
+def km_apart(lon0, lat0, lon1, lat1):
+    return func.EARTH_RADIUS_KM * np.radians(np.hypot((lon1 - lon0) * np.cos(np.radians(lat0)), lat1 - lat0))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare the isobath and node site methods')
+    parser.add_argument('--sites', type=int, default=200, help='number of random sites')
+    args = parser.parse_args()
+
+    bounding_box = func.load_bounding_box()
+    sites = make_sites(args.sites)
+    cache_dir = tempfile.mkdtemp(prefix='adcirc_isobath_')
+    results = {}
+
+    try:
+        for num_nodes in [1813443, 600000, 200000]:
+            mesh = cached_mesh(num_nodes, cache_dir)
+            func.loaded_elements.clear()
+            func.loaded_isobaths.clear()
+            func.loaded_operators.clear()
+
+            first_time, plan = time_call(isobath_plan, mesh, bounding_box, sites, cache_dir, repeats=1)
+            cached_time, plan = time_call(isobath_plan, mesh, bounding_box, sites, cache_dir)
+            values = np.random.default_rng(0).uniform(0, 3, (syn.FORECAST_TIMES, len(plan['nodes'])))
+            apply_time, interpolated = time_call(func.apply_operator, plan['operator'], values)
+
+            # A linear field is interpolated exactly along the element edges
+            linear = 2 * mesh['x'] + 3 * mesh['y']
+            at_sites = func.apply_operator(plan['operator'], linear[plan['nodes']][None])[0]
+            linear_error = np.abs(at_sites - (2 * plan['x'] + 3 * plan['y'])).max()
+
+            nodes = node_method(mesh, bounding_box, sites)
+            results[len(mesh['x'])] = {
+                'isobath': (plan['x'], plan['y'], plan['depth']),
+                'node': (mesh['x'][nodes], mesh['y'][nodes], mesh['depth'][nodes]),
+            }
+
+            print('%7d nodes | contour + weights: %7.3f s | after that: %8.5f s | forecast at %d sites: %8.6f s '
+                  '| linear field error: %.1e' % (len(mesh['x']), first_time, cached_time, args.sites,
+                                                   apply_time, linear_error))
+
+        # How far the sites are from 20m deep, and how far they move when the mesh changes
+        finest = max(results)
+        print('')
+        for method in ['node', 'isobath']:
+            for num_nodes in sorted(results, reverse=True):
+                x, y, depth = results[num_nodes][method]
+                x0, y0, depth0 = results[finest][method]
+                moved = km_apart(x0, y0, x, y)
+                print('%-7s %7d nodes | depth - 20m: mean %6.3f max %6.3f m | moved from the %d node mesh: '
+                      'mean %6.3f max %6.3f km' % (method, num_nodes, np.abs(depth - 20).mean(), np.abs(depth - 20).max(),
+                                                   finest, moved.mean(), moved.max()))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
@@ -0,0 +1,90 @@
+"""
+Benchmark the KD-tree node search in hsofs_node_find() against the old
+haversine loop (hsofs_node_find_OLD in old_versions.py) on a synthetic
+mesh, and time finding_well_points() for more and more sites (every site
+is matched in the same search, so the time should barely go up)
+
+Run from the repository folder: python benchmarks/node_find_benchmark.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import functions as func
+from old_versions import hsofs_node_find_OLD
+
+
+def make_mesh(num_nodes, seed=0):
+    """
+    Scatter num_nodes random nodes over the default bounding box
+    """
+    bottom_lat, upper_lat, left_lon, right_lon = func.load_bounding_box()
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(left_lon, right_lon, num_nodes)
+    y = rng.uniform(bottom_lat, upper_lat, num_nodes)
+    return x, y
+
+
+def time_call(function, *args, repeats=3):
+    """
+    Return the best wall time (seconds) of repeats calls and the last result
+    """
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def make_sites(num_sites, seed=0):
+    """
+    Make num_sites random sites (see load_sites()) over the default bounding
+    box, with the orientations taking turns
+    """
+    bottom_lat, upper_lat, left_lon, right_lon = func.load_bounding_box()
+    rng = np.random.default_rng(seed)
+    return {
+        'name': ['site %d' % i for i in range(num_sites)],
+        'lon': rng.uniform(left_lon, right_lon, num_sites),
+        'lat': rng.uniform(bottom_lat, upper_lat, num_sites),
+        'orientation': [func.SITE_ORIENTATIONS[i % 3] for i in range(num_sites)],
+        'nc6b_lon': np.full(num_sites, np.nan),
+        'nc6b_lat': np.full(num_sites, np.nan),
+    }
+
+
+if __name__ == '__main__':
+
+    # The old loop is very slow, keep the mesh sizes reasonable
+    for num_nodes in [10000, 50000, 200000]:
+        x, y = make_mesh(num_nodes)
+
+        loop_time, loop_nodes = time_call(hsofs_node_find_OLD, x, y, repeats=1)
+        tree_time, tree_nodes = time_call(func.hsofs_node_find, x, y)
+
+        # Build the tree once and only time the query, this is
+        # what the download scripts do for every time step
+        tree = func.build_node_tree(x, y)
+        query_time, query_nodes = time_call(func.hsofs_node_find, x, y, tree)
+
+        print('%8d nodes | loop: %8.3f s | tree (build + query): %8.4f s | '
+              'query only: %8.6f s | speedup: %6.0fx | same nodes: %s' %
+              (num_nodes, loop_time, tree_time, query_time, loop_time / tree_time,
+               loop_nodes == tree_nodes == query_nodes))
+
+    # Sites at the nodes of the 20m contour of a mesh with 200000 nodes
+    x, y = make_mesh(200000)
+    use_indexes = np.arange(0, len(x), 40)
+    print('')
+    for num_sites in [2, 20, 200]:
+        sites = make_sites(num_sites)
+        sites_time, site_nodes = time_call(func.finding_well_points, use_indexes, x, y, sites)
+        print('%8d sites | finding_well_points: %8.4f s | unique nodes: %d' %
+              (num_sites, sites_time, len(set(site_nodes))))
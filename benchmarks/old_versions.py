@@ -0,0 +1,101 @@
+"""
+The old loop versions of functions in functions.py, kept to check and
+benchmark the array versions against. They are not used by the download
+scripts. The old depth contour search is deep_water_nodes_OLD() and the
+old haversine node search is hsofs_node_find_OLD()
+"""
+
+import haversine
+
+
+def deep_water_nodes_OLD(depths, contour):
+    """
+    Loop version of deep_water_nodes(), kept to benchmark against. It never
+    looks at the first node (index 0)
+
+    Find nodes nearest to the indicated countour
+    """
+
+    # Pad the contour by searching for all points within 0.5m. use_indexes will be the indexes of
+    # the nodes at the contour, use_depths is the depths of the nodes at the contour.
+    # You can change "low_pad" and "high_pad" but there is no real reason to
+    low_pad = 0.5
+    high_pad = 3
+    search_low = contour - low_pad
+    search_lower = contour - high_pad
+    search_high = contour + low_pad
+    search_higher = contour + high_pad
+    use_depths = []
+    use_indexes = []
+
+    # Try looking for nodes within the +-0.5m range of the contour
+    for i in range(1, len(depths)):
+        if search_low < depths[i] < search_high:
+            use_depths.append(depths[i])
+            use_indexes.append(i)
+
+    # If the provided lat/lon ranges do not contain any nodes at the
+    # 20m contour, expand the contour range and try again
+    if not use_depths:
+        for i in range(1, len(depths)):
+            if search_lower < depths[i] < search_higher:
+                    use_depths.append(depths[i])
+                    use_indexes.append(i)
+
+    return use_depths, use_indexes
+
+
+def hsofs_node_find_OLD(x, y):
+    """
+    Loop version of hsofs_node_find()
+
+    Find the appropiate nodes in the hsofs grid using the locations of the nodes used
+    from the nc6b grid. Similar to the finding_well_points function, you'll have to
+    enter in the general shoreline orientation of the well locations (DIAG, NS, EW)
+    """
+
+    # Store the locations of the nc6b nodes used in a dictionary (Python data structure type)
+    # Add more locations using the format: 'Location': [lat, lon],
+    # Don't forget the comma at the end!
+    nc6b_nodes = {
+        'Shackleford': [-76.6601, 34.482],
+        'South Core': [-76.10741, 34.66574],
+    }
+
+    # Loop through the locations in the dictionaries
+    nodes_used = []
+    for key in nc6b_nodes:
+
+        # Set the lat/lon of the current nc6b location as a tuple (Python data structure type)
+        # of (lat, lon). The haversine function in Python uses lat, lon while all the other
+        # methods used here are lon, lat
+        curr_loc = (float(nc6b_nodes[key][1]), float(nc6b_nodes[key][0]))
+
+        # Initialize the min_dist variable with some number. It doesn't matter what the
+        # number is, it just has to be very big so that there is at least one node in the
+        # hsofs mesh that is closer to the nc6b node location than this number. It will get
+        # overwritten in the for-loop below immediately.
+        min_dist = 1000000
+
+        # Loop through the nodes in the box
+        for i in range(len(x)):
+
+            # Set a tuple of the (lat, lon) of the current hsofs node being looked at
+            search_location = (float(y[i]), float(x[i]))
+
+            # Use the haversine function to calculate the distance between the nc6b node
+            # location and the current node being looked at. The function defaults to calculating
+            # distance in miles, by setting miles=False it calculates in kilometers.
+            dist = haversine.haversine(search_location, curr_loc, miles=False)
+
+            if dist < min_dist:
+                # If the distance calculated above is less than the current value
+                # of min_dist, set min_dist to the current value of dist. Store the
+                # index of the current hsofs node too.
+                min_dist = dist
+                index = i
+
+        # Append the index of the closest hsofs node to the nodes_used list
+        nodes_used.append(index)
+
+    return nodes_used
@@ -0,0 +1,178 @@
+"""
+Time writing and reading the output files (see open_output() in functions.py)
+in every format. A year of hourly model output for a number of sites is made
+up in memory, written a model run at a time the same way the download
+scripts write it, and then read back with a filter (one site for one month)
+the way it would be loaded for plotting.
+
+The Parquet files are read with pyarrow's filters, so only the row groups
+that can hold the site and month are read. The .csv and netCDF files have
+to be read in full and filtered afterwards.
+
+Run from the repository folder:
+    python benchmarks/output_benchmark.py [--sites 48] [--days 365] [--formats csv parquet netcdf]
+                                          [--output results.json]
+"""
+
+import argparse
+import csv
+import datetime as dt
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import netCDF4 as nc
+import numpy as np
+
+from stage_benchmark import REPO_DIR, RESULTS_DIR, git_commit
+
+sys.path.insert(0, REPO_DIR)
+import functions as func
+
+
+# Model runs are every 6 hours and each one covers the next 6 hours
+FIRST_DATE = dt.datetime(2017, 8, 1, 0)
+CYCLE_HOURS = 6
+
+# The site and month to read back
+READ_SITE = 3
+READ_MONTH = (dt.datetime(2018, 1, 1), dt.datetime(2018, 2, 1))
+
+
+def make_blocks(num_sites, num_days, seed=0):
+    """
+    Make the output blocks of num_days of hourly model runs for num_sites
+    sites. Returns a list of blocks, one per model run
+    """
+
+    rng = np.random.default_rng(seed)
+    sites = ['site %d' % i for i in range(num_sites)]
+    nodes = rng.choice(1813443, num_sites, replace=False)
+    depth = rng.uniform(5, 30, num_sites)
+    lon = rng.uniform(-77, -76, num_sites)
+    lat = rng.uniform(34, 35, num_sites)
+
+    blocks = []
+    for i in range(num_days * 24 // CYCLE_HOURS):
+        cycle = FIRST_DATE + dt.timedelta(hours=CYCLE_HOURS * i)
+        times = [cycle + dt.timedelta(hours=h) for h in range(CYCLE_HOURS)]
+        shape = (CYCLE_HOURS, num_sites)
+        blocks.append(func.make_output_block(cycle.strftime('%Y%m%d%H'), 'nowcast', times, sites, nodes,
+                                             depth, lon, lat, rng.normal(0, 0.5, shape),
+                                             rng.uniform(0.5, 3, shape), rng.uniform(4, 12, shape)))
+    return blocks
+
+
+def write_output(fname, output_format, blocks):
+    output = func.open_output(fname, output_format, func.output_attributes(True, True))
+    for block in blocks:
+        func.write_output_block(output, block)
+    func.close_output(output)
+
+
+def read_csv(fname):
+    """
+    Read the Hs of READ_SITE in READ_MONTH from a .csv output file
+    """
+    site = 'site %d' % READ_SITE
+    start, end = [month.strftime('%Y-%m-%d %H:%M:%S') for month in READ_MONTH]
+    with open(fname, newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader)
+        time_col, site_col, hs_col = header.index('time'), header.index('site'), header.index('hs')
+        return [float(row[hs_col]) for row in reader
+                if row[site_col] == site and start <= row[time_col] < end]
+
+
+def read_parquet(fname):
+    """
+    Read the Hs of READ_SITE in READ_MONTH from a Parquet output file
+    """
+    import pyarrow.parquet as pq
+    table = pq.read_table(fname, columns=['hs'],
+                          filters=[('site', '=', 'site %d' % READ_SITE),
+                                   ('time', '>=', READ_MONTH[0]), ('time', '<', READ_MONTH[1])])
+    return table.column('hs').to_pylist()
+
+
+def read_netcdf(fname):
+    """
+    Read the Hs of READ_SITE in READ_MONTH from a netCDF output file
+    """
+    start, end = [(month - dt.datetime(1970, 1, 1)).total_seconds() for month in READ_MONTH]
+    with nc.Dataset(fname) as data:
+        site = data['site'][:]
+        seconds = data['time'][:]
+        keep = (site == 'site %d' % READ_SITE) & (seconds >= start) & (seconds < end)
+        return data['hs'][:][keep].tolist()
+
+
+READERS = {'csv': read_csv, 'parquet': read_parquet, 'netcdf': read_netcdf}
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Time writing and reading the output files')
+    parser.add_argument('--sites', type=int, default=48, help='number of sites')
+    parser.add_argument('--days', type=int, default=365, help='number of days of hourly output')
+    parser.add_argument('--formats', nargs='+', default=sorted(func.OUTPUT_EXTENSIONS),
+                        choices=sorted(func.OUTPUT_EXTENSIONS))
+    parser.add_argument('--output', help='JSON file for the results (default: benchmarks/results/)')
+    parser.add_argument('--label', default='', help='name to store with the results')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    blocks = make_blocks(args.sites, args.days)
+    num_rows = sum(len(block['node']) for block in blocks)
+    print('Made %d rows (%d model runs) in %.2f s' % (num_rows, len(blocks), time.perf_counter() - start))
+
+    work_dir = tempfile.mkdtemp(prefix='adcirc_output_')
+    runs = []
+    try:
+        for output_format in args.formats:
+            fname = os.path.join(work_dir, 'output.' + func.OUTPUT_EXTENSIONS[output_format])
+
+            start = time.perf_counter()
+            write_output(fname, output_format, blocks)
+            write_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            values = READERS[output_format](fname)
+            read_time = time.perf_counter() - start
+
+            runs.append({
+                'format': output_format,
+                'write_seconds': write_time,
+                'read_seconds': read_time,
+                'rows_per_second': num_rows / write_time,
+                'bytes': os.path.getsize(fname),
+                'rows_read': len(values),
+            })
+            print('%-8s write: %7.2f s | filtered read: %7.3f s (%d rows) | %6.1f MB' %
+                  (output_format, write_time, read_time, len(values), os.path.getsize(fname) / 1e6))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'label': args.label,
+        'created': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'git_commit': git_commit(),
+        'config': {
+            'sites': args.sites,
+            'days': args.days,
+            'rows': num_rows,
+            'block_rows': func.OUTPUT_BLOCK_ROWS,
+        },
+        'runs': runs,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, 'output_%s.json' % dt.datetime.now().strftime('%Y%m%d_%H%M%S'))
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print('\r\nResults stored in %s' % output)
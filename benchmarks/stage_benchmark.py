@@ -0,0 +1,284 @@
+"""
+Time every stage of functions.py (finding the nodes, converting the times,
+reading the data, writing the output rows) and the download scripts on a
+synthetic model run (see synthetic_adcirc.py). The results are saved as
+JSON so they can be compared between versions of the code.
+
+The code is copied into the work folder before it is run so the mesh cache,
+slab cache, and cycle index made by the benchmark don't mix with the real ones.
+
+Run from the repository folder:
+    python benchmarks/stage_benchmark.py [--grid hsofs] [--nodes N] [--times N]
+                                         [--output results.json] [--compare old.json]
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import synthetic_adcirc as syn
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# The model run to make for each grid. functions.adcirc_data_download() uses
+# the nc6b grid for the maximum values before 8/3/2017 and hsofs after
+DEFAULT_DATES = {'hsofs': '2017081000', 'nc6b': '2017073000'}
+
+
+def time_stage(results, name, function, repeats=3):
+    """
+    Call function repeats times and store the wall times (seconds) of every
+    call in results[name]. The first call is kept separately since it is the
+    one that fills the caches. Anything printed is thrown away.
+
+    Returns the result of the last call
+    """
+    runs = []
+    for i in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function()
+            runs.append(time.perf_counter() - start)
+    results[name] = {
+        'first': runs[0],
+        'best': min(runs),
+        'mean': sum(runs) / len(runs),
+        'runs': runs,
+    }
+    print('%-40s first: %9.4f s | best: %9.4f s' % (name, runs[0], min(runs)))
+    return result
+
+
+def copy_code(code_dir):
+    """
+    Copy functions.py, the sites file, and the download scripts into code_dir
+    """
+    os.makedirs(code_dir, exist_ok=True)
+    for fname in ['functions.py', 'sites.csv'] + glob.glob(os.path.join(REPO_DIR, 'ADCIRC_*.py')):
+        shutil.copy(os.path.join(REPO_DIR, fname), code_dir)
+
+
+def git_commit():
+    """
+    Return the commit the repository is on, or None if it can't be found
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def script_answers(date, nodes_used=None):
+    """
+    Make the answers to the set_date() prompts for a model run (GMT, NAVD88)
+    """
+    date_dt = dt.datetime.strptime(date, '%Y%m%d%H')
+    answers = [str(date_dt.year), str(date_dt.month), str(date_dt.day), '%02d' % date_dt.hour, 'T', 'T']
+    if nodes_used is not None:
+        answers += [str(len(nodes_used))] + [str(node) for node in nodes_used]
+    return '\n'.join(answers) + '\n'
+
+
+def run_script(code_dir, script, answers, mirror):
+    """
+    Run one of the download scripts from code_dir reading from the mirror
+    """
+    env = dict(os.environ, ADCIRC_MIRROR_DIR=mirror)
+    subprocess.run([sys.executable, script], cwd=code_dir, env=env, input=answers.encode(),
+                   stdout=subprocess.DEVNULL, check=True)
+
+
+def run_stages(func, mirror, code_dir, grid, date, repeats):
+    """
+    Time every stage on the model run in the mirror and return the results
+    """
+
+    results = {}
+    bottom_lat, upper_lat, left_lon, right_lon = func.load_bounding_box()
+    use_gmt, use_navd88 = True, True
+
+    # Open the forecast files the same way the scripts do
+    hs_data, tp_data, z_data, status, found_grid = time_stage(
+        results, 'adcirc_full_data_download', lambda: func.adcirc_full_data_download(date), repeats)
+    assert status == 'good' and found_grid == grid, (status, found_grid)
+
+    # Node search stages, on the mesh inside the bounding box
+    x = hs_data['x'][:]
+    y = hs_data['y'][:]
+    depth = hs_data['depth'][:]
+    bounding_box = (bottom_lat, upper_lat, left_lon, right_lon)
+    mask = time_stage(results, 'box_mask', lambda: func.box_mask(x, y, bounding_box), repeats)
+    box_nodes = np.flatnonzero(mask)
+    time_stage(results, 'coalesce_runs', lambda: func.coalesce_runs(box_nodes), repeats)
+    box_x, box_y, box_depth = x[box_nodes], y[box_nodes], depth[box_nodes]
+    use_depths, use_indexes = time_stage(results, 'deep_water_nodes',
+                                         lambda: func.deep_water_nodes(box_depth, 20), repeats)
+    well_nodes = time_stage(results, 'finding_well_points',
+                            lambda: func.finding_well_points(use_indexes, box_x, box_y), repeats)
+    time_stage(results, 'hsofs_node_find', lambda: func.hsofs_node_find(box_x, box_y), repeats)
+    tree = func.build_node_tree(box_x, box_y)
+    time_stage(results, 'hsofs_node_find (prebuilt tree)',
+               lambda: func.hsofs_node_find(box_x, box_y, tree), repeats)
+
+    # Time conversion stages, every model time step in the run
+    base_time = func.get_model_base_time(hs_data)
+    model_times = hs_data['time'][:]
+    time_stage(results, 'get_real_time (GMT)',
+               lambda: [func.get_real_time(base_time, t, True) for t in model_times], repeats)
+    time_stage(results, 'get_real_time (EST)',
+               lambda: [func.get_real_time(base_time, t, False) for t in model_times], repeats)
+    time_stage(results, 'convert_model_times (GMT)',
+               lambda: func.convert_model_times(base_time, model_times, True), repeats)
+    time_stage(results, 'convert_model_times (EST)',
+               lambda: func.convert_model_times(base_time, model_times, False), repeats)
+
+    # Plans, the first call fills the mesh cache
+    plan = time_stage(results, 'make_extraction_plan',
+                      lambda: func.make_extraction_plan(hs_data, grid, bounding_box, use_gmt,
+                                                        date=date), repeats)
+    known_nodes = [int(node) for node in plan['nodes']] + [int(box_nodes[node]) for node in well_nodes]
+    known_plan = time_stage(results, 'make_known_node_plan',
+                            lambda: func.make_known_node_plan(hs_data, grid, known_nodes, use_gmt,
+                                                              date=date), repeats)
+
+    # Writing the .csv rows with values that are already in memory
+    num_steps = len(plan['times'])
+    values = np.ones((num_steps, len(plan['nodes'])))
+
+    def write_rows():
+        output = func.open_output(os.devnull, 'csv')
+        func.write_output_block(output, func.make_plan_block(plan, 'forecast', 0, num_steps,
+                                                             values, values, values, use_navd88))
+        func.close_output(output)
+
+    time_stage(results, 'write_output_block csv (%d time steps)' % num_steps, write_rows, repeats)
+
+    # Reading the data and writing the rows
+    def extract(function, use_plan):
+        output = func.open_output(os.devnull, 'csv')
+        function(hs_data, tp_data, z_data, use_plan, output, use_gmt, use_navd88)
+        func.close_output(output)
+
+    time_stage(results, 'extract_cycle_data', lambda: extract(func.extract_cycle_data, plan), repeats)
+    time_stage(results, 'extract_known_node_data',
+               lambda: extract(func.extract_known_node_data, known_plan), repeats)
+
+    # One cycle of each of the multiday scripts
+    time_stage(results, 'extract_max_cycle',
+               lambda: func.extract_max_cycle(date, bounding_box), repeats)
+    time_stage(results, 'extract_known_node_cycle',
+               lambda: func.extract_known_node_cycle(date, known_nodes, use_gmt, use_navd88), repeats)
+
+    for dataset in [hs_data, tp_data, z_data]:
+        dataset.close()
+
+    # The single day scripts from start to finish (new processes, so the
+    # first run has to load the mesh cache off the disk)
+    time_stage(results, 'ADCIRC_Singleday_Data_Download.py',
+               lambda: run_script(code_dir, 'ADCIRC_Singleday_Data_Download.py',
+                                  script_answers(date), mirror), repeats)
+    time_stage(results, 'ADCIRC_Known_Node_Data_Download.py',
+               lambda: run_script(code_dir, 'ADCIRC_Known_Node_Data_Download.py',
+                                  script_answers(date, known_nodes), mirror), repeats)
+
+    return results
+
+
+def compare_results(old, new):
+    """
+    Print how much faster (> 1) or slower (< 1) every stage is in new than in old
+    """
+    print('\r\n%-40s %10s %10s %8s' % ('stage', 'old (s)', 'new (s)', 'speedup'))
+    for name in new['stages']:
+        if name in old['stages']:
+            old_time = old['stages'][name]['best']
+            new_time = new['stages'][name]['best']
+            print('%-40s %10.4f %10.4f %7.2fx' % (name, old_time, new_time, old_time / max(new_time, 1e-9)))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the stages of functions.py on a synthetic model run')
+    parser.add_argument('--grid', choices=sorted(syn.GRIDS), default='hsofs')
+    parser.add_argument('--nodes', type=int, help='number of nodes (default: size of the real grid)')
+    parser.add_argument('--times', type=int, default=syn.FORECAST_TIMES, help='forecast time steps')
+    parser.add_argument('--repeats', type=int, default=3, help='times to run every stage')
+    parser.add_argument('--work-dir', help='folder for the synthetic data (default: a temporary folder)')
+    parser.add_argument('--keep', action='store_true', help="don't delete the work folder")
+    parser.add_argument('--output', help='JSON file for the results (default: benchmarks/results/)')
+    parser.add_argument('--label', default='', help='name to store with the results')
+    parser.add_argument('--compare', help='JSON results to compare against')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='adcirc_benchmark_')
+    mirror = os.path.join(work_dir, 'mirror')
+    code_dir = os.path.join(work_dir, 'code')
+    date = DEFAULT_DATES[args.grid]
+    num_nodes = args.nodes or syn.GRIDS[args.grid]['num_nodes']
+
+    try:
+        # Make the model run (only if the work folder doesn't already have it)
+        start = time.perf_counter()
+        if not os.path.isdir(os.path.join(mirror, date)):
+            print('Writing a synthetic %s model run with %d nodes and %d time steps' %
+                  (args.grid, num_nodes, args.times))
+            syn.make_cycle(mirror, date, args.grid, num_nodes, args.times, nowcast=(args.grid == 'hsofs'))
+        generate_time = time.perf_counter() - start
+
+        # Import the copy of the code and point it at the mirror
+        copy_code(code_dir)
+        sys.path.insert(0, code_dir)
+        import functions as func
+        func.use_mirror(mirror)
+
+        stages = run_stages(func, mirror, code_dir, args.grid, date, args.repeats)
+
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'label': args.label,
+        'created': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'config': {
+            'grid': args.grid,
+            'date': date,
+            'num_nodes': num_nodes,
+            'num_times': args.times,
+            'repeats': args.repeats,
+            'generate_seconds': generate_time,
+        },
+        'stages': stages,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, 'stage_benchmark_%s_%s.json' %
+                              (args.grid, dt.datetime.now().strftime('%Y%m%d_%H%M%S')))
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print('\r\nResults stored in %s' % output)
+
+    if args.compare:
+        with open(args.compare) as compare_file:
+            compare_results(json.load(compare_file), results)
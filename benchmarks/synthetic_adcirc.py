@@ -0,0 +1,263 @@
+"""
+Make synthetic ADCIRC+SWAN model runs to benchmark against. The files have
+the same variables, dimensions, and base_date attribute as the files on the
+server (swan_HS.63.nc, swan_TPS.63.nc, fort.63.nc, and the *_max.63.nc files)
+and are written into a folder laid out like the server so it can be used as
+a local mirror (see functions.use_mirror()).
+
+The mesh is a jittered lattice of nodes split into triangles. The nodes are
+numbered in a random order (always the same one for a seed) so nodes next to
+each other don't have neighbouring numbers, and the depths increase away from
+a straight coastline running through the wells so the 20m contour is found
+the same way it is on the real grids.
+
+Run from the repository folder:
+    python benchmarks/synthetic_adcirc.py FOLDER [--grid hsofs] [--nodes N] [--times N]
+"""
+
+import argparse
+import datetime as dt
+import os
+
+import netCDF4 as nc
+import numpy as np
+
+
+# Roughly the size and layout of the real grids. The forecast and nowcast
+# folder names match the paths used in functions.py
+GRIDS = {
+    'hsofs': {
+        'num_nodes': 1813443,
+        'path': 'hsofs/hatteras.renci.org/namhsofs',
+        'ascending': True,
+    },
+    'nc6b': {
+        'num_nodes': 600000,
+        'path': 'nc6b/hatteras.renci.org/dailyv6c',
+        'ascending': False,
+    },
+}
+
+# The area the mesh covers (lon, lat) and the coastline the depths are
+# measured from. The coastline goes through the wells in functions.py
+MESH_LON = (-98.0, -60.0)
+MESH_LAT = (8.0, 46.0)
+COAST_LON, COAST_LAT, COAST_SLOPE = -76.55, 34.62, 0.47
+
+# Model times are seconds since the cold start of the model
+COLD_START = dt.datetime(2017, 1, 1)
+FILL_VALUE = -99999.0
+
+# Forecasts are hourly for a little over four days, nowcasts for six hours
+FORECAST_TIMES = 102
+NOWCAST_TIMES = 7
+
+# The variables in every file, (name, long name, units)
+TIME_FILES = {
+    'swan_HS.63.nc': ('swan_HS', 'significant wave height', 'm'),
+    'swan_TPS.63.nc': ('swan_TPS', 'smoothed peak period', 's'),
+    'fort.63.nc': ('zeta', 'water surface elevation above geoid', 'm'),
+}
+MAX_FILES = {
+    'swan_HS_max.63.nc': ('swan_HS_max', 'maximum significant wave height', 'm'),
+    'swan_TPS_max.63.nc': ('swan_TPS_max', 'maximum smoothed peak period', 's'),
+    'maxele.63.nc': ('zeta_max', 'maximum water surface elevation above geoid', 'm'),
+}
+
+
+def make_mesh(num_nodes, ascending=True, seed=0, shuffle=True):
+    """
+    Make a mesh with about num_nodes nodes. Returns a dictionary with the node
+    x, y, and depth arrays and the (1-based) element connectivity. The nodes
+    are numbered in a random order made from the seed, if shuffle is False
+    they are in order of longitude (ascending or descending) instead
+    """
+
+    rng = np.random.default_rng(seed)
+
+    # Size the lattice so the spacing is the same in both directions
+    width = MESH_LON[1] - MESH_LON[0]
+    height = MESH_LAT[1] - MESH_LAT[0]
+    num_x = max(2, int(round(np.sqrt(num_nodes * width / height))))
+    num_y = max(2, int(round(num_nodes / num_x)))
+
+    # Column i of the lattice holds nodes i * num_y to (i + 1) * num_y - 1 so
+    # the nodes are in order of longitude. Jitter the nodes inside their cells
+    lon = np.linspace(MESH_LON[0], MESH_LON[1], num_x)
+    lat = np.linspace(MESH_LAT[0], MESH_LAT[1], num_y)
+    if not ascending:
+        lon = lon[::-1]
+    x = np.repeat(lon, num_y) + rng.uniform(-0.25, 0.25, num_x * num_y) * width / num_x
+    y = np.tile(lat, num_x) + rng.uniform(-0.25, 0.25, num_x * num_y) * height / num_y
+
+    # Depths increase with the distance offshore of the coastline (about 20m
+    # every 0.1 degrees) and nodes on land have negative depths
+    offshore = ((x - COAST_LON) * COAST_SLOPE - (y - COAST_LAT)) / np.hypot(1, COAST_SLOPE)
+    depth = np.clip(200 * offshore, -50, 5000) + rng.normal(0, 0.25, len(x))
+
+    # Split every lattice cell into two triangles
+    i, j = np.meshgrid(np.arange(num_x - 1), np.arange(num_y - 1), indexing='ij')
+    corner = (i * num_y + j).ravel()
+    element = np.concatenate([
+        np.column_stack((corner, corner + num_y, corner + num_y + 1)),
+        np.column_stack((corner, corner + num_y + 1, corner + 1)),
+    ])
+
+    # Give the nodes random numbers. Node order[k] of the lattice becomes
+    # node k, and the elements are changed to use the new numbers
+    if shuffle:
+        order = rng.permutation(len(x))
+        new_number = np.empty_like(order)
+        new_number[order] = np.arange(len(order))
+        x, y, depth = x[order], y[order], depth[order]
+        element = new_number[element]
+
+    return {'x': x, 'y': y, 'depth': depth, 'element': (element + 1).astype('i4')}
+
+
+def model_times(date, num_times):
+    """
+    Return the model times (seconds since COLD_START) for an hourly run
+    starting at date (yyyymmddhh)
+    """
+    start = (dt.datetime.strptime(date, '%Y%m%d%H') - COLD_START).total_seconds()
+    return start + 3600.0 * np.arange(num_times)
+
+
+def create_dataset(fname, mesh, file_format):
+    """
+    Create a netCDF file with the mesh variables in it and return it
+    """
+
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    data = nc.Dataset(fname, 'w', format=file_format)
+    data.createDimension('time', None)
+    data.createDimension('node', len(mesh['x']))
+    data.createDimension('nele', len(mesh['element']))
+    data.createDimension('nvertex', 3)
+
+    time = data.createVariable('time', 'f8', ('time',))
+    time.long_name = 'model time'
+    time.units = 'seconds since %s' % COLD_START.strftime('%Y-%m-%d %H:%M:%S')
+    time.base_date = COLD_START.strftime('%Y-%m-%d %H:%M:%S')
+
+    for name, long_name, units in [('x', 'longitude', 'degrees_east'),
+                                   ('y', 'latitude', 'degrees_north'),
+                                   ('depth', 'distance below geoid', 'm')]:
+        var = data.createVariable(name, 'f8', ('node',))
+        var.long_name = long_name
+        var.units = units
+        var[:] = mesh[name]
+
+    element = data.createVariable('element', 'i4', ('nele', 'nvertex'))
+    element.long_name = 'element'
+    element.start_index = 1
+    element[:] = mesh['element']
+
+    return data
+
+
+def make_values(name, mesh, times, rng):
+    """
+    Make the values of a variable for a block of time steps. Every node gets
+    its own level and the values go up and down over a day. Elevations on
+    land are left as fill values
+    """
+
+    level = 1 + np.clip(mesh['depth'], 0, 50) / 25 + rng.uniform(0, 0.2, len(mesh['x']))
+    tide = np.sin(2 * np.pi * np.asarray(times)[:, None] / 86400.0)
+    if name.startswith('swan_HS'):
+        values = level * (1 + 0.3 * tide)
+    elif name.startswith('swan_TPS'):
+        values = 4 + 2 * level * (1 + 0.2 * tide)
+    else:
+        values = np.where(mesh['depth'] > 0, 0.6 * tide + 0.05 * level, FILL_VALUE)
+    return values
+
+
+def write_time_file(fname, var_info, mesh, times, file_format, seed=0, block=8):
+    """
+    Write a time x node file (i.e; swan_HS.63.nc) a block of time steps at a time
+    """
+
+    name, long_name, units = var_info
+    rng = np.random.default_rng(seed)
+    data = create_dataset(fname, mesh, file_format)
+    data['time'][:] = times
+
+    var = data.createVariable(name, 'f8', ('time', 'node'), fill_value=FILL_VALUE)
+    var.long_name = long_name
+    var.units = units
+    for t0 in range(0, len(times), block):
+        t1 = min(t0 + block, len(times))
+        var[t0:t1, :] = make_values(name, mesh, times[t0:t1], rng)
+
+    data.close()
+
+
+def write_max_file(fname, var_info, mesh, times, file_format, seed=0):
+    """
+    Write a maximum value file (i.e; swan_HS_max.63.nc)
+    """
+
+    name, long_name, units = var_info
+    rng = np.random.default_rng(seed)
+    data = create_dataset(fname, mesh, file_format)
+    data['time'][:] = times[-1:]
+
+    var = data.createVariable(name, 'f8', ('node',), fill_value=FILL_VALUE)
+    var.long_name = long_name
+    var.units = units
+    values = make_values(name, mesh, times[:1], rng)[0]
+    var[:] = np.where(values == FILL_VALUE, FILL_VALUE, 1.5 * values)
+
+    data.close()
+
+
+def make_cycle(folder, date, grid='hsofs', num_nodes=None, num_times=FORECAST_TIMES,
+               nowcast=True, file_format='NETCDF3_64BIT_OFFSET', seed=0):
+    """
+    Write a synthetic model run (yyyymmddhh) into folder laid out like the
+    server: folder/date/<grid path>/namforecast/<files>, and a nowcast folder
+    if nowcast is True. Returns a list of the files written
+    """
+
+    info = GRIDS[grid]
+    mesh = make_mesh(num_nodes or info['num_nodes'], info['ascending'], seed)
+
+    casts = [('namforecast', num_times, True)]
+    if nowcast:
+        casts.append(('nowcast', NOWCAST_TIMES, False))
+
+    written = []
+    for cast, cast_times, with_max in casts:
+        cast_dir = os.path.join(folder, date, *(info['path'].split('/') + [cast]))
+        times = model_times(date, cast_times)
+        for fname, var_info in sorted(TIME_FILES.items()):
+            path = os.path.join(cast_dir, fname)
+            write_time_file(path, var_info, mesh, times, file_format, seed)
+            written.append(path)
+        if with_max:
+            for fname, var_info in sorted(MAX_FILES.items()):
+                path = os.path.join(cast_dir, fname)
+                write_max_file(path, var_info, mesh, times, file_format, seed)
+                written.append(path)
+
+    return written
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Write a synthetic ADCIRC+SWAN model run')
+    parser.add_argument('folder', help='folder to write the model run into')
+    parser.add_argument('--grid', choices=sorted(GRIDS), default='hsofs')
+    parser.add_argument('--date', default='2017081000', help='model run (yyyymmddhh)')
+    parser.add_argument('--nodes', type=int, help='number of nodes (default: size of the real grid)')
+    parser.add_argument('--times', type=int, default=FORECAST_TIMES, help='forecast time steps')
+    parser.add_argument('--no-nowcast', action='store_true', help="don't write a nowcast")
+    parser.add_argument('--format', default='NETCDF3_64BIT_OFFSET', help='netCDF file format')
+    args = parser.parse_args()
+
+    for path in make_cycle(args.folder, args.date, args.grid, args.nodes, args.times,
+                           not args.no_nowcast, args.format):
+        print(path)
@@ -0,0 +1,255 @@
+"""
+Measure how many model runs per minute the multiday scripts get through on
+different (simulated) networks. A set of synthetic model runs is served by
+fake_thredds.py with each network profile and the same cycle workers the
+multiday scripts use (functions.extract_max_cycle for
+ADCIRC_Multiday_Data_Download.py and functions.extract_known_node_cycle for
+ADCIRC_Known_Node_Multiday_Data_Download_Updated.py) are run with
+functions.run_cycles() for every number of workers.
+
+The slab cache is turned off and the catalog and mesh caches are cleared
+before every run so every run downloads everything from the server. Model
+runs that fail are tried again at the end of the run (see run_cycles()).
+
+Run from the repository folder:
+    python benchmarks/throughput_benchmark.py [--profiles lan wan flaky] [--workers 1 4]
+                                              [--cycles 8] [--nodes N] [--output results.json]
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import netCDF4 as nc
+import numpy as np
+import requests
+
+import fake_thredds
+import synthetic_adcirc as syn
+from stage_benchmark import RESULTS_DIR, copy_code, git_commit
+
+
+# The first model run to make, the rest are every 12 hours after it
+FIRST_DATE = dt.datetime(2017, 8, 10, 0)
+
+# The multiday scripts and the cycle worker each one uses
+SCRIPTS = {
+    'ADCIRC_Multiday_Data_Download.py': 'extract_max_cycle',
+    'ADCIRC_Known_Node_Multiday_Data_Download_Updated.py': 'extract_known_node_cycle',
+}
+
+
+def make_dates(num_cycles):
+    """
+    Return num_cycles model runs (yyyymmddhh) 12 hours apart
+    """
+    return [(FIRST_DATE + dt.timedelta(hours=12 * i)).strftime('%Y%m%d%H') for i in range(num_cycles)]
+
+
+def make_runs(mirror, dates, num_nodes, num_times):
+    """
+    Write one synthetic model run and link it to the other dates (the
+    files are the same for every date so they only take up space once)
+    """
+
+    first = os.path.join(mirror, dates[0])
+    if not os.path.isdir(first):
+        syn.make_cycle(mirror, dates[0], 'hsofs', num_nodes, num_times)
+
+    for date in dates[1:]:
+        if os.path.isdir(os.path.join(mirror, date)):
+            continue
+        for folder, subfolders, files in os.walk(first):
+            target = os.path.join(mirror, date, os.path.relpath(folder, first))
+            os.makedirs(target, exist_ok=True)
+            for fname in files:
+                try:
+                    os.link(os.path.join(folder, fname), os.path.join(target, fname))
+                except OSError:
+                    shutil.copy(os.path.join(folder, fname), os.path.join(target, fname))
+
+
+def free_port():
+    """
+    Return a port nobody is listening on
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mirror, profile, seed=0):
+    """
+    Start fake_thredds.py for the mirror with a network profile. Returns
+    the process and the server's address
+    """
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, fake_thredds.__file__, mirror, '--port', str(port),
+                               '--profile', profile, '--seed', str(seed)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    address = 'http://127.0.0.1:%d' % port
+
+    # Wait for the server to start listening
+    for i in range(100):
+        try:
+            requests.get(address + '/stats', timeout=1, proxies={'http': None})
+            return server, address
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('The fake THREDDS server did not start')
+
+
+def server_stats(address):
+    return requests.get(address + '/stats', timeout=10, proxies={'http': None}).json()
+
+
+def clear_caches(func, code_dir):
+    """
+    Clear the catalog and mesh caches of the copy of the code
+    """
+    for folder in ['catalog_cache', 'mesh_cache', 'slab_cache']:
+        shutil.rmtree(os.path.join(code_dir, folder), ignore_errors=True)
+    func.catalog_cache.clear()
+    func.loaded_meshes.clear()
+
+
+def run_throughput(func, code_dir, address, script, jobs, num_workers):
+    """
+    Run the cycle worker for a script on every job and return the results
+    """
+
+    clear_caches(func, code_dir)
+    before = server_stats(address)
+
+    # An error the worker doesn't handle stops the whole run, the same
+    # as it would stop the script. Keep what was done up to then
+    start = time.perf_counter()
+    statuses = []
+    error = None
+    try:
+        for result in func.run_cycles(getattr(func, SCRIPTS[script]), jobs, num_workers, retry=func.cycle_failed):
+            statuses.append(result[1])
+    except Exception as exception:
+        error = repr(exception)
+    elapsed = time.perf_counter() - start
+
+    after = server_stats(address)
+    return {
+        'script': script,
+        'workers': num_workers,
+        'cycles': len(jobs),
+        'good': statuses.count('good'),
+        'seconds': elapsed,
+        'cycles_per_minute': 60 * len(statuses) / elapsed,
+        'error': error,
+        'server': {name: after[name] - before[name] for name in after},
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Measure cycles/minute for the multiday scripts')
+    parser.add_argument('--profiles', nargs='+', default=['local', 'lan', 'wan', 'flaky'],
+                        choices=sorted(fake_thredds.PROFILES))
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--scripts', nargs='+', default=sorted(SCRIPTS), choices=sorted(SCRIPTS))
+    parser.add_argument('--cycles', type=int, default=8, help='number of model runs')
+    parser.add_argument('--nodes', type=int, default=200000, help='number of nodes in the mesh')
+    parser.add_argument('--times', type=int, default=syn.FORECAST_TIMES, help='forecast time steps')
+    parser.add_argument('--work-dir', help='folder for the synthetic data (default: a temporary folder)')
+    parser.add_argument('--output', help='JSON file for the results (default: benchmarks/results/)')
+    parser.add_argument('--label', default='', help='name to store with the results')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='adcirc_throughput_')
+    mirror = os.path.join(work_dir, 'mirror')
+    code_dir = os.path.join(work_dir, 'code')
+    dates = make_dates(args.cycles)
+    runs = []
+
+    try:
+        print('Writing %d synthetic model runs with %d nodes' % (args.cycles, args.nodes))
+        make_runs(mirror, dates, args.nodes, args.times)
+
+        # Import a copy of the code (so its caches stay in the work folder)
+        # and never keep downloaded slabs so every run uses the server
+        copy_code(code_dir)
+        sys.path.insert(0, code_dir)
+        import functions as func
+        func.SLAB_CACHE_BYTES = 0
+
+        # Model runs that fail are tried again at the end of a run, don't
+        # wait as long as the scripts do before trying them
+        func.RETRY_ROUNDS_WAIT = 2.0
+
+        # Known nodes spread out over the mesh
+        with nc.Dataset(os.path.join(mirror, dates[0], *(syn.GRIDS['hsofs']['path'].split('/') +
+                                                         ['nowcast', 'swan_HS.63.nc']))) as data:
+            num_nodes = data.dimensions['node'].size
+        nodes_used = [int(node) for node in np.linspace(0, num_nodes - 1, 4)]
+
+        bounding_box = func.load_bounding_box()
+        jobs = {
+            'ADCIRC_Multiday_Data_Download.py': [(date, bounding_box) for date in dates],
+            'ADCIRC_Known_Node_Multiday_Data_Download_Updated.py': [(date, nodes_used, True, True)
+                                                                    for date in dates],
+        }
+
+        for profile in args.profiles:
+            server, address = start_server(mirror, profile)
+
+            # Send everything for the RENCI servers to the fake server
+            os.environ['http_proxy'] = address
+            os.environ['no_proxy'] = ''
+            try:
+                for script in args.scripts:
+                    for num_workers in args.workers:
+                        run = run_throughput(func, code_dir, address, script, jobs[script], num_workers)
+                        run['profile'] = profile
+                        runs.append(run)
+                        print('%-6s %-52s %2d workers | %7.1f cycles/minute | %d of %d good%s' %
+                              (profile, script, num_workers, run['cycles_per_minute'], run['good'], run['cycles'],
+                               ' | stopped by %s' % run['error'] if run['error'] else ''))
+            finally:
+                os.environ.pop('http_proxy', None)
+                server.terminate()
+                server.wait()
+
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'label': args.label,
+        'created': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'git_commit': git_commit(),
+        'config': {
+            'cycles': args.cycles,
+            'nodes': args.nodes,
+            'times': args.times,
+            'profiles': {profile: fake_thredds.PROFILES[profile] for profile in args.profiles},
+        },
+        'runs': runs,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, 'throughput_%s.json' % dt.datetime.now().strftime('%Y%m%d_%H%M%S'))
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    # The workers print a lot, so print all the results again at the end
+    print('\r\n%-6s %-52s %7s %15s %8s' % ('', 'script', 'workers', 'cycles/minute', 'good'))
+    for run in runs:
+        print('%-6s %-52s %7d %15.1f %4d/%-3d' % (run['profile'], run['script'], run['workers'],
+                                                 run['cycles_per_minute'], run['good'], run['cycles']))
+    print('\r\nResults stored in %s' % output)
@@ -0,0 +1,84 @@
+"""
+Benchmark converting model times into real times all at once
+(convert_model_times()) against one time step at a time (get_real_time())
+and check that both give the same times. The Eastern times are also
+checked against the America/New_York time zone from the zoneinfo module
+(Python 3.9+, the check is skipped if it isn't there) for every half hour
+from 1967 to 2049
+
+Run from the repository folder: python benchmarks/time_benchmark.py
+"""
+
+import datetime as dt
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import functions as func
+from node_find_benchmark import time_call
+
+
+# Model times are seconds since the cold start of the model
+BASE_TIME = dt.datetime(2017, 1, 1)
+
+
+def per_step(base_time, model_times, gmt):
+    """
+    Convert the times one at a time and format them, the way every time
+    step used to be converted
+    """
+    return [func.get_real_time(base_time, model_time, gmt) for model_time in model_times]
+
+
+def all_at_once(base_time, model_times, gmt):
+    """
+    Convert the times all at once and format them all at once, the way
+    the output files are written
+    """
+    real_times = func.convert_model_times(base_time, model_times, gmt)
+    return real_times, func.format_times(real_times)
+
+
+def check_zoneinfo():
+    """
+    Return how many half hours from 1967 to 2049 convert_model_times() puts
+    in a different Eastern time than zoneinfo, or None if there's no zoneinfo
+    """
+    try:
+        import zoneinfo
+        eastern = zoneinfo.ZoneInfo('America/New_York')
+    except (ImportError, KeyError, OSError):
+        return None
+
+    epoch = dt.datetime(1970, 1, 1)
+    seconds = np.arange((dt.datetime(1967, 1, 1) - epoch).total_seconds(),
+                        (dt.datetime(2050, 1, 1) - epoch).total_seconds(), 1800.0)
+    real_times = func.convert_model_times(epoch, seconds, False)
+    expected = np.array([dt.datetime.fromtimestamp(second, dt.timezone.utc).astimezone(eastern).replace(tzinfo=None)
+                         for second in seconds], dtype='datetime64[s]')
+    return int((real_times != expected).sum())
+
+
+if __name__ == '__main__':
+
+    # A forecast (102 hourly steps), a year, and ten years of hourly times
+    for num_times in [102, 8760, 87600]:
+        model_times = 3600.0 * np.arange(num_times)
+
+        for gmt in [True, False]:
+            loop_time, loop_result = time_call(per_step, BASE_TIME, model_times, gmt)
+            array_time, (real_times, real_time_strs) = time_call(all_at_once, BASE_TIME, model_times, gmt)
+
+            same = (list(real_time_strs) == [real_time_str for real_time, real_time_str in loop_result] and
+                    all(np.datetime64(real_time, 's') == array_time
+                        for (real_time, real_time_str), array_time in zip(loop_result, real_times)))
+            print('%6d times %-3s | per step: %8.4f s | all at once: %8.5f s | speedup: %6.0fx | same times: %s' %
+                  (num_times, 'GMT' if gmt else 'EST', loop_time, array_time, loop_time / array_time, same))
+
+    mismatches = check_zoneinfo()
+    if mismatches is None:
+        print('\r\nzoneinfo is not available, the Eastern times were not checked against it')
+    else:
+        print('\r\nHalf hours from 1967 to 2049 with a different Eastern time than zoneinfo: %d' % mismatches)
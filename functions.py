@@ -8,21 +8,984 @@ import netCDF4 as nc
 import numpy as np
 import datetime as dt
 from bs4 import BeautifulSoup
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+import xml.etree.ElementTree as ET
+from scipy import sparse
+from scipy.spatial import cKDTree
 import requests
-import haversine
+import asyncio
+import contextlib
+import errno
+import hashlib
+import json
+import multiprocessing as mp
+import csv
+import io
 import os
+import posixpath
+import random
+import re
+import sqlite3
+import threading
 import time
 
 
+# Mean radius of the Earth in kilometers. This is the same value the haversine
+# package uses so distances from the KD-tree match the old haversine loop
+# (hsofs_node_find_OLD() in benchmarks/old_versions.py)
+EARTH_RADIUS_KM = 6371.0088
+
+# How much memory (bytes) a block of time steps read by read_time_slabs() is
+# allowed to use. Bigger blocks mean fewer requests to the server
+SLAB_MEMORY_BUDGET = 256 * 1024 ** 2
+
+# Opening a dataset, reading a variable, or downloading a catalog from the
+# server is tried RETRY_ATTEMPTS times if the error is one that can go away
+# (a time out, a dropped connection, or a 5xx from the server). The wait
+# between tries starts at RETRY_WAIT seconds and doubles every time (up to
+# RETRY_MAX_WAIT). Any other error is never tried again. These are the netCDF
+# error codes for errors that won't go away (the file isn't there) and errors
+# that can. Reading a variable raises a RuntimeError with only the message of
+# the code, those are in TRANSIENT_MESSAGES
+RETRY_ATTEMPTS = 4
+RETRY_WAIT = 1.0
+RETRY_MAX_WAIT = 30.0
+PERMANENT_ERRORS = [-90, errno.ENOENT]   # NC_ENOTFOUND (a 404), file not in the mirror
+TRANSIENT_ERRORS = [-68, -70, -67]       # NC_EIO (time out/dropped), NC_EDAPSVC (5xx), NC_ECURL
+TRANSIENT_MESSAGES = ['NetCDF: I/O failure', 'NetCDF: DAP server error', 'NetCDF: libcurl failure']
+
+# If BREAKER_FAILURES requests in a row fail on the same server, the server is
+# left alone for BREAKER_COOLDOWN seconds (every request fails straight away,
+# without waiting or being tried again) instead of piling more requests onto
+# it. After that one request is let through to test the server, if it works
+# the server is used again, if not it is left alone for another BREAKER_COOLDOWN.
+# missing_urls are the urls that are known not to be on the server
+BREAKER_FAILURES = 8
+BREAKER_COOLDOWN = 60.0
+breakers = {}
+breaker_lock = threading.Lock()
+missing_urls = set()
+
+# Model runs that failed with an error that can go away are put in a queue
+# and tried again RETRY_ROUNDS times at the end of a multiday run, after
+# waiting RETRY_ROUNDS_WAIT seconds. The output stays in date order
+RETRY_ROUNDS = 1
+RETRY_ROUNDS_WAIT = BREAKER_COOLDOWN
+
+# The multiday model runs are written (and checkpointed) in date order, so a
+# model run that is done has to wait for the slower ones before it. Only
+# CYCLES_AHEAD model runs per worker process are started past the oldest one
+# that isn't done yet. That is also the most finished model runs that can be
+# lost (and downloaded again on --resume) if the run stops
+CYCLES_AHEAD = 2
+
+# Folder to store the mesh (x, y, depth) for every grid in. Meshes loaded
+# during the current run are also kept in loaded_meshes
+MESH_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mesh_cache')
+loaded_meshes = {}
+
+# Nodes are read as runs of neighbouring node IDs, one request per run.
+# Runs that are close together are joined into one (the nodes between them
+# are read and thrown away) as long as the extra nodes add up to no more
+# than RUN_GAP_WASTE times the nodes that are needed. Gaps that are less
+# than RUN_REQUEST_BYTES are always joined, every request costs about as
+# much time as downloading that much more. The nodes in a bounding box (see
+# get_box()) are kept with the mesh cache
+RUN_GAP_WASTE = 0.5
+RUN_REQUEST_BYTES = 256 * 1024
+loaded_boxes = {}
+
+# The nodes at a depth contour in a bounding box (see contour_nodes())
+loaded_contours = {}
+
+# How the sites are matched to the mesh. 'node' uses the nearest node at the
+# depth contour (on hsofs the nearest node to the nc6b location), 'isobath'
+# puts the site on the contour line itself and interpolates the values from
+# the nodes around it (see isobath_operator()), and 'barycentric' interpolates
+# the values at the site itself from the corners of the element it is in
+# (see barycentric_operator()). The elements (from the fort.63 dataset),
+# contour lines, and interpolation weights are kept with the mesh cache
+SITE_METHODS = ['node', 'isobath', 'barycentric']
+loaded_elements = {}
+loaded_isobaths = {}
+loaded_operators = {}
+
+# The node map (see build_node_map()) has the equivalent node of every site
+# on every grid, so switching between grids doesn't need a node search. It is
+# stored in the mesh cache folder as NODE_MAP_FILE. NODE_MAP_VERSION goes up
+# when the layout of the map changes, maps with another version are built
+# again. Sites with depths more than NODE_MAP_DEPTH_TOLERANCE meters apart on
+# two grids are flagged by ADCIRC_Node_Map.py
+NODE_MAP_FILE = 'node_map.json'
+NODE_MAP_VERSION = 1
+NODE_MAP_GRIDS = ['nc6b', 'hsofs']
+NODE_MAP_DEPTH_TOLERANCE = 2.0
+loaded_node_maps = {}
+
+# Element locators (see build_element_locator()) are only kept in memory.
+# Elements that would be listed in more than LOCATOR_MAX_CELLS cells of the
+# locator are checked for every point instead
+LOCATOR_MAX_CELLS = 64
+loaded_locators = {}
+
+# THREDDS catalog pages are cached in memory and in this folder. Catalogs
+# are checked with the server again after CATALOG_TTL seconds, except for
+# model runs that are more than two days old since those don't change anymore.
+# The number of files on disk is counted once per process and kept track of
+# in catalog_disk_counts (one count per cache folder)
+CATALOG_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog_cache')
+CATALOG_TTL = 15 * 60
+CATALOG_MEMORY_ENTRIES = 1024
+CATALOG_DISK_ENTRIES = 50000
+CATALOG_TIMEOUT = 60
+catalog_cache = OrderedDict()
+catalog_disk_counts = {}
+catalog_lock = threading.Lock()
+
+# Where the model runs are on the server
+CATALOG_ROOT = 'http://tds.renci.org:8080/thredds/catalog/daily/nam/'
+DODS_ROOT = 'http://tds.renci.org:8080/thredds/dodsC/daily/nam/'
+
+# Every model run found on the server is stored in this SQLite file
+# by build_cycle_index() (see ADCIRC_Cycle_Index.py)
+CYCLE_INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cycle_index.sqlite')
+
+# Whole files can be downloaded from here (used to make a local mirror).
+# These are plain HTTP downloads (no netCDF), MIRROR_DOWNLOADS of them are
+# made at the same time. CAN BE CHANGED !!
+FILESERVER_ROOT = 'http://tds.renci.org:8080/thredds/fileServer/daily/nam/'
+MIRROR_DOWNLOADS = 3
+
+# The roots of every server url the scripts use. When a local mirror is used
+# (see use_mirror()) anything after one of these roots is read from the mirror
+SERVER_ROOTS = [DODS_ROOT, CATALOG_ROOT, FILESERVER_ROOT, 'http://opendap.renci.org:1935/thredds/dodsC/daily/nam/']
+
+# The file every variable is stored in on the server
+VARIABLE_FILES = {
+    'swan_HS': 'swan_HS.63.nc',
+    'swan_TPS': 'swan_TPS.63.nc',
+    'zeta': 'fort.63.nc',
+    'swan_HS_max': 'swan_HS_max.63.nc',
+    'swan_TPS_max': 'swan_TPS_max.63.nc',
+    'zeta_max': 'maxele.63.nc',
+}
+
+# How many catalog.xml files the crawler downloads at the same time
+CATALOG_CONCURRENCY = 16
+
+# The order to pick grids in when a model run has more than one
+GRID_PREFERENCE = ['nc6b', 'hsofs']
+
+# Pieces of variables downloaded from the server (slabs) for model runs that are
+# finished are stored in this folder so they don't have to be downloaded again.
+# The least recently used slabs are removed when the folder is bigger than
+# SLAB_CACHE_BYTES. Set SLAB_CACHE_BYTES to 0 to turn the cache off
+SLAB_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'slab_cache')
+SLAB_CACHE_BYTES = 20 * 1024 ** 3
+slab_cache_stats = {'hits': 0, 'misses': 0, 'bytes_from_cache': 0, 'bytes_downloaded': 0}
+slab_cache_state = {'size': None}
+slab_cache_lock = threading.Lock()
+
+# How long (wall time), how many bytes were downloaded, and how many values
+# were handled by every stage (span) of a model run are written as one JSON line
+# per model run to a metrics file. Turn this on with use_metrics() or by setting
+# the ADCIRC_METRICS_FILE environment variable. When it is off the spans do
+# nothing. Multiday runs also print a progress line every PROGRESS_INTERVAL seconds
+PROGRESS_INTERVAL = 10
+metrics_state = {'file': os.environ.get('ADCIRC_METRICS_FILE') or None, 'cycle': None,
+                 'started': None, 'last_progress': 0.0}
+metrics_spans = {}
+metrics_lock = threading.Lock()
+
+# The output files have one row per node per time step (a "long" table) with
+# these columns. The formats that can be written and their file extensions
+# are in OUTPUT_EXTENSIONS. Rows are written OUTPUT_BLOCK_ROWS at a time
+OUTPUT_COLUMNS = ['cycle', 'cast', 'time', 'site', 'node', 'depth', 'elevation', 'hs', 'tp', 'lon', 'lat']
+OUTPUT_EXTENSIONS = {'csv': 'csv', 'parquet': 'parquet', 'netcdf': 'nc'}
+OUTPUT_BLOCK_ROWS = 200000
+
+# Units, long name, and CF standard name (None if there isn't one) of the number columns
+OUTPUT_VARIABLES = {
+    'node': ('1', 'mesh node ID', None),
+    'depth': ('m', 'depth of the node', None),
+    'elevation': ('m', 'water surface elevation', 'water_surface_height_above_reference_datum'),
+    'hs': ('m', 'significant wave height', 'sea_surface_wave_significant_height'),
+    'tp': ('s', 'peak wave period', 'sea_surface_wave_period_at_variance_spectral_density_maximum'),
+    'lon': ('degrees_east', 'longitude', 'longitude'),
+    'lat': ('degrees_north', 'latitude', 'latitude'),
+}
+
+# The wells (or any other sites) to pull out of the model runs, see load_sites().
+# The name of each site is the "site" in the output files. The orientation is
+# the general shoreline orientation of the beach the site is on
+SITES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sites.csv')
+SITE_ORIENTATIONS = ['EW', 'NS', 'DIAG']
+
+# The status of every model run in a multiday run is kept in a checkpoint file
+# next to the output file so a run that stops can be picked up where it left
+# off. The statuses from the download functions are stored as these. Model
+# runs that failed are tried again when the run is resumed, model runs that
+# aren't on the server are not
+CHECKPOINT_VERSION = 1
+CHECKPOINT_STATUSES = {'good': 'done', 'fail': 'failed', 'missing': 'missing'}
+CHECKPOINT_RETRY = ['failed']
+
+# One HTTP session (with a pool of kept-alive connections) per process
+http_sessions = {}
+
+
 def listFD(url):
     """
-    Return folders from a URL
+    Return folders from a URL. The links are cached (see fetch_catalog())
 
     https://stackoverflow.com/questions/11023530/python-to-list-http-files-and-directories
     """
-    page = requests.get(url).text
-    soup = BeautifulSoup(page, 'html.parser')
-    return [url + '/' + node.get('href') for node in soup.find_all('a')]
+    with span('catalog lookup'):
+
+        # A local mirror lists the folders on disk instead
+        if mirror_dir() is not None and mirror_path(url) is not None:
+            folder = os.path.dirname(mirror_path(url))
+            if not os.path.isdir(folder):
+                return []
+            return [url + '/' + name + '/catalog.html' for name in sorted(os.listdir(folder))]
+
+        return [url + '/' + href for href in fetch_catalog(url)]
+
+
+def use_mirror(folder):
+    """
+    Read the model runs from a local mirror (see ADCIRC_Mirror_Data.py) instead
+    of the server. Set folder to None to go back to the server. This can also be
+    done by setting the ADCIRC_MIRROR_DIR environment variable before running a script
+    """
+    if folder is None:
+        os.environ.pop('ADCIRC_MIRROR_DIR', None)
+    else:
+        os.environ['ADCIRC_MIRROR_DIR'] = os.path.abspath(folder)
+
+
+def mirror_dir():
+    """
+    Return the local mirror folder being used, or None if the server is used
+    """
+    return os.environ.get('ADCIRC_MIRROR_DIR') or None
+
+
+def mirror_path(url, folder=None):
+    """
+    Return where a server url is in the local mirror folder (by default the one
+    set with use_mirror()). Returns None if the url isn't under one of SERVER_ROOTS
+    """
+    folder = folder or mirror_dir()
+    for root in SERVER_ROOTS:
+        if url.startswith(root):
+            return os.path.join(folder, *url[len(root):].split('/'))
+    return None
+
+
+def resolve_data_url(url):
+    """
+    Return the local mirror file for a dataset url if a mirror is being used,
+    otherwise the url itself
+    """
+    if mirror_dir() is not None and mirror_path(url) is not None:
+        return mirror_path(url)
+    return url
+
+
+def get_http_session():
+    """
+    Return the HTTP session for this process. The session keeps its
+    connections to the server open so they can be reused between requests
+    """
+
+    pid = os.getpid()
+    if pid not in http_sessions:
+        session = requests.Session()
+        # Enough connections for the crawler and mirror threads
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(CATALOG_CONCURRENCY, MIRROR_DOWNLOADS))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        http_sessions[pid] = session
+
+    return http_sessions[pid]
+
+
+def catalog_is_final(url):
+    """
+    Check if the catalog url is for a model run (yyyymmddhh in the url) that is
+    more than two days old. Those catalogs don't change so they never expire
+    """
+    match = re.search(r'/(\d{10})(/|$)', url)
+    if match is None:
+        return False
+    try:
+        run_date = dt.datetime.strptime(match.group(1), '%Y%m%d%H')
+    except ValueError:
+        return False
+    return dt.datetime.utcnow() - run_date > dt.timedelta(days=2)
+
+
+def catalog_cache_file(url, cache_dir=CATALOG_CACHE_DIR):
+    """
+    Return the file a catalog url is cached in
+    """
+    return os.path.join(cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+
+def load_catalog_entry(url, cache_dir=CATALOG_CACHE_DIR):
+    """
+    Look up a catalog in the memory cache and then on disk. Returns a
+    dictionary with the hrefs, ETag, Last-Modified, and the time it was
+    fetched, or None if the catalog isn't cached
+    """
+
+    with catalog_lock:
+        if url in catalog_cache:
+            catalog_cache.move_to_end(url)
+            return catalog_cache[url]
+
+    fname = catalog_cache_file(url, cache_dir)
+    try:
+        with open(fname) as cache_file:
+            entry = json.load(cache_file)
+        # Touch the file so the least recently used files are removed first
+        os.utime(fname, None)
+    except (IOError, ValueError):
+        return None
+
+    remember_catalog_entry(url, entry)
+    return entry
+
+
+def remember_catalog_entry(url, entry):
+    """
+    Put a catalog entry in the memory cache, removing the least
+    recently used entries if there are too many
+    """
+    with catalog_lock:
+        catalog_cache[url] = entry
+        catalog_cache.move_to_end(url)
+        while len(catalog_cache) > CATALOG_MEMORY_ENTRIES:
+            catalog_cache.popitem(last=False)
+
+
+def save_catalog_entry(url, entry, cache_dir=CATALOG_CACHE_DIR):
+    """
+    Store a catalog entry in memory and on disk. If there are more than
+    CATALOG_DISK_ENTRIES files on disk, the least recently used are removed
+    (see trim_catalog_cache())
+    """
+
+    remember_catalog_entry(url, entry)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fname = catalog_cache_file(url, cache_dir)
+    is_new = not os.path.exists(fname)
+    temp_fname = '%s.%d.%d.tmp' % (fname, os.getpid(), threading.get_ident())
+    with open(temp_fname, 'w') as cache_file:
+        json.dump(dict(entry, url=url), cache_file)
+    os.replace(temp_fname, fname)
+
+    trim_catalog_cache(int(is_new), cache_dir)
+
+
+def trim_catalog_cache(added_files=0, cache_dir=CATALOG_CACHE_DIR):
+    """
+    Keep count of the files in the catalog cache folder and remove the least
+    recently used ones once there are more than CATALOG_DISK_ENTRIES (down to
+    90% of it). The folder is only listed the first time and when the count
+    goes over
+    """
+
+    with catalog_lock:
+        count = catalog_disk_counts.get(cache_dir)
+        if count is not None:
+            catalog_disk_counts[cache_dir] = count + added_files
+            if count + added_files <= CATALOG_DISK_ENTRIES:
+                return
+
+    # Look at what is actually on disk (other processes may be writing too)
+    cached_files = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.json'):
+            try:
+                cached_files.append((os.path.getmtime(os.path.join(cache_dir, name)), name))
+            except OSError:
+                pass
+
+    count = len(cached_files)
+    if count > CATALOG_DISK_ENTRIES:
+        for mtime, name in sorted(cached_files)[:count - int(CATALOG_DISK_ENTRIES * 0.9)]:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+                count -= 1
+            except OSError:
+                pass
+
+    with catalog_lock:
+        catalog_disk_counts[cache_dir] = count
+
+
+def fetch_catalog(url, cache_dir=CATALOG_CACHE_DIR):
+    """
+    Return the hrefs of the links on a THREDDS catalog page. The hrefs are cached
+    in memory and on disk. Once an entry is older than CATALOG_TTL the server is
+    asked if the page changed (using the ETag and Last-Modified headers) and the
+    cached hrefs are kept if it didn't. Catalogs for old model runs are never re-checked
+    """
+
+    entry = load_catalog_entry(url, cache_dir)
+    now = time.time()
+    if entry is not None and (catalog_is_final(url) or now - entry['fetched'] < CATALOG_TTL):
+        return entry['hrefs']
+
+    # Ask the server to only send the page if it changed
+    headers = {}
+    if entry is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    # 5xx errors and time outs are tried again (see with_retries())
+    def download():
+        response = get_http_session().get(url, headers=headers, timeout=CATALOG_TIMEOUT)
+        if response.status_code >= 500:
+            raise IOError(TRANSIENT_ERRORS[1], 'Server error %d for %s' % (response.status_code, url))
+        return response
+
+    with span('catalog download') as info:
+        response = with_retries(download, url)
+        info['bytes'] = len(response.content)
+    if response.status_code == 304 and entry is not None:
+        entry = dict(entry, fetched=now)
+        save_catalog_entry(url, entry, cache_dir)
+        return entry['hrefs']
+
+    soup = BeautifulSoup(response.text, 'html.parser')
+    hrefs = [node.get('href') for node in soup.find_all('a')]
+
+    # Only keep pages that actually loaded
+    if response.status_code == 200:
+        save_catalog_entry(url, {
+            'hrefs': hrefs,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched': now,
+        }, cache_dir)
+
+    return hrefs
+
+
+def parse_catalog_xml(chunks):
+    """
+    Parse a THREDDS catalog.xml document as it is downloaded (chunks are pieces
+    of the file as bytes). Returns (datasets, refs). Every dataset is a dictionary
+    with its name, urlPath, size (bytes, None if not listed), and modified time (the
+    string from the catalog). Every ref is a {'name', 'href'} dictionary for a
+    sub-catalog
+    """
+
+    thredds = '{http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0}'
+    xlink = '{http://www.w3.org/1999/xlink}'
+    units = {'bytes': 1, 'kbytes': 1e3, 'mbytes': 1e6, 'gbytes': 1e9, 'tbytes': 1e12}
+
+    parser = ET.XMLPullParser(events=('end',))
+    datasets, refs = [], []
+
+    def read_events():
+        for event, elem in parser.read_events():
+            tag = elem.tag.split('}')[-1]
+            if tag == 'catalogRef':
+                refs.append({'name': elem.get(xlink + 'title') or elem.get('name'),
+                             'href': elem.get(xlink + 'href')})
+            elif tag == 'dataset' and elem.get('urlPath'):
+                size = None
+                size_elem = elem.find(thredds + 'dataSize')
+                if size_elem is not None and size_elem.text:
+                    size = int(float(size_elem.text) * units.get((size_elem.get('units') or 'bytes').lower(), 1))
+                modified = None
+                for date_elem in elem.findall(thredds + 'date'):
+                    if date_elem.get('type') == 'modified':
+                        modified = date_elem.text
+                datasets.append({'name': elem.get('name'), 'urlPath': elem.get('urlPath'),
+                                 'size': size, 'modified': modified})
+                # Files don't have anything inside them that is needed later
+                elem.clear()
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        read_events()
+    parser.close()
+    read_events()
+
+    return datasets, refs
+
+
+def read_catalog_xml(location):
+    """
+    Download (or read, if location is a local file) a catalog.xml and parse it
+    with parse_catalog_xml(). A catalog that doesn't exist returns ([], []).
+    Time outs and 5xx errors are tried again (see with_retries())
+    """
+
+    if location.startswith(('http://', 'https://')):
+        def download():
+            response = get_http_session().get(location, stream=True, timeout=CATALOG_TIMEOUT)
+            try:
+                if response.status_code == 404:
+                    return [], []
+                if response.status_code >= 500:
+                    raise IOError(TRANSIENT_ERRORS[1], 'Server error %d for %s' % (response.status_code, location))
+                response.raise_for_status()
+                return parse_catalog_xml(response.iter_content(64 * 1024))
+            finally:
+                response.close()
+
+        return with_retries(download, location)
+
+    if not os.path.exists(location):
+        return [], []
+    with open(location, 'rb') as catalog_file:
+        return parse_catalog_xml(iter(lambda: catalog_file.read(64 * 1024), b''))
+
+
+def catalog_location(root, path):
+    """
+    Join a catalog path (i.e; '2018010100/hsofs/catalog.xml') onto the root,
+    which is either a url or a local folder of saved catalog.xml files
+    """
+    if root.startswith(('http://', 'https://')):
+        return urljoin(root, path)
+    return os.path.join(root, *path.split('/'))
+
+
+async def crawl_catalog_tree(root, path, semaphore, depth=0, max_depth=6):
+    """
+    Read the catalog at path (relative to root) and every catalog below it
+    at the same time. No more catalogs than the semaphore allows are downloaded
+    at once. Returns the datasets from parse_catalog_xml() with the folder they
+    are in (relative to root) added as 'folder'
+    """
+
+    async with semaphore:
+        datasets, refs = await asyncio.to_thread(read_catalog_xml, catalog_location(root, path))
+
+    folder = posixpath.dirname(path)
+    for dataset in datasets:
+        dataset['folder'] = folder
+
+    # Follow the links to sub-catalogs, skipping links that leave the tree
+    if depth < max_depth:
+        children = [posixpath.normpath(posixpath.join(folder, ref['href'])) for ref in refs
+                    if ref['href'] and not ref['href'].startswith(('/', 'http://', 'https://'))]
+        # Let every sub-catalog finish before raising the first error
+        results = await asyncio.gather(*[crawl_catalog_tree(root, child, semaphore, depth + 1, max_depth)
+                                         for child in children if not child.startswith('..')],
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+            datasets += result
+
+    return datasets
+
+
+def list_catalog_dates(root=CATALOG_ROOT):
+    """
+    Return every model run (yyyymmddhh) in the top level daily/nam catalog
+    """
+    datasets, refs = read_catalog_xml(catalog_location(root, 'catalog.xml'))
+    dates = [ref['href'].split('/')[0] for ref in refs if ref['href']]
+    return sorted(date for date in dates if re.match(r'^\d{10}$', date))
+
+
+def crawl_catalogs(dates, root=CATALOG_ROOT, max_concurrency=CATALOG_CONCURRENCY):
+    """
+    Crawl the catalog.xml tree of every model run (yyyymmddhh) in dates at the
+    same time. root is the daily/nam catalog url or a local folder with saved
+    catalog.xml files in the same layout (i.e; 2018010100/catalog.xml)
+
+    Returns {date: datasets}, see crawl_catalog_tree(). The datasets are None
+    for a model run if one of its catalogs couldn't be read (after the retries,
+    see read_catalog_xml()) so the rest of the model runs are still crawled
+    """
+
+    async def crawl():
+        semaphore = asyncio.Semaphore(max_concurrency)
+        return await asyncio.gather(*[crawl_catalog_tree(root, date + '/catalog.xml', semaphore)
+                                      for date in dates], return_exceptions=True)
+
+    crawled = OrderedDict()
+    for date, result in zip(dates, asyncio.run(crawl())):
+        if isinstance(result, Exception):
+            print('Could not crawl %s: %s' % (date, result))
+            result = None
+        elif isinstance(result, BaseException):
+            raise result
+        crawled[date] = result
+
+    return crawled
+
+
+def read_time_length(url):
+    """
+    Return the number of time steps in an OPeNDAP dataset by reading its
+    (small) .dds description instead of opening the dataset. Returns None
+    if the dataset isn't there or doesn't have a time axis. Time outs and
+    5xx errors are tried again (see with_retries()) and raised if they don't
+    go away
+    """
+
+    def download():
+        response = get_http_session().get(url + '.dds', timeout=CATALOG_TIMEOUT)
+        if response.status_code >= 500:
+            raise IOError(TRANSIENT_ERRORS[1], 'Server error %d for %s' % (response.status_code, url))
+        return response
+
+    response = with_retries(download, url)
+    match = re.search(r'\[time = (\d+)\]', response.text)
+    if response.status_code != 200 or match is None:
+        return None
+    return int(match.group(1))
+
+
+def make_cycle_rows(date, datasets):
+    """
+    Turn the datasets crawled for one model run (yyyymmddhh) into a row for
+    every namforecast/nowcast folder. Each row is a dictionary with the date,
+    hour, grid, cast ('forecast'/'nowcast'), the folder path, the files in it,
+    and the number of time steps (None until read_cycle_times() fills it in)
+    """
+
+    folders = OrderedDict()
+    for dataset in datasets:
+        folder = dataset['folder'][len(date) + 1:]
+        if posixpath.basename(folder) in ['namforecast', 'nowcast']:
+            folders.setdefault(folder, []).append(dataset['name'])
+
+    rows = []
+    for folder, files in folders.items():
+        rows.append({
+            'date': date[:8],
+            'hour': date[8:],
+            'grid': folder.split('/')[0],
+            'cast': 'forecast' if posixpath.basename(folder) == 'namforecast' else 'nowcast',
+            'path': folder,
+            'files': files,
+            'num_times': None,
+        })
+
+    return rows
+
+
+def read_cycle_times(rows, max_concurrency=CATALOG_CONCURRENCY):
+    """
+    Fill in the number of time steps for the rows from make_cycle_rows()
+    using one of the time series files in each folder. The .dds files are
+    downloaded at the same time, up to max_concurrency at once.
+
+    Returns the model runs (yyyymmddhh) with a .dds file that couldn't be read
+    """
+
+    jobs = []
+    for row in rows:
+        time_files = [fname for fname in ['swan_HS.63.nc', 'fort.63.nc'] if fname in row['files']]
+        if time_files:
+            jobs.append((row, DODS_ROOT + row['date'] + row['hour'] + '/' + row['path'] + '/' + time_files[0]))
+
+    async def read_times():
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def read_time(url):
+            async with semaphore:
+                return await asyncio.to_thread(read_time_length, url)
+
+        return await asyncio.gather(*[read_time(url) for row, url in jobs], return_exceptions=True)
+
+    failed = set()
+    for (row, url), num_times in zip(jobs, asyncio.run(read_times())):
+        if isinstance(num_times, Exception):
+            print('Could not read the time steps of %s: %s' % (url, num_times))
+            failed.add(row['date'] + row['hour'])
+        elif isinstance(num_times, BaseException):
+            raise num_times
+        else:
+            row['num_times'] = num_times
+
+    return sorted(failed)
+
+
+def connect_cycle_index(index_file=CYCLE_INDEX_FILE):
+    """
+    Open the cycle index (making the tables if they don't exist yet)
+    """
+    connection = sqlite3.connect(index_file)
+    connection.execute("""CREATE TABLE IF NOT EXISTS cycles (
+        date TEXT, hour TEXT, grid TEXT, cast_type TEXT, path TEXT, files TEXT, num_times INTEGER,
+        PRIMARY KEY (date, hour, grid, cast_type))""")
+    connection.execute("""CREATE TABLE IF NOT EXISTS crawled (
+        cycle TEXT PRIMARY KEY, crawled_at REAL)""")
+    return connection
+
+
+def save_cycle(connection, date, rows):
+    """
+    Store the rows from make_cycle_rows() for a model run (yyyymmddhh) in the index.
+    The model run is marked as crawled even if it had no rows (it doesn't exist)
+    """
+    with connection:
+        connection.execute('DELETE FROM cycles WHERE date = ? AND hour = ?', (date[:8], date[8:]))
+        connection.executemany('INSERT INTO cycles VALUES (?, ?, ?, ?, ?, ?, ?)', [
+            (row['date'], row['hour'], row['grid'], row['cast'], row['path'],
+             json.dumps(row['files']), row['num_times']) for row in rows])
+        connection.execute('INSERT OR REPLACE INTO crawled VALUES (?, ?)', (date, time.time()))
+
+
+def build_cycle_index(dates=None, index_file=CYCLE_INDEX_FILE, with_times=True, refresh=False,
+                      root=CATALOG_ROOT, max_concurrency=CATALOG_CONCURRENCY):
+    """
+    Crawl the catalogs and store every model run in the SQLite cycle index.
+    dates is a list of yyyymmddhh strings, by default every model run in the
+    catalog is crawled. Model runs that are already in the index and more than
+    two days old are skipped unless refresh is True. root can be a local folder
+    of saved catalog.xml files (see crawl_catalogs()), the length of the time
+    axis is only read when crawling the server. Model runs with a catalog or
+    time axis that couldn't be read aren't stored, so they are crawled again
+    the next time
+
+    Returns the number of model runs crawled
+    """
+
+    if dates is None:
+        dates = list_catalog_dates(root)
+
+    connection = connect_cycle_index(index_file)
+    done = set(row[0] for row in connection.execute('SELECT cycle FROM crawled'))
+    if not refresh:
+        dates = [date for date in dates
+                 if date not in done or not catalog_is_final(CATALOG_ROOT + date + '/')]
+
+    crawled = crawl_catalogs(dates, root, max_concurrency)
+    cycles = OrderedDict((date, make_cycle_rows(date, crawled[date])) for date in dates
+                         if crawled[date] is not None)
+    if with_times and root.startswith(('http://', 'https://')):
+        for date in read_cycle_times([row for rows in cycles.values() for row in rows], max_concurrency):
+            del cycles[date]
+
+    # The index is only written to from here
+    for date, rows in cycles.items():
+        save_cycle(connection, date, rows)
+        print('Indexed %s (%d casts)' % (date, len(rows)))
+    for date in dates:
+        if date not in cycles:
+            print('%s was not indexed, it is crawled again the next time' % date)
+
+    connection.close()
+    return len(cycles)
+
+
+def lookup_cycle(date, cast='forecast', grid=None, index_file=CYCLE_INDEX_FILE):
+    """
+    Look up a model run (yyyymmddhh) in the cycle index without asking the server.
+
+    Returns (crawled, cycle). crawled is False if the model run isn't in the
+    index (so the server has to be checked). cycle is the row for the cast (see
+    make_cycle_rows()), using the grid given or the first one in GRID_PREFERENCE,
+    or None if the model run doesn't have that cast
+    """
+
+    if not os.path.exists(index_file):
+        return False, None
+
+    with span('cycle index lookup'):
+        connection = connect_cycle_index(index_file)
+        try:
+            if connection.execute('SELECT 1 FROM crawled WHERE cycle = ?', (date,)).fetchone() is None:
+                return False, None
+            rows = connection.execute(
+                'SELECT date, hour, grid, cast_type, path, files, num_times FROM cycles '
+                'WHERE date = ? AND hour = ? AND cast_type = ?', (date[:8], date[8:], cast)).fetchall()
+        finally:
+            connection.close()
+
+    cycles = [dict(zip(['date', 'hour', 'grid', 'cast', 'path', 'files', 'num_times'], row)) for row in rows]
+    for cycle in cycles:
+        cycle['files'] = json.loads(cycle['files'])
+    if grid is not None:
+        cycles = [cycle for cycle in cycles if cycle['grid'] == grid]
+    cycles.sort(key=lambda cycle: GRID_PREFERENCE.index(cycle['grid'])
+                if cycle['grid'] in GRID_PREFERENCE else len(GRID_PREFERENCE))
+
+    return True, (cycles[0] if cycles else None)
+
+
+def cycle_has_files(cycle, files):
+    """
+    Check that a cycle from lookup_cycle() exists, has all the files, and has time steps
+    """
+    return cycle is not None and cycle['num_times'] != 0 and all(fname in cycle['files'] for fname in files)
+
+
+def cycle_url(url_1, cycle, fname):
+    """
+    Make the url for a file in a cycle from lookup_cycle()
+    """
+    return url_1 + cycle['date'] + cycle['hour'] + '/' + cycle['path'] + '/' + fname
+
+
+def load_mirror_checksums(folder):
+    """
+    Read the checksums.sha256 file of a local mirror as {file path: sha256}
+    """
+    checksums = {}
+    fname = os.path.join(folder, 'checksums.sha256')
+    if os.path.exists(fname):
+        with open(fname) as checksum_file:
+            for line in checksum_file:
+                if line.strip():
+                    checksum, path = line.rstrip('\n').split('  ', 1)
+                    checksums[path] = checksum
+    return checksums
+
+
+def save_mirror_checksums(folder, checksums):
+    """
+    Write the checksums.sha256 file of a local mirror (same format as sha256sum)
+    """
+    fname = os.path.join(folder, 'checksums.sha256')
+    with open(fname + '.tmp', 'w') as checksum_file:
+        for path in sorted(checksums):
+            checksum_file.write('%s  %s\n' % (checksums[path], path))
+    os.replace(fname + '.tmp', fname)
+
+
+def file_checksum(fname):
+    """
+    Return the sha256 checksum of a file
+    """
+    checksum = hashlib.sha256()
+    with open(fname, 'rb') as data_file:
+        for chunk in iter(lambda: data_file.read(1024 * 1024), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def download_mirror_file(path, folder):
+    """
+    Download one file (path is relative to daily/nam, i.e;
+    2018010100/hsofs/.../namforecast/swan_HS.63.nc) into the mirror folder.
+    The file is checked against the size the server sent and only moved into
+    place once it is complete. Time outs, dropped or short downloads, and 5xx
+    errors are tried again (see with_retries()). Returns the sha256 checksum
+    of the file
+    """
+
+    url = FILESERVER_ROOT + path
+    fname = os.path.join(folder, *path.split('/'))
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+
+    def download():
+        checksum = hashlib.sha256()
+        num_bytes = 0
+        response = get_http_session().get(url, stream=True, timeout=CATALOG_TIMEOUT)
+        try:
+            if response.status_code >= 500:
+                raise IOError(TRANSIENT_ERRORS[1], 'Server error %d for %s' % (response.status_code, url))
+            response.raise_for_status()
+            with open(fname + '.part', 'wb') as data_file:
+                for chunk in response.iter_content(1024 * 1024):
+                    data_file.write(chunk)
+                    checksum.update(chunk)
+                    num_bytes += len(chunk)
+            expected = response.headers.get('Content-Length')
+        finally:
+            response.close()
+
+        if expected is not None and int(expected) != num_bytes:
+            os.remove(fname + '.part')
+            raise IOError(TRANSIENT_ERRORS[0], '%s: got %d bytes, expected %s' % (path, num_bytes, expected))
+        return checksum
+
+    checksum = with_retries(download, url)
+    os.replace(fname + '.part', fname)
+    return checksum.hexdigest()
+
+
+def mirror_cycles(dates, folder, variables=None, casts=('forecast', 'nowcast'), root=CATALOG_ROOT):
+    """
+    Copy the files for the model runs in dates (yyyymmddhh) from the server into a
+    local folder with the same layout as the server (i.e;
+    folder/2018010100/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_HS.63.nc).
+    variables is a list of variable names (see VARIABLE_FILES), by default every
+    variable is copied. Files already in the mirror with the right checksum are skipped.
+    root is where to find the catalogs (see crawl_catalogs())
+
+    Returns (the number of files downloaded, the paths of the files that
+    couldn't be downloaded). Running it again only tries the files that
+    aren't in the mirror yet
+    """
+
+    files = [VARIABLE_FILES[variable] for variable in (variables or VARIABLE_FILES)]
+    checksums = load_mirror_checksums(folder)
+
+    # Find the files on the server
+    paths = []
+    crawled = crawl_catalogs(dates, root)
+    for date in dates:
+        if crawled[date] is None:
+            print('Skipping %s, its catalogs could not be read' % date)
+            continue
+        for row in make_cycle_rows(date, crawled[date]):
+            if row['cast'] in casts:
+                paths += [date + '/' + row['path'] + '/' + fname for fname in files if fname in row['files']]
+
+    # Skip the files that are already in the mirror
+    todo = []
+    for path in paths:
+        fname = os.path.join(folder, *path.split('/'))
+        if path in checksums and os.path.exists(fname) and file_checksum(fname) == checksums[path]:
+            continue
+        todo.append(path)
+
+    # A file that fails (after the retries) doesn't stop the other files,
+    # the checksums of the files that did download are still stored
+    def download(path):
+        try:
+            return download_mirror_file(path, folder), None
+        except (IOError, RuntimeError) as error:
+            return None, error
+
+    failed = []
+    for block_start in range(0, len(todo), MIRROR_DOWNLOADS):
+        block = todo[block_start:block_start + MIRROR_DOWNLOADS]
+        results = run_concurrently([lambda path=path: download(path) for path in block], MIRROR_DOWNLOADS)
+        for path, (checksum, error) in zip(block, results):
+            if error is not None:
+                print('Could not mirror %s: %s' % (path, error))
+                failed.append(path)
+            else:
+                checksums[path] = checksum
+                print('Mirrored %s' % path)
+        save_mirror_checksums(folder, checksums)
+
+    return len(todo) - len(failed), failed
+
+
+def verify_mirror(folder):
+    """
+    Check every file in a local mirror against its checksum. Returns a list
+    of the files (paths relative to the folder) that are missing or changed
+    """
+    bad_paths = []
+    for path, checksum in sorted(load_mirror_checksums(folder).items()):
+        fname = os.path.join(folder, *path.split('/'))
+        if not os.path.exists(fname) or file_checksum(fname) != checksum:
+            bad_paths.append(path)
+    return bad_paths
 
 
 def find_nearest(array, value):
@@ -44,6 +1007,16 @@ def intro_prompt():
     print('follow the prompts below:\r\n')
 
 
+def yes_no(answer):
+    """
+    Turn a T/F answer from the command line into True or False. Pressing
+    enter is False (like it always was), anything else that doesn't start
+    with F (or N) is True
+    """
+    answer = answer.strip().upper()
+    return answer != '' and not answer.startswith(('F', 'N'))
+
+
 def set_date(known_node=False):
     """
     Have the user input the date and time to download data for
@@ -56,8 +1029,8 @@ def set_date(known_node=False):
     date = dt.datetime(int(Year), int(Month), int(Day), int(Hour))
     date = date.strftime('%Y%m%d%H')
     print('---------------------')
-    use_gmt = bool(input('Use GMT (T) or EST (F): '))
-    use_navd88 = bool(input('Use NAVD88 (T) or MSL (F): '))
+    use_gmt = yes_no(input('Use GMT (T) or EST (F): '))
+    use_navd88 = yes_no(input('Use NAVD88 (T) or MSL (F): '))
 
     if known_node:
         print('---------------------')
@@ -108,19 +1081,26 @@ def make_data_filename(date, gmt, navd, ext='csv'):
     return fname
 
 
-def finish_prompt(status, date_file_fname, bad_dates_log, adcirc_file):
+def finish_prompt(status, date_file_fname, bad_dates_log, output):
     """
     When the data is finished downloading, print out a message to the
     command line directing the user to the output files. Close the files
-    regardless of status, print the messages only if the status was good
+    regardless of status, print the messages only if the status was good.
+    output is the output file from open_output()
     """
     bad_dates_log.close()
-    adcirc_file.close()
+    close_output(output)
 
     if status == 'good':
         print('\r\n\r\nData is finished downloading')
         print('Data was stored in the file: %s\r\n' %(date_file_fname))
 
+    # Print how much data came from the slab cache
+    stats = slab_cache_info()
+    if stats['hits'] or stats['misses']:
+        print('Slab cache: %d hits, %d misses (%.1f MB from cache, %.1f MB downloaded)\r\n' %
+              (stats['hits'], stats['misses'], stats['bytes_from_cache'] / 1e6, stats['bytes_downloaded'] / 1e6))
+
 
 def make_adcirc_date():
     """
@@ -165,7 +1145,8 @@ def make_adcirc_date():
 
 def load_bounding_box():
     """
-    Loads the bounding box variables
+    Loads the bounding box variables. Every node inside the box is searched
+    for the sites (see get_box())
     """
 
     bottom_lat = 32.942688  # 34.206229
@@ -177,124 +1158,435 @@ def load_bounding_box():
     return bottom_lat, upper_lat, left_lon, right_lon
 
 
-def adcirc_data_download(date):
+def use_metrics(fname):
     """
-    Go into the OpenDAP server and get date for the specified date
+    Write the metrics for every model run to fname (a JSON lines file, one
+    line is added per model run). Set fname to None to turn the metrics off
     """
-    url_1 = 'http://opendap.renci.org:1935/thredds/dodsC/daily/nam/'
-    url_2 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_HS_max.63.nc'
-    url_3 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_TPS_max.63.nc'
-    url_4 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/maxele.63.nc'
-    # url_1= website
-    # url_2= significant wave height (sawn_Hs_max)
-    # url_3= peak period (swan_TPS_max)
-    # url_4 = Elevation
-    # add in URL from file if add new variable
-    
-    # trying to make earielr dates work-keep#
-    # if date eariler than 8/3/2017 then will use these website links
-    test_date=dt.datetime(2017, 8, 3, 00)
-    cur_date=dt.datetime.strptime(date, "%Y%m%d%H")
-
-    except_dates = [dt.datetime(2017,9,15,00)]
+    if fname is None:
+        os.environ.pop('ADCIRC_METRICS_FILE', None)
+    else:
+        fname = os.path.abspath(fname)
+        os.environ['ADCIRC_METRICS_FILE'] = fname
+    metrics_state['file'] = fname
 
-    # This is a list of dates that have an hsofs URL but come after the test_date. You can add/remove dates
-    # from this list by adding another element (separate with a comma) to the list "dt.datetime(year,month,day,hour)"
-    if cur_date<test_date and cur_date not in except_dates:
-        url_2 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_HS_max.63.nc'
-        url_3 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_TPS_max.63.nc'
-        url_4 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/maxele.63.nc'
-    
-    tp_url = url_1 + date + url_3
-    hs_url = url_1 + date + url_2
-    z_url = url_1 + date + url_4
-    #add new url for new variable here 
 
+@contextlib.contextmanager
+def timed_span(name):
+    """
+    Time the code inside the with-statement and add it to the totals for
+    name. The code can add to the 'bytes' and 'values' of the yielded dictionary
+    """
+    info = {'bytes': 0, 'values': 0}
+    start = time.perf_counter()
     try:
-        # Return the dataset from the netCDF file
-        hs_data = nc.Dataset(hs_url, 'r')
-        tp_data = nc.Dataset(tp_url, 'r')
-        z_data = nc.Dataset(z_url, 'r')
-        status="good" 
-        #add in new dataset here
-        
-    except IOError:
-        hs_data=0
-        tp_data=0
-        z_data=0
-        status="fail"
-        #add new variable here and set equal to 0
+        yield info
+    finally:
+        elapsed = time.perf_counter() - start
+        with metrics_lock:
+            totals = metrics_spans.setdefault(name, {'count': 0, 'seconds': 0.0, 'bytes': 0, 'values': 0})
+            totals['count'] += 1
+            totals['seconds'] += elapsed
+            totals['bytes'] += int(info['bytes'])
+            totals['values'] += int(info['values'])
+
+
+def span(name):
+    """
+    Measure one stage of a model run, use as:
 
-    return hs_data, tp_data, z_data, status
+        with span('read swan_HS') as info:
+            Hs = hs_data['swan_HS'][:]
+            info['bytes'] = Hs.nbytes
+
+    Spans run in threads at the same time are all counted so the seconds of
+    the spans can add up to more than the wall time of the model run
+    """
+    if metrics_state['file'] is None:
+        return contextlib.nullcontext({'bytes': 0, 'values': 0})
+    return timed_span(name)
 
 
-def find_search_indexes(left_lon, right_lon, x):
+def start_cycle_metrics(date):
     """
-    Loop through the x and y coordinates and return the indexes for
-    the first and last nodes in the study area
+    Start measuring a model run (yyyymmddhh), this clears the span totals
     """
+    if metrics_state['file'] is None:
+        return
+    with metrics_lock:
+        metrics_spans.clear()
+    metrics_state['cycle'] = date
+    metrics_state['started'] = time.time()
 
-    # Make arrays of the x and y values-easier to do math
-    #finds nodes within your box
-    #do not change 
-    x_array = np.asarray(x)
 
-    # Find the start index
-    start_vals = abs(left_lon - x_array)
-    start = np.nanmax(np.where(start_vals == np.nanmin(start_vals)))
+def finish_cycle_metrics():
+    """
+    Return the metrics for the model run since start_cycle_metrics() as a
+    dictionary, or None if the metrics are off
+    """
+    if metrics_state['file'] is None or metrics_state['started'] is None:
+        return None
+    with metrics_lock:
+        spans = {name: dict(totals) for name, totals in metrics_spans.items()}
+    record = {
+        'cycle': metrics_state['cycle'],
+        'pid': os.getpid(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(metrics_state['started'])),
+        'seconds': time.time() - metrics_state['started'],
+        'bytes': sum(totals['bytes'] for totals in spans.values()),
+        'spans': spans,
+    }
+    metrics_state['started'] = None
+    return record
 
-    # Find the end index
-    end_vals = abs(right_lon - x_array)
-    end = np.nanmax(np.where(end_vals == np.nanmin(end_vals)))
 
-    return start, end
+def write_metrics(record):
+    """
+    Add a record from finish_cycle_metrics() to the metrics file as one line
+    """
+    if record is None or metrics_state['file'] is None:
+        return
+    with open(metrics_state['file'], 'a') as metrics_file:
+        metrics_file.write(json.dumps(record) + '\n')
 
 
-def x_y_refine(x, y, start, end):
+def show_progress(done, total, start_time, fetched_bytes, force=False):
     """
-    Take the x and y vectors and return only values between "start" and "end"
+    Print how far along a multiday run is (cycles/minute, MB/s, and the time
+    left). The line is printed at most once every PROGRESS_INTERVAL seconds
+    unless force is True
     """
+    now = time.time()
+    if not force and now - metrics_state['last_progress'] < PROGRESS_INTERVAL:
+        return
+    metrics_state['last_progress'] = now
 
-    if start > end:
-        temp = start
-        start = end
-        end = temp
+    elapsed = max(now - start_time, 1e-6)
+    rate = done / elapsed
+    eta = dt.timedelta(seconds=int((total - done) / rate)) if rate > 0 else '?'
+    print('Progress: %d of %d model runs | %.1f cycles/min | %.2f MB/s | ETA %s' %
+          (done, total, 60 * rate, fetched_bytes / 1e6 / elapsed, eta))
+
+
+def run_concurrently(jobs, max_workers):
+    """
+    Run a list of functions (that take no arguments) at the same time using
+    a pool of threads and return their results in the same order as the jobs.
+    Only for plain HTTP downloads, the netCDF library can't be used from
+    more than one thread
+    """
+
+    if max_workers <= 1 or len(jobs) <= 1:
+        return [job() for job in jobs]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+        futures = [pool.submit(job) for job in jobs]
+    return [future.result() for future in futures]
+
+
+def classify_error(error):
+    """
+    Return 'missing' if an error from the server means the file isn't on the
+    server or 'fail' for anything else. Model runs that fail are tried again
+    at the end of a multiday run, missing ones are not
+    """
+    if getattr(error, 'errno', None) in PERMANENT_ERRORS or 'file not found' in str(error):
+        return 'missing'
+    return 'fail'
+
+
+def is_transient(error):
+    """
+    Check if an error can go away if it is tried again: the netCDF errors in
+    TRANSIENT_ERRORS (or their messages, netCDF4 raises a RuntimeError without
+    an error code when reading a variable fails), time outs, dropped
+    connections, and 5xx errors from the server
+    """
+    if isinstance(error, (requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                          TimeoutError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500
+    if getattr(error, 'errno', None) in TRANSIENT_ERRORS:
+        return True
+    return any(message in str(error) for message in TRANSIENT_MESSAGES)
+
+
+def breaker_check(host):
+    """
+    Raise an IOError if the circuit breaker for a server is open (too many
+    failures in a row, see BREAKER_FAILURES). Once the breaker has been open
+    for BREAKER_COOLDOWN seconds one call is let through to test the server
+    (half-open), the other calls are turned away until it reports back with
+    breaker_record()
+    """
+    with breaker_lock:
+        breaker = breakers.get(host)
+        if breaker is None or not breaker['open_until']:
+            return
+        now = time.time()
+        if breaker['open_until'] > now:
+            raise IOError(TRANSIENT_ERRORS[0], 'Too many failures, %s is left alone for a while' % host)
+
+        # This call tests the server. The breaker stays open for everyone
+        # else, if the test never reports back another one is let through
+        # after BREAKER_COOLDOWN
+        breaker['open_until'] = now + BREAKER_COOLDOWN
+        breaker['testing'] = True
+
+
+def breaker_record(host, ok):
+    """
+    Count a failure (ok is False) or close the breaker (ok is True) for a server.
+    The breaker opens when there are BREAKER_FAILURES failures in a row, or
+    straight away when the call testing the server fails (see breaker_check()).
+
+    Returns True if the breaker is open
+    """
+    with breaker_lock:
+        breaker = breakers.setdefault(host, {'failures': 0, 'open_until': 0, 'testing': False})
+        if ok:
+            breaker.update(failures=0, open_until=0, testing=False)
+        else:
+            breaker['failures'] += 1
+            if breaker['testing'] or breaker['failures'] >= BREAKER_FAILURES:
+                breaker.update(failures=0, open_until=time.time() + BREAKER_COOLDOWN, testing=False)
+        return breaker['open_until'] > time.time()
+
+
+def with_retries(function, url):
+    """
+    Call function() (something that talks to the server at url) and return
+    what it returns. Errors that can go away (see is_transient()) are tried
+    again RETRY_ATTEMPTS times with a growing wait between tries, and count
+    towards the server's circuit breaker. Raises the last error if every try
+    fails. Any other error is raised straight away, and so is the error if the
+    breaker is open (or opens). Local files (the mirror) are not tried again
+    """
+
+    host = urlsplit(url).netloc
+    if host:
+        breaker_check(host)
+
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            result = function()
+        except (IOError, RuntimeError) as error:
+            if not host:
+                raise
+            if not is_transient(error):
+                # The server answered if the file isn't there
+                if classify_error(error) == 'missing':
+                    breaker_record(host, True)
+                raise
+            if breaker_record(host, False) or attempt == RETRY_ATTEMPTS - 1:
+                raise
+
+            # Wait longer every time, with a little randomness so the
+            # processes don't all try again at the same time
+            wait = min(RETRY_MAX_WAIT, RETRY_WAIT * 2 ** attempt)
+            time.sleep(wait * random.uniform(0.5, 1.0))
+        else:
+            if host:
+                breaker_record(host, True)
+            return result
+
+
+def open_remote_dataset(location):
+    """
+    Open a netCDF dataset. If the server fails to send the attributes (the
+    .das request) netCDF still opens the dataset, but without the fill values
+    and base_date, so that is raised as an error that can go away
+    """
+    data = nc.Dataset(location, 'r')
+    if urlsplit(location).netloc and not any(var.ncattrs() for var in data.variables.values()):
+        data.close()
+        raise IOError(TRANSIENT_ERRORS[1], 'The server did not send the attributes of %s' % location)
+    return data
+
+
+def open_dataset(url):
+    """
+    Open a url as a netCDF dataset (from the mirror if one is used), trying
+    again if the server has a hiccup (see with_retries()). Urls that aren't
+    on the server are remembered and not tried again
+    """
+
+    if url in missing_urls:
+        raise IOError(PERMANENT_ERRORS[0], 'Not on the server: %s' % url)
+
+    location = resolve_data_url(url)
+    try:
+        return with_retries(lambda: open_remote_dataset(location), location)
+    except IOError as error:
+        if classify_error(error) == 'missing':
+            missing_urls.add(url)
+        raise
+
+
+def open_datasets(urls):
+    """
+    Open all the urls as netCDF datasets one after the other (see open_dataset()).
+    If any of them can't be opened, the ones that did open are closed and the
+    IOError is raised. If a local mirror is being used (see use_mirror()) the
+    files are opened from the mirror
+
+    The datasets are opened (and read) one at a time because the netCDF-C
+    library is not thread-safe, two threads in it at once can fail with
+    "NetCDF: Not a valid ID" or crash. The multiday scripts download several
+    model runs at the same time with their process pool instead
+    """
+
+    datasets = []
+    with span('open datasets') as info:
+        info['values'] = len(urls)
+        try:
+            for url in urls:
+                datasets.append(open_dataset(url))
+        except IOError:
+            for dataset in datasets:
+                dataset.close()
+            raise
+
+    return datasets
+
+
+def adcirc_data_download(date):
+    """
+    Go into the OpenDAP server and get date for the specified date
+    """
+    url_1 = 'http://opendap.renci.org:1935/thredds/dodsC/daily/nam/'
+    url_2 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_HS_max.63.nc'
+    url_3 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_TPS_max.63.nc'
+    url_4 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/maxele.63.nc'
+    # url_1= website
+    # url_2= significant wave height (sawn_Hs_max)
+    # url_3= peak period (swan_TPS_max)
+    # url_4 = Elevation
+    # add in URL from file if add new variable
+    
+    # trying to make earielr dates work-keep#
+    # if date eariler than 8/3/2017 then will use these website links
+    test_date=dt.datetime(2017, 8, 3, 00)
+    cur_date=dt.datetime.strptime(date, "%Y%m%d%H")
+
+    except_dates = [dt.datetime(2017,9,15,00)]
+
+    # This is a list of dates that have an hsofs URL but come after the test_date. You can add/remove dates
+    # from this list by adding another element (separate with a comma) to the list "dt.datetime(year,month,day,hour)"
+    if cur_date<test_date and cur_date not in except_dates:
+        url_2 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_HS_max.63.nc'
+        url_3 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_TPS_max.63.nc'
+        url_4 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/maxele.63.nc'
+    
+    tp_url = url_1 + date + url_3
+    hs_url = url_1 + date + url_2
+    z_url = url_1 + date + url_4
+    #add new url for new variable here 
+
+    # If the date is in the cycle index (see ADCIRC_Cycle_Index.py) use
+    # the grid it was run on instead of guessing from the date
+    files = ['swan_HS_max.63.nc', 'swan_TPS_max.63.nc', 'maxele.63.nc']
+    crawled, cycle = lookup_cycle(date, 'forecast')
+    if crawled and not cycle_has_files(cycle, files):
+        return 0, 0, 0, 'missing'
+    elif crawled:
+        hs_url, tp_url, z_url = [cycle_url(url_1, cycle, fname) for fname in files]
+
+    try:
+        # Return the dataset from the netCDF file
+        hs_data, tp_data, z_data = open_datasets([hs_url, tp_url, z_url])
+        status="good" 
+        #add in new dataset here
+        
+    except IOError as error:
+        hs_data=0
+        tp_data=0
+        z_data=0
+        status=classify_error(error)
+        #add new variable here and set equal to 0
+
+    return hs_data, tp_data, z_data, status
+
+
+def find_search_indexes(left_lon, right_lon, x):
+    """
+    Loop through the x and y coordinates and return the indexes for
+    the first and last nodes in the study area
+
+    No longer used by the download scripts (see get_box()). The nodes are not
+    numbered in order of longitude so the nodes between these indexes can
+    miss part of the box and take in nodes far outside of it
+    """
+
+    # Make arrays of the x and y values-easier to do math
+    #finds nodes within your box
+    #do not change 
+    x_array = np.asarray(x)
+
+    # Find the start index
+    start_vals = abs(left_lon - x_array)
+    start = np.nanmax(np.where(start_vals == np.nanmin(start_vals)))
+
+    # Find the end index
+    end_vals = abs(right_lon - x_array)
+    end = np.nanmax(np.where(end_vals == np.nanmin(end_vals)))
+
+    return start, end
+
+
+def x_y_refine(x, y, start, end):
+    """
+    Take the x and y vectors and return only values between "start" and "end"
+    """
+
+    if start > end:
+        temp = start
+        start = end
+        end = temp
 
     return x[start:end], y[start:end]
 
 
-def deep_water_nodes(depths, contour):
-    """ 
-    Find nodes nearest to the indicated countour 
+def deep_water_nodes(depths, contour, low_pad=0.5, high_pad=3):
+    """
+    Find nodes nearest to the indicated countour. Returns the depths and
+    the indexes (arrays) of the nodes at the contour
     """
 
     # Pad the contour by searching for all points within 0.5m. use_indexes will be the indexes of
     # the nodes at the contour, use_depths is the depths of the nodes at the contour.
-    # You can change "low_pad" and "high_pad" but there is no real reason to
-    low_pad = 0.5
-    high_pad = 3
-    search_low = contour - low_pad
-    search_lower = contour - high_pad
-    search_high = contour + low_pad
-    search_higher = contour + high_pad
-    use_depths = []
-    use_indexes = []
+    # You can change "low_pad" and "high_pad" but there is no real reason to.
+    # Missing depths are never at the contour
+    depths = np.ma.filled(np.ma.asarray(depths, dtype=float), np.nan)
 
     # Try looking for nodes within the +-0.5m range of the contour
-    for i in range(1, len(depths)):
-        if search_low < depths[i] < search_high:
-            use_depths.append(depths[i])
-            use_indexes.append(i)
+    with np.errstate(invalid='ignore'):
+        use_indexes = np.flatnonzero((depths > contour - low_pad) & (depths < contour + low_pad))
+
+        # If the provided lat/lon ranges do not contain any nodes at the
+        # 20m contour, expand the contour range and try again
+        if not len(use_indexes):
+            use_indexes = np.flatnonzero((depths > contour - high_pad) & (depths < contour + high_pad))
 
-    # If the provided lat/lon ranges do not contain any nodes at the
-    # 20m contour, expand the contour range and try again
-    if not use_depths:
-        for i in range(1, len(depths)):
-            if search_lower < depths[i] < search_higher:
-                    use_depths.append(depths[i])
-                    use_indexes.append(i)
+    return depths[use_indexes], use_indexes
 
-    return use_depths, use_indexes
+
+def contour_nodes(mesh, box, contour, low_pad=0.5, high_pad=3):
+    """
+    deep_water_nodes() for the mesh depths in a bounding box (see get_box()).
+    The indexes are positions in box['nodes']. These only change with the
+    mesh so they are worked out once per mesh, box, contour, and pads
+    """
+
+    key = (mesh['fingerprint']['checksum'], box['bounding_box'], float(contour), float(low_pad), float(high_pad))
+    found = loaded_contours.get(key)
+    if found is None:
+        with span('contour search') as info:
+            found = deep_water_nodes(mesh['depth'][box['nodes']], contour, low_pad, high_pad)
+            info['values'] = len(box['nodes'])
+        loaded_contours[key] = found
+    return found
 
 
 def finding_well_points_DEFUNCT(use_indexes, x, y):
@@ -329,425 +1621,2187 @@ def finding_well_points_DEFUNCT(use_indexes, x, y):
     return nodes_used
 
 
-def finding_well_points(use_indexes, x, y):
+def lon_lat_to_xyz(lon, lat):
+    """
+    Convert longitudes and latitudes (in degrees) into x/y/z coordinates
+    on a unit sphere. Straight line distances between these points increase
+    with the great-circle distance so they can be searched with a KD-tree
+    """
+    lon = np.radians(np.asarray(lon, dtype=float))
+    lat = np.radians(np.asarray(lat, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def build_node_tree(x, y):
+    """
+    Build a KD-tree over the mesh nodes. x and y are the node longitudes and
+    latitudes (i.e; hs_data['x'], hs_data['y'] or the refined box). Build this
+    once per grid and pass it to nearest_nodes() as many times as needed
+    """
+    return cKDTree(lon_lat_to_xyz(np.ma.filled(x, np.nan), np.ma.filled(y, np.nan)))
+
+
+def nearest_nodes(tree, lons, lats):
+    """
+    Find the nearest mesh node to every query point in one call. The tree
+    comes from build_node_tree(), lons and lats can be single values or lists
+
+    Returns the node indexes and the great-circle distances (km) as arrays
+    """
+    query = lon_lat_to_xyz(np.atleast_1d(lons), np.atleast_1d(lats))
+    chord, indexes = tree.query(query)
+
+    # The tree returns the straight line (chord) distance through the unit
+    # sphere, convert it back into a distance along the surface
+    dists = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+    return indexes, dists
+
+
+def load_sites(fname=SITES_FILE):
+    """
+    Load the sites (wells) to pull out of the model runs. The file can be:
+
+    - A .csv file with a header and the columns name, lon, lat, and orientation
+      (EW, NS, or DIAG). The columns nc6b_lon and nc6b_lat are optional, they
+      are the location of the node used for the site on the nc6b grid (see
+      hsofs_node_find()). Leave them blank to use the site's lon and lat
+    - A .geojson file with a Point feature for every site, the name and
+      orientation (and nc6b_lon/nc6b_lat) are in the properties of the feature
+
+    Returns a dictionary of lists/arrays with one value per site
+    """
+
+    if fname.lower().endswith(('.geojson', '.json')):
+        with open(fname) as sites_file:
+            features = json.load(sites_file)['features']
+        rows = []
+        for feature in features:
+            row = dict(feature['properties'])
+            row['lon'], row['lat'] = feature['geometry']['coordinates'][:2]
+            rows.append(row)
+    else:
+        with open(fname, newline='') as sites_file:
+            rows = [row for row in csv.DictReader(sites_file) if any(row.values())]
+
+    def column(name):
+        # Blank (or missing) values are NaN
+        values = [row.get(name) for row in rows]
+        return np.array([np.nan if value in (None, '') else float(value) for value in values])
+
+    sites = {
+        'name': [str(row['name']).strip() for row in rows],
+        'lon': column('lon'),
+        'lat': column('lat'),
+        'orientation': [str(row['orientation']).strip().upper() for row in rows],
+        'nc6b_lon': column('nc6b_lon'),
+        'nc6b_lat': column('nc6b_lat'),
+    }
+
+    # Check the file before any data is downloaded
+    if not rows:
+        raise ValueError('There are no sites in %s' % fname)
+    if len(set(sites['name'])) != len(rows):
+        raise ValueError('Every site in %s needs a different name' % fname)
+    if np.isnan(sites['lon']).any() or np.isnan(sites['lat']).any():
+        raise ValueError('Every site in %s needs a lon and lat' % fname)
+    for name, orientation in zip(sites['name'], sites['orientation']):
+        if orientation not in SITE_ORIENTATIONS:
+            raise ValueError('The orientation of %s in %s is %s, it should be one of %s' %
+                             (name, fname, orientation, ', '.join(SITE_ORIENTATIONS)))
+
+    return sites
+
+
+def site_settings(sites):
+    """
+    Return the sites as plain lists (i.e; to store in a checkpoint)
+    """
+    return [sites['name'], sites['lon'].tolist(), sites['lat'].tolist(), sites['orientation']]
+
+
+def nearest_values(values, targets):
+    """
+    Find the position of the value closest to every target in one call
+    (NaN values are never picked). The values are sorted once and every
+    target is looked up with a binary search
+    """
+
+    finite = np.flatnonzero(~np.isnan(values))
+    order = finite[np.argsort(values[finite], kind='stable')]
+    sorted_values = values[order]
+    if len(order) == 1:
+        return np.full(len(targets), order[0])
+
+    # The closest value is either the one just above or just below the target
+    above = np.clip(np.searchsorted(sorted_values, targets), 1, len(order) - 1)
+    below = above - 1
+    use_above = np.abs(sorted_values[above] - targets) < np.abs(sorted_values[below] - targets)
+
+    return order[np.where(use_above, above, below)]
+
+
+def finding_well_points(use_indexes, x, y, sites=None):
+    """
+    Match every site (see load_sites()) to a node. X = long Y = lat.
+    All the sites with the same orientation are matched at once
+
+    Only the nodes in use_indexes (the nodes at the depth contour) are searched.
+    The returned nodes are indexes into x and y (not into use_indexes) so
+    they can be used directly on the depth, Hs, Tp, and elevation arrays.
+    Two sites can be matched to the same node
+    """
+
+    # Add new well locations to the sites file (sites.csv)
+    if sites is None:
+        sites = load_sites()
+    orientation = np.asarray(sites['orientation'])
+
+    # Pull out the coordinates of the nodes at the contour
+    use_indexes = np.asarray(use_indexes, dtype=int)
+    contour_x = np.ma.filled(np.asarray(x, dtype=float)[use_indexes], np.nan)
+    contour_y = np.ma.filled(np.asarray(y, dtype=float)[use_indexes], np.nan)
+
+    positions = np.zeros(len(orientation), dtype=int)
+
+    # If the orientation is EW than match the node that has the closest x-coordinate
+    # to that of the well. This function only considers nodes at the appropriate depth
+    # contour so the one at a similar x-coordinate should be good
+    ew = orientation == 'EW'
+    if ew.any():
+        positions[ew] = nearest_values(contour_x, sites['lon'][ew])
+
+    # If the orientation is NS than match the node that has the closest y-coordinate
+    # to that of the well
+    ns = orientation == 'NS'
+    if ns.any():
+        positions[ns] = nearest_values(contour_y, sites['lat'][ns])
+
+    # Setting the orientation to EW or NS will find a node in a straight X/Y line from the well, by
+    # setting the orientation to DIAG, the node with the shortest great-circle distance
+    # to the well is used. Only build the KD-tree if a well actually needs it
+    diag = orientation == 'DIAG'
+    if diag.any():
+        tree = build_node_tree(contour_x, contour_y)
+        positions[diag], dists = nearest_nodes(tree, sites['lon'][diag], sites['lat'][diag])
+
+    # Convert the positions in the contour nodes back into nodes in the box
+    return [int(node) for node in use_indexes[positions]]
+
+
+def daterange(start_date, end_date):
+    for n in range(int ((end_date - start_date).days)):
+        yield start_date + dt.timedelta(n)
+     #figuring out the start and end dates --yielding how many days in range
+     #n is adding days 
+
+
+def make_cycles(start_date, end_date, hours):
+    """
+    Make a list of every model run (as yyyymmddhh strings) between the
+    start and end date for the hours given (i.e; ['00', '12'])
+    """
+    return [date.strftime('%Y%m%d') + hour for date in daterange(start_date, end_date) for hour in hours]
+
+
+def call_cycle_worker(job):
+    """
+    Unpack a (worker, arguments) job for run_cycles(). This has to be a
+    function in this file so the worker processes can find it. Returns the
+    worker's result and the metrics for the model run (None if they are off)
+    """
+    worker, args = job
+    start_cycle_metrics(args[0])
+    result = worker(*args)
+    return result, finish_cycle_metrics()
+
+
+def cycle_failed(result):
+    """
+    Return True if a cycle worker (i.e; extract_max_cycle()) failed with an
+    error that might go away, the (date, status, ...) result has a "fail" status
+    """
+    return result[1] == 'fail'
+
+
+def run_cycles(worker, cycles, num_workers=1, retry=None):
+    """
+    Run worker(*args) for every args tuple in cycles using a pool of num_workers
+    processes. The results come back in the same order as cycles as soon as that
+    cycle (and every cycle before it) is done, so the output can be written while
+    later cycles are still downloading and it will be in the same order as a
+    one-at-a-time run. No more than num_workers * CYCLES_AHEAD cycles are started
+    ahead of the one being waited for. With num_workers=1 the cycles are run one
+    at a time
+
+    If retry is given (i.e; cycle_failed()), cycles that retry(result) is True
+    for are put in a queue instead of being returned and are run again at the
+    end (RETRY_ROUNDS times, see RETRY_ROUNDS_WAIT). The results of the cycles
+    after the first one in the queue are held back until then, and everything
+    is returned in the order of cycles once the retries are done
+
+    The worker has to be a function in this file so the processes can import it.
+    If the metrics are on (see use_metrics()) a line is added to the metrics
+    file for every model run and a progress line is printed every so often
+    """
+
+    # The queue and the held back results have the index of their cycle
+    queue, held = [], {}
+    for index, (args, result) in enumerate(run_cycle_jobs(worker, cycles, num_workers)):
+        if retry is not None and retry(result):
+            queue.append((index, args, result))
+        elif queue:
+            held[index] = result
+        else:
+            yield result
+
+    for round_num in range(RETRY_ROUNDS):
+        if not queue:
+            break
+        print('\r\nTrying %d model runs again in %d seconds\r\n' % (len(queue), RETRY_ROUNDS_WAIT))
+        time.sleep(RETRY_ROUNDS_WAIT)
+
+        last_round = round_num == RETRY_ROUNDS - 1
+        indexes, cycles = [index for index, args, result in queue], [args for index, args, result in queue]
+        queue = []
+        for index, (args, result) in zip(indexes, run_cycle_jobs(worker, cycles, num_workers)):
+            if retry(result) and not last_round:
+                queue.append((index, args, result))
+            else:
+                held[index] = result
+
+    for index, args, result in queue:
+        held[index] = result
+    for index in sorted(held):
+        yield held[index]
+
+
+def run_cycle_jobs(worker, cycles, num_workers=1):
+    """
+    Run the cycles for run_cycles() and return (args, result) for each one in order
+    """
+
+    jobs = [(worker, args) for args in cycles]
+    with contextlib.ExitStack() as stack:
+        if num_workers <= 1:
+            results = map(call_cycle_worker, jobs)
+        else:
+            results = bounded_imap(stack.enter_context(mp.Pool(num_workers)), call_cycle_worker, jobs,
+                                   num_workers * CYCLES_AHEAD)
+
+        # The metrics come back with the results and are written here so
+        # only one process writes to the metrics file
+        start_time, fetched_bytes = time.time(), 0
+        for done, (result, record) in enumerate(results, 1):
+            if record is not None:
+                write_metrics(record)
+                fetched_bytes += record['bytes']
+                show_progress(done, len(jobs), start_time, fetched_bytes, force=(done == len(jobs)))
+            yield jobs[done - 1][1], result
+
+
+def bounded_imap(pool, function, jobs, max_ahead):
+    """
+    Like pool.imap(function, jobs), but only max_ahead jobs are handed to the
+    pool past the oldest job that isn't done yet (pool.imap starts all of
+    them and keeps every result until the ones before it are done)
+    """
+
+    jobs = iter(jobs)
+    pending = deque()
+    for job in jobs:
+        pending.append(pool.apply_async(function, (job,)))
+        if len(pending) >= max_ahead:
+            break
+
+    while pending:
+        result = pending.popleft().get()
+        for job in jobs:
+            pending.append(pool.apply_async(function, (job,)))
+            break
+        yield result
+
+
+def checkpoint_filename(output_fname):
+    """
+    Return the name of the checkpoint file for an output file
+    """
+    return output_fname + '.checkpoint.json'
+
+
+def output_position(output):
+    """
+    Write everything waiting in a .csv output file to the disk and return
+    the position (bytes) of the end of the file. For the other formats the
+    position is the number of rows
+    """
+    if output['format'] != 'csv':
+        return output['rows']
+
+    flush_output(output)
+    output['file'].flush()
+    os.fsync(output['file'].fileno())
+    return output['file'].tell()
+
+
+def new_checkpoint(settings, output):
+    """
+    Start a checkpoint for a multiday run. settings is a dictionary of
+    everything that has to be the same for the run to be resumed (i.e; the
+    dates and bounding box), output is the output file from open_output()
+    """
+    return {
+        'version': CHECKPOINT_VERSION,
+        'format': output['format'],
+        'settings': settings,
+        'header_offset': output_position(output),
+        'offset': output_position(output),
+        'cycles': OrderedDict(),
+    }
+
+
+def load_checkpoint(fname):
+    """
+    Read a checkpoint file. Returns None if there isn't one (or it is from
+    another version of the code)
+    """
+    try:
+        with open(fname) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file, object_pairs_hook=OrderedDict)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(fname, checkpoint):
+    """
+    Write the checkpoint file. It is written to a temporary file first and
+    then moved over the old one so a crash never leaves half a checkpoint
+    """
+    temp_fname = '%s.%d.tmp' % (fname, os.getpid())
+    with open(temp_fname, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=1)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temp_fname, fname)
+
+
+def segment_checksum(fname, start, end):
+    """
+    Return the sha256 checksum of bytes start to end of a file
+    """
+    checksum = hashlib.sha256()
+    with open(fname, 'rb') as data_file:
+        data_file.seek(start)
+        checksum.update(data_file.read(end - start))
+    return checksum.hexdigest()
+
+
+def record_cycle(checkpoint_fname, checkpoint, date, status, output):
+    """
+    Store the status of a model run in the checkpoint once its rows are
+    written to the output. For .csv output the end of the model run's rows
+    in the file and their checksum are stored too, so the file can be
+    checked and cut back to the last good model run when resuming
+    """
+
+    start = checkpoint['offset']
+    end = output_position(output)
+    entry = OrderedDict([('status', CHECKPOINT_STATUSES.get(status, 'failed')), ('offset', end)])
+    if output['format'] == 'csv':
+        entry['checksum'] = segment_checksum(output['fname'], start, end)
+
+    # A model run that is tried again moves to the end, where its rows are now
+    checkpoint['cycles'].pop(date, None)
+    checkpoint['cycles'][date] = entry
+    checkpoint['offset'] = end
+    save_checkpoint(checkpoint_fname, checkpoint)
+
+
+def resume_checkpoint(checkpoint, output_fname):
+    """
+    Check the rows of every finished model run in a .csv output file against
+    the checkpoint. Returns the position to resume writing the file at, the
+    end of the last model run whose rows (and every one before it) match.
+    Model runs after that are taken out of the checkpoint so they run again
+    """
+
+    if checkpoint['format'] != 'csv':
+        raise ValueError('Only .csv output files can be resumed, %s files can not be read '
+                         'after a crash' % checkpoint['format'])
+    if not os.path.exists(output_fname):
+        raise IOError('The output file %s is missing, it can not be resumed' % output_fname)
+
+    # The model runs are in the checkpoint in the order they were written
+    size = os.path.getsize(output_fname)
+    dates = list(checkpoint['cycles'])
+    position = checkpoint['header_offset']
+
+    good = 0
+    for date in dates:
+        entry = checkpoint['cycles'][date]
+        if entry['offset'] > size or segment_checksum(output_fname, position, entry['offset']) != entry['checksum']:
+            break
+        position = entry['offset']
+        good += 1
+
+    for date in dates[good:]:
+        del checkpoint['cycles'][date]
+    checkpoint['offset'] = position
+    return position
+
+
+def cycles_to_run(checkpoint, dates):
+    """
+    Return the model runs (yyyymmddhh) that still have to be run: the ones
+    that aren't in the checkpoint and the ones that failed
+    """
+    return [date for date in dates if date not in checkpoint['cycles'] or
+            checkpoint['cycles'][date]['status'] in CHECKPOINT_RETRY]
+
+
+def adcirc_full_data_download_OLD(date):
+    """
+    Go into the OpenDAP server and get date for the specified date
+    """
+    url_1 = 'http://opendap.renci.org:1935/thredds/dodsC/daily/nam/'
+    url_2 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_HS.63.nc'
+    url_3 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_TPS.63.nc'
+    url_4 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/fort.63.nc'
+    # url_1= website
+    # url_2= significant wave height (swan_Hs)
+    # url_3= peak period (swan_TPS)
+    # add in URL from file if add new variable
+
+    # trying to make earlier dates work
+    # if date earlier than 8/3/2017 then will use these website links
+    test_date = dt.datetime(2017, 8, 3, 00)
+    cur_date = dt.datetime.strptime(date, "%Y%m%d%H")
+
+    # This is a list of dates that have an hsofs URL but come after the test_date. You can add/remove dates
+    # from this list by adding another element (separate with a comma) to the list "dt.datetime(year,month,day,hour)"
+    except_dates = [dt.datetime(2017, 9, 15, 00)]
+
+    if cur_date < test_date or cur_date in except_dates:
+        url_2 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_HS.63.nc'
+        url_3 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_TPS.63.nc'
+        url_4 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/fort.63.nc'
+
+    tp_url = url_1 + date + url_3
+    hs_url = url_1 + date + url_2
+    z_url = url_1 + date + url_4
+    # add new url for new variable here
+
+    try:
+        # Return the dataset from the netCDF file
+        hs_data = nc.Dataset(hs_url, 'r')
+        tp_data = nc.Dataset(tp_url, 'r')
+        z_data = nc.Dataset(z_url, 'r')
+        status = "good"
+        # add in new dataset here
+
+    except IOError:
+        hs_data = 0
+        tp_data = 0
+        z_data = 0
+        status = "fail"
+        # add new variable here and set equal to 0
+
+    return hs_data, tp_data, z_data, status
+
+
+def adcirc_full_data_download(date):
+    """
+    Go into the OpenDAP server and get date for the specified date
+
+    url_1: Generic path to data
+    url_2: Significant wave heights
+    url_3: Peak periods
+    url_4: Depths
+    """
+
+    catalog_url = 'http://tds.renci.org:8080/thredds/catalog/daily/nam/'
+    url_1 = 'http://tds.renci.org:8080/thredds/dodsC/daily/nam/'
+    directory_url = catalog_url + date + '/catalog.html'
+
+    # If the date is in the cycle index (see ADCIRC_Cycle_Index.py) the
+    # grid and urls come from there without asking the server. Dates the
+    # index knows are not on the server are skipped
+    files = ['swan_HS.63.nc', 'swan_TPS.63.nc', 'fort.63.nc']
+    crawled, cycle = lookup_cycle(date, 'forecast')
+    if crawled and not cycle_has_files(cycle, files):
+        return 0, 0, 0, 'missing', None
+    elif crawled:
+        grid = cycle['grid']
+        hs_url, tp_url, z_url = [cycle_url(url_1, cycle, fname) for fname in files]
+
+    else:
+        # Check if an nc6b grid exists for the date, if so use it.
+        # Otherwise use the hsofs grid (also used if the folder is empty).
+        # You can add more urls to these lists!
+        url_2 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_HS.63.nc'
+        url_3 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_TPS.63.nc'
+        url_4 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/fort.63.nc'
+        grid = 'hsofs'
+        for file in listFD(directory_url):
+            if file.find('nc6b') != -1:
+                url_2 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_HS.63.nc'
+                url_3 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_TPS.63.nc'
+                url_4 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/fort.63.nc'
+                grid = 'nc6b'
+                break
+
+        tp_url = url_1 + date + url_3
+        hs_url = url_1 + date + url_2
+        z_url = url_1 + date + url_4
+        # Can add more data here, make sure the addresses are correct
+
+    try:
+        # Return the dataset from the netCDF file
+        hs_data, tp_data, z_data = open_datasets([hs_url, tp_url, z_url])
+        status = "good"
+        # add in new dataset here
+
+    except IOError as error:
+        hs_data = 0
+        tp_data = 0
+        z_data = 0
+        status = classify_error(error)
+        # add new variable here and set equal to 0
+
+    return hs_data, tp_data, z_data, status, grid
+
+
+def hsofs_node_find(x, y, tree=None, sites=None):
+    """
+    Find the appropiate nodes in the hsofs grid using the locations of the nodes used
+    from the nc6b grid (the nc6b_lon and nc6b_lat of the sites, see load_sites()).
+    Sites without an nc6b location use their own location. The nearest hsofs
+    node (by great-circle distance) to every site is found in one KD-tree query.
+
+    Pass a tree from build_node_tree(x, y) to reuse it between calls on the same grid.
+    The download scripts use the node map instead (see build_node_map())
+    """
+
+    # Add more locations to the sites file (sites.csv)
+    if sites is None:
+        sites = load_sites()
+
+    if tree is None:
+        tree = build_node_tree(x, y)
+
+    lons, lats = site_reference_points(sites)
+    nodes_used, dists = nearest_nodes(tree, lons, lats)
+
+    return [int(node) for node in nodes_used]
+
+
+def get_model_base_time(nc_file):
+    """
+    Retrieve the base date for the model run and return
+    it as a datetime object
+    """
+
+    # Loop through the attributes of the time variable
+    # in the nc_file until "base_date" is found. Then
+    # store it as a string
+    for attr in nc_file['time'].ncattrs():
+        if attr == 'base_date':
+            base_time_str = getattr(nc_file['time'], attr)
+            break
+    else:
+        # netCDF still opens the file if the server fails to send the
+        # attributes, so this is an error that can go away
+        raise IOError(TRANSIENT_ERRORS[1], 'No base_date for the time in %s' % nc_file.filepath())
+
+    # Convert the base_time string into a datetime object
+    dt_format = '%Y-%m-%d %H:%M:%S'
+    base_time_dt = dt.datetime.strptime(base_time_str, dt_format)
+
+    return base_time_dt
+
+
+def nth_sunday(year, month, n):
+    """
+    Return the date of the nth Sunday of a month. n = -1 is the last Sunday
+    """
+    if n > 0:
+        first = dt.date(year, month, 1)
+        return first + dt.timedelta(days=(6 - first.weekday()) % 7 + 7 * (n - 1))
+    last = dt.date(year + month // 12, month % 12 + 1, 1) - dt.timedelta(days=1)
+    return last - dt.timedelta(days=(last.weekday() + 1) % 7)
+
+
+def dst_start_end(year):
+    """
+    Return the start and end times (GMT) of daylight savings time in US
+    Eastern time for any year. Daylight savings starts and ends at 2 AM
+    local time, which is 7 AM GMT (EST) at the start and 6 AM GMT (EDT)
+    at the end. The rules are the US rules for that year:
+
+        2007 and after: second Sunday in March to first Sunday in November
+        1987 to 2006:   first Sunday in April to last Sunday in October
+        1967 to 1986:   last Sunday in April to last Sunday in October
+                        (except 1974 and 1975, when it started early)
+    """
+
+    if year >= 2007:
+        start_day, end_day = nth_sunday(year, 3, 2), nth_sunday(year, 11, 1)
+    elif year >= 1987:
+        start_day, end_day = nth_sunday(year, 4, 1), nth_sunday(year, 10, -1)
+    elif year == 1974:
+        start_day, end_day = dt.date(1974, 1, 6), nth_sunday(year, 10, -1)
+    elif year == 1975:
+        start_day, end_day = dt.date(1975, 2, 23), nth_sunday(year, 10, -1)
+    else:
+        start_day, end_day = nth_sunday(year, 4, -1), nth_sunday(year, 10, -1)
+
+    dst_start = dt.datetime.combine(start_day, dt.time(7))
+    dst_end = dt.datetime.combine(end_day, dt.time(6))
+
+    return dst_start, dst_end
+
+
+def get_real_time(base_time, time, gmt):
+    """
+    Use the base time and the current time value to
+    determine the real time represented by the current
+    model time step
+
+    The time in ADCIRC is in GMT, the time is converted to
+    Eastern time (EST/EDT) if gmt is False
+
+    Returns the real time as a string and as a datetime object.
+    To convert every time step at once use convert_model_times()
+    """
+
+    # The time argument comes from ADCIRC, it is equal to the number
+    # of seconds since the reference time included in the metadata. Set
+    # it as the timestep and then add it to the base time to calculate
+    # the real time in GMT
+    real_time_step = dt.timedelta(seconds=float(time))
+    real_time = base_time + real_time_step
+
+    # If gmt is set to false than the time will convert to EST/EDT
+    if not gmt:
+
+        # Check if the date is during daylight savings time
+        dst_start, dst_end = dst_start_end(real_time.year)
+        if (dst_start <= real_time < dst_end):
+            gmt_adjust = dt.timedelta(hours=4)
+        else:
+            gmt_adjust = dt.timedelta(hours=5)
+        real_time = real_time - gmt_adjust
+
+    real_time_str = real_time.strftime('%Y-%m-%d %H:%M:%S')
+
+    return real_time, real_time_str
+
+
+def convert_model_times(base_time, model_times, gmt):
+    """
+    Convert a whole array of model times (seconds since base_time, see
+    get_model_base_time()) into real times at once. The times are GMT, or
+    Eastern time (EST/EDT) if gmt is False. This gives the same times as
+    calling get_real_time() for every time step
+
+    Returns a datetime64[s] array
+    """
+
+    # Round to the nearest second the same way timedelta() does
+    seconds = np.rint(np.ma.filled(np.ma.asarray(model_times, dtype='f8'), 0)).astype('i8')
+    real_times = np.datetime64(base_time, 's') + seconds.astype('timedelta64[s]')
+    if gmt:
+        return real_times
+
+    # Every year in the times only has to be looked up once
+    years = real_times.astype('datetime64[Y]').astype(int) + 1970
+    in_dst = np.zeros(len(real_times), dtype=bool)
+    for year in np.unique(years):
+        dst_start, dst_end = [np.datetime64(edge, 's') for edge in dst_start_end(int(year))]
+        in_dst |= (years == year) & (real_times >= dst_start) & (real_times < dst_end)
+
+    return real_times - np.where(in_dst, 4, 5).astype('timedelta64[h]')
+
+
+def format_times(real_times):
+    """
+    Turn a datetime64 array into yyyy-mm-dd HH:MM:SS strings
+    """
+    return np.char.replace(np.datetime_as_string(np.asarray(real_times, dtype='datetime64[s]'), unit='s'), 'T', ' ')
+
+
+def find_nowcast(date):
+    """
+    See if a nowcast run exists for the current data and return a
+    "True"/"False". This uses the same listFD function that checks
+    for an nc6b grid in the adcirc_full_data_download() function but
+    here a different URL is passed to listFD() which allows it to check
+    if a folder named "nowcast" exists
+    """
+
+    # Use the cycle index if the date is in it
+    crawled, cycle = lookup_cycle(date, 'nowcast', grid='hsofs')
+    if crawled:
+        return cycle is not None
+
+    gen_url = 'http://tds.renci.org:8080/thredds/catalog/daily/nam/'
+    casts_url = gen_url + date + '/hsofs/hatteras.renci.org/namhsofs/catalog.html'
+
+    res = False
+    for cast in listFD(casts_url):
+        if cast.find('nowcast') != -1:
+            res = True
+            break
+
+    return res
+
+
+def adcirc_full_nowcast_data_download(date):
+    """
+    Go into the OpenDAP server and get date for the specified date
+
+    url_1: Generic path to data
+    url_2: Significant wave heights
+    url_3: Peak periods
+    url_4: Depths
+
+    8/10/18: All nowcasts are on the hsofs grid so this function will just
+             assume an hsofs grid
+    """
+
+    url_1 = 'http://tds.renci.org:8080/thredds/dodsC/daily/nam/'
+    url_2 = '/hsofs/hatteras.renci.org/namhsofs/nowcast/swan_HS.63.nc'
+    url_3 = '/hsofs/hatteras.renci.org/namhsofs/nowcast/swan_TPS.63.nc'
+    url_4 = '/hsofs/hatteras.renci.org/namhsofs/nowcast/fort.63.nc'
+    grid = 'hsofs'
+
+    # Print out which grid is being used
+    print('Using %s grid for nowcast data\n' % grid)
+
+    tp_url = url_1 + date + url_3
+    hs_url = url_1 + date + url_2
+    z_url = url_1 + date + url_4
+    # Can add more data here, make sure the addresses are correct
+
+    # Use the urls from the cycle index if the date is in it
+    files = ['swan_HS.63.nc', 'swan_TPS.63.nc', 'fort.63.nc']
+    crawled, cycle = lookup_cycle(date, 'nowcast', grid=grid)
+    if crawled and not cycle_has_files(cycle, files):
+        return 0, 0, 0, 'missing', grid
+    elif crawled:
+        hs_url, tp_url, z_url = [cycle_url(url_1, cycle, fname) for fname in files]
+
+    try:
+        # Return the dataset from the netCDF file
+        hs_data, tp_data, z_data = open_datasets([hs_url, tp_url, z_url])
+        status = "good"
+        # add in new dataset here
+
+    except IOError as error:
+        hs_data = 0
+        tp_data = 0
+        z_data = 0
+        status = classify_error(error)
+        # add new variable here and set equal to 0
+
+    return hs_data, tp_data, z_data, status, grid
+
+
+def mesh_fingerprint(grid, x, y):
+    """
+    Make a fingerprint for a mesh from the grid name (i.e; 'nc6b', 'hsofs'),
+    the number of nodes, and a checksum of the node coordinates
+    """
+    x = np.ascontiguousarray(np.ma.filled(x, np.nan), dtype='f8')
+    y = np.ascontiguousarray(np.ma.filled(y, np.nan), dtype='f8')
+    checksum = hashlib.sha1(x.tobytes() + y.tobytes()).hexdigest()
+    return {'grid': grid, 'num_nodes': int(len(x)), 'checksum': checksum}
+
+
+def save_mesh_cache(grid, x, y, depth, cache_dir=MESH_CACHE_DIR):
+    """
+    Store the x, y, and depth arrays for a grid as .npy files along
+    with the mesh fingerprint. Returns the mesh as a dictionary
+    """
+
+    grid_dir = os.path.join(cache_dir, grid)
+    os.makedirs(grid_dir, exist_ok=True)
+
+    mesh = {
+        'x': np.ma.filled(x, np.nan).astype('f8'),
+        'y': np.ma.filled(y, np.nan).astype('f8'),
+        'depth': np.ma.filled(depth, np.nan).astype('f8'),
+    }
+    # Every file is written under a temporary name and then moved into place.
+    # The multiday workers can all be filling the cache at the same time and
+    # a process that is reading a file keeps the whole old file
+    temp = '.%d.tmp' % os.getpid()
+    for name in mesh:
+        with open(os.path.join(grid_dir, name + '.npy' + temp), 'wb') as npy_file:
+            np.save(npy_file, mesh[name])
+        os.replace(os.path.join(grid_dir, name + '.npy' + temp), os.path.join(grid_dir, name + '.npy'))
+
+    # Write the fingerprint last so a cache that was only partly written is never used
+    mesh['fingerprint'] = mesh_fingerprint(grid, mesh['x'], mesh['y'])
+    with open(os.path.join(grid_dir, 'fingerprint.json' + temp), 'w') as fingerprint_file:
+        json.dump(mesh['fingerprint'], fingerprint_file, indent=2)
+    os.replace(os.path.join(grid_dir, 'fingerprint.json' + temp), os.path.join(grid_dir, 'fingerprint.json'))
+
+    loaded_meshes[(cache_dir, grid)] = mesh
+    return mesh
+
+
+def load_mesh_cache(grid, num_nodes=None, cache_dir=MESH_CACHE_DIR):
+    """
+    Load the cached mesh for a grid. The arrays are memory-mapped so only the
+    parts that get used are read off the disk. Returns None if there is no
+    cache for the grid or if it does not have num_nodes nodes
+    """
+
+    mesh = loaded_meshes.get((cache_dir, grid))
+    if mesh is None:
+        grid_dir = os.path.join(cache_dir, grid)
+        try:
+            with open(os.path.join(grid_dir, 'fingerprint.json')) as fingerprint_file:
+                fingerprint = json.load(fingerprint_file)
+            mesh = {name: np.load(os.path.join(grid_dir, name + '.npy'), mmap_mode='r')
+                    for name in ['x', 'y', 'depth']}
+        except (IOError, ValueError):
+            return None
+        mesh['fingerprint'] = fingerprint
+        loaded_meshes[(cache_dir, grid)] = mesh
+
+    if num_nodes is not None and mesh['fingerprint']['num_nodes'] != num_nodes:
+        return None
+
+    return mesh
+
+
+def get_mesh(nc_data, grid, cache_dir=MESH_CACHE_DIR):
+    """
+    Return the mesh (x, y, depth) for the grid the dataset is on. The
+    cache is used if it has the same number of nodes as the dataset,
+    otherwise the mesh is downloaded and the cache is rebuilt
+    """
+
+    with span('mesh lookup') as info:
+        mesh = load_mesh_cache(grid, nc_data['x'].shape[0], cache_dir)
+        if mesh is None:
+            mesh = rebuild_mesh_cache(nc_data, grid, cache_dir)
+            info['bytes'] = sum(mesh[name].nbytes for name in ['x', 'y', 'depth'])
+        info['values'] = len(mesh['x'])
+    return mesh
+
+
+def rebuild_mesh_cache(nc_data, grid, cache_dir=MESH_CACHE_DIR):
+    """
+    Download the mesh from the dataset and (re)write the cache for the grid
+    """
+    print('Downloading the %s mesh into the mesh cache' % grid)
+    return save_mesh_cache(grid, read_variable(nc_data['x']), read_variable(nc_data['y']),
+                           read_variable(nc_data['depth']), cache_dir)
+
+
+def validate_mesh_cache(nc_data, grid, cache_dir=MESH_CACHE_DIR):
+    """
+    Download the node coordinates from the dataset and check that they match
+    the fingerprint of the cached mesh. Returns (valid, cached fingerprint,
+    dataset fingerprint). The cached fingerprint is None if there is no cache
+    """
+
+    fresh = mesh_fingerprint(grid, read_variable(nc_data['x']), read_variable(nc_data['y']))
+    cached = load_mesh_cache(grid, cache_dir=cache_dir)
+    if cached is None:
+        return False, None, fresh
+
+    return cached['fingerprint'] == fresh, cached['fingerprint'], fresh
+
+
+def dataset_grid(nc_data):
+    """
+    Return the grid ('nc6b' or 'hsofs') a dataset is on, from its url
+    """
+    return 'nc6b' if '/nc6b/' in nc_data.filepath() else 'hsofs'
+
+
+def box_mask(x, y, bounding_box):
+    """
+    Return a True/False array of the nodes inside the bounding box
+    (bottom_lat, upper_lat, left_lon, right_lon, see load_bounding_box()).
+    Nodes without a location are never inside
+    """
+    bottom_lat, upper_lat, left_lon, right_lon = bounding_box
+    x = np.ma.filled(np.asarray(x, dtype=float), np.nan)
+    y = np.ma.filled(np.asarray(y, dtype=float), np.nan)
+    with np.errstate(invalid='ignore'):
+        return (x >= left_lon) & (x <= right_lon) & (y >= bottom_lat) & (y <= upper_lat)
+
+
+def request_gap(variables, num_steps=1):
+    """
+    Return how many nodes of the variables (netCDF variables, num_steps
+    time steps of each) can be read for the cost of one more request
+    """
+    node_bytes = num_steps * sum(var.dtype.itemsize for var in variables)
+    return int(RUN_REQUEST_BYTES // max(node_bytes, 1))
+
+
+def coalesce_runs(nodes, max_waste=RUN_GAP_WASTE, free_gap=0):
+    """
+    Group node IDs into as few runs (see node_runs()) as possible while the
+    nodes between the runs that get joined add up to no more than max_waste
+    times the number of nodes. The smallest gaps are joined first, that
+    joins the most runs for the nodes that are wasted. Gaps of up to free_gap
+    nodes are always joined and don't count (see request_gap())
+    """
+
+    runs = node_runs(nodes)
+    if len(runs) < 2:
+        return runs
+
+    firsts = np.array([first for first, stop in runs])
+    stops = np.array([stop for first, stop in runs])
+    gaps = firsts[1:] - stops[:-1]
+    budget = max_waste * (stops - firsts).sum()
+
+    order = np.argsort(gaps, kind='stable')
+    wasted = np.cumsum(np.where(gaps[order] <= free_gap, 0, gaps[order]))
+    joined = np.zeros(len(gaps), dtype=bool)
+    joined[order[wasted <= budget]] = True
+
+    # A run starts after every gap that isn't joined
+    firsts = np.concatenate([firsts[:1], firsts[1:][~joined]])
+    stops = np.concatenate([stops[:-1][~joined], stops[-1:]])
+    return [(int(first), int(stop)) for first, stop in zip(firsts, stops)]
+
+
+def get_box(mesh, bounding_box, free_gap=0, max_waste=RUN_GAP_WASTE, cache_dir=MESH_CACHE_DIR):
+    """
+    Return the nodes of a mesh (see get_mesh()) inside the bounding box
+    ("nodes") and the runs to read them with ("runs", see coalesce_runs(),
+    free_gap comes from request_gap() for the variables that will be read).
+    These only change with the mesh so they are worked out once and stored
+    in the mesh cache folder of the grid. The box also keeps its
+    "bounding_box" (see contour_nodes())
+    """
+
+    fingerprint = mesh['fingerprint']
+    bounding_box = tuple(float(edge) for edge in bounding_box)
+    key = hashlib.sha1(json.dumps([fingerprint['checksum'], bounding_box,
+                                   max_waste, free_gap]).encode()).hexdigest()
+    box = loaded_boxes.get((cache_dir, key))
+    if box is not None:
+        return box
+
+    fname = os.path.join(cache_dir, fingerprint['grid'], 'box_%s.npz' % key)
+    try:
+        with np.load(fname) as cached:
+            box = {'nodes': cached['nodes'], 'runs': [tuple(run) for run in cached['runs'].tolist()],
+                   'bounding_box': bounding_box}
+    except (IOError, ValueError, KeyError):
+        with span('box search') as info:
+            nodes = np.flatnonzero(box_mask(mesh['x'], mesh['y'], bounding_box))
+            box = {'nodes': nodes, 'runs': coalesce_runs(nodes, max_waste, free_gap), 'bounding_box': bounding_box}
+            info['values'] = len(mesh['x'])
+
+        # Another process could be writing the same box, write it to a temporary file first
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        temp_fname = '%s.%d.tmp.npz' % (fname[:-4], os.getpid())
+        np.savez(temp_fname, nodes=box['nodes'], runs=np.array(box['runs'], dtype='i8').reshape(-1, 2))
+        os.replace(temp_fname, fname)
+
+    if not len(box['nodes']):
+        raise ValueError('There are no %s nodes in the bounding box %s' % (fingerprint['grid'], bounding_box))
+
+    loaded_boxes[(cache_dir, key)] = box
+    return box
+
+
+def get_elements(z_data, mesh, cache_dir=MESH_CACHE_DIR):
+    """
+    Return the elements (triangles) of a mesh (see get_mesh()) as an
+    elements x 3 array of node IDs, counted from 0. They are downloaded from
+    the elevation dataset (z_data, fort.63 or maxele.63, "element" is
+    counted from 1 in the files) the first time and kept in the mesh cache
+    folder of the grid
+    """
+
+    fingerprint = mesh['fingerprint']
+    fname = os.path.join(cache_dir, fingerprint['grid'], 'element_%s.npy' % fingerprint['checksum'])
+    element = loaded_elements.get(fname)
+    if element is not None:
+        return element
+
+    try:
+        element = np.load(fname, mmap_mode='r')
+    except (IOError, ValueError):
+        print('Downloading the %s elements into the mesh cache' % fingerprint['grid'])
+        with span('element download') as info:
+            var = z_data['element']
+            start_index = var.getncattr('start_index') if 'start_index' in var.ncattrs() else 1
+            element = np.asarray(read_variable(var), dtype='i4') - int(start_index)
+            info['bytes'] = element.nbytes
+
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        temp_fname = '%s.%d.tmp' % (fname, os.getpid())
+        with open(temp_fname, 'wb') as npy_file:
+            np.save(npy_file, element)
+        os.replace(temp_fname, fname)
+
+    loaded_elements[fname] = element
+    return element
+
+
+def isobath_segments(depth, element, contour):
+    """
+    Pull a depth contour (the isobath) out of the mesh as line segments, one
+    for every element it goes through. The contour crosses an edge of an
+    element where one end is deeper than the contour and the other isn't, the
+    crossing is found by linear interpolation of the depth along the edge.
+    Neighbouring elements share the crossing on their edge, so the segments
+    join up into the contour line
+
+    Returns (nodes, weights), both segments x 2 ends x 2. End j of segment i
+    is at weights[i, j, 0] times node nodes[i, j, 0] plus weights[i, j, 1]
+    times node nodes[i, j, 1] (the two nodes of the edge it crosses)
+    """
+
+    depth = np.ma.filled(np.ma.asarray(depth, dtype=float), np.nan)
+    element = np.asarray(element)
+
+    # Elements with a missing depth are left out
+    corners = depth[element]
+    keep = np.isfinite(corners).all(axis=1)
+    element, corners = element[keep], corners[keep]
+
+    # The edges of an element go from corner starts[k] to corner ends[k]. An
+    # element the contour goes through always has two edges crossed
+    starts, ends = np.array([0, 1, 2]), np.array([1, 2, 0])
+    deeper = corners > contour
+    crossed = deeper[:, starts] != deeper[:, ends]
+    through = crossed.any(axis=1)
+    element, corners, crossed = element[through], corners[through], crossed[through]
+    edges = np.argsort(~crossed, axis=1, kind='stable')[:, :2]
+
+    rows = np.arange(len(element))[:, None]
+    start_depth, end_depth = corners[rows, starts[edges]], corners[rows, ends[edges]]
+    fraction = (contour - start_depth) / (end_depth - start_depth)
+
+    nodes = np.stack([element[rows, starts[edges]], element[rows, ends[edges]]], axis=2)
+    weights = np.stack([1 - fraction, fraction], axis=2)
+    return nodes, weights
+
+
+def get_isobath(z_data, mesh, contour, cache_dir=MESH_CACHE_DIR):
+    """
+    Return the segments of a depth contour of a mesh (see isobath_segments()).
+    These only change with the mesh so they are worked out once per grid and
+    contour and stored in the mesh cache folder of the grid
+    """
+
+    fingerprint = mesh['fingerprint']
+    key = hashlib.sha1(json.dumps([fingerprint['checksum'], float(contour)]).encode()).hexdigest()
+    fname = os.path.join(cache_dir, fingerprint['grid'], 'isobath_%s.npz' % key)
+    isobath = loaded_isobaths.get(fname)
+    if isobath is not None:
+        return isobath
+
+    try:
+        with np.load(fname) as cached:
+            isobath = (cached['nodes'], cached['weights'])
+    except (IOError, ValueError, KeyError):
+        element = get_elements(z_data, mesh, cache_dir)
+        with span('isobath search') as info:
+            isobath = isobath_segments(mesh['depth'], element, contour)
+            info['values'] = len(element)
+
+        temp_fname = '%s.%d.tmp.npz' % (fname[:-4], os.getpid())
+        np.savez(temp_fname, nodes=isobath[0], weights=isobath[1])
+        os.replace(temp_fname, fname)
+
+    loaded_isobaths[fname] = isobath
+    return isobath
+
+
+def project_sites(x0, y0, x1, y1, sites):
+    """
+    Put every site (see load_sites()) on one of the segments from (x0, y0) to
+    (x1, y1). Returns the segment of every site and how far along it (0 to 1)
+    the site goes.
+
+    Like finding_well_points(), a site that is EW goes on the segment with the
+    same longitude as the site that is closest in latitude, and NS on the one
+    with the same latitude that is closest in longitude. DIAG sites (and EW/NS
+    sites no segment lines up with) go on the closest point of any segment.
+    Distances are in degrees with the longitudes scaled by cos(latitude)
+    """
+
+    num_sites = len(sites['name'])
+    segments = np.zeros(num_sites, dtype=int)
+    fractions = np.zeros(num_sites)
+
+    for i in range(num_sites):
+        scale = np.cos(np.radians(sites['lat'][i]))
+        ax, ay = (x0 - sites['lon'][i]) * scale, y0 - sites['lat'][i]
+        dx, dy = (x1 - x0) * scale, y1 - y0
+
+        # The closest point of every segment
+        length = dx ** 2 + dy ** 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            along = np.where(length > 0, np.clip(-(ax * dx + ay * dy) / length, 0, 1), 0)
+        dist = np.hypot(ax + along * dx, ay + along * dy)
+
+        # Segments that cross the longitude (EW) or latitude (NS) of the site
+        orientation = sites['orientation'][i]
+        if orientation in ['EW', 'NS']:
+            across, other, d_across, d_other = (ax, ay, dx, dy) if orientation == 'EW' else (ay, ax, dy, dx)
+            crosses = (np.minimum(across, across + d_across) <= 0) & (np.maximum(across, across + d_across) >= 0) & \
+                      (d_across != 0)
+            if crosses.any():
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    along = np.where(crosses, -across / d_across, 0)
+                dist = np.where(crosses, np.abs(other + along * d_other), np.inf)
+
+        segments[i] = np.argmin(dist)
+        fractions[i] = along[segments[i]]
+
+    return segments, fractions
+
+
+def isobath_operator(z_data, mesh, bounding_box, contour, sites, cache_dir=MESH_CACHE_DIR):
+    """
+    Return a sites x nodes sparse matrix that interpolates values at the
+    nodes of a mesh (see get_mesh()) to the points where the sites (see
+    load_sites()) are put on the depth contour (see project_sites()). Only
+    the part of the contour inside the bounding box is used. The values of a
+    model run at the sites are then one matrix multiply (operator @ values).
+
+    The matrix only changes with the mesh, contour, box, and sites so it is
+    worked out once and stored in the mesh cache folder of the grid
+    """
+
+    fingerprint = mesh['fingerprint']
+    key = hashlib.sha1(json.dumps([fingerprint['checksum'], float(contour), [float(edge) for edge in bounding_box],
+                                   site_settings(sites)]).encode()).hexdigest()
+    fname = os.path.join(cache_dir, fingerprint['grid'], 'isobath_operator_%s.npz' % key)
+
+    def build():
+        nodes, weights = get_isobath(z_data, mesh, contour, cache_dir)
+        with span('isobath projection') as info:
+
+            # The ends of the segments, only the segments in the box are used
+            x = (weights * np.asarray(mesh['x'])[nodes]).sum(axis=2)
+            y = (weights * np.asarray(mesh['y'])[nodes]).sum(axis=2)
+            inside = box_mask(x, y, bounding_box).all(axis=1)
+            if not inside.any():
+                raise ValueError('The %gm contour of the %s grid is not in the bounding box %s' %
+                                 (contour, fingerprint['grid'], bounding_box))
+            nodes, weights, x, y = nodes[inside], weights[inside], x[inside], y[inside]
+            segments, fractions = project_sites(x[:, 0], y[:, 0], x[:, 1], y[:, 1], sites)
+
+            # Every site is between the two ends of its segment, and every end
+            # is between two nodes. Weights for the same node are added up
+            ends = np.column_stack([1 - fractions, fractions])
+            site_weights = (ends[:, :, None] * weights[segments]).reshape(len(segments), 4)
+            site_nodes = nodes[segments].reshape(len(segments), 4)
+            rows = np.repeat(np.arange(len(segments)), 4)
+            operator = sparse.csr_matrix((site_weights.ravel(), (rows, site_nodes.ravel())),
+                                         shape=(len(segments), fingerprint['num_nodes']))
+            operator.sum_duplicates()
+            info['values'] = len(x)
+        return operator
+
+    return cached_operator(fname, build)
+
+
+def cached_operator(fname, build):
+    """
+    Return the sparse matrix stored in fname (in memory or on the disk). If
+    it isn't there it is made with build() and stored
+    """
+
+    operator = loaded_operators.get(fname)
+    if operator is not None:
+        return operator
+
+    try:
+        operator = sparse.load_npz(fname).tocsr()
+    except (IOError, ValueError, KeyError):
+        operator = build()
+
+        # Another process could be writing the same file, write it to a temporary file first
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        temp_fname = '%s.%d.tmp.npz' % (fname[:-4], os.getpid())
+        sparse.save_npz(temp_fname, operator)
+        os.replace(temp_fname, fname)
+
+    loaded_operators[fname] = operator
+    return operator
+
+
+def build_element_locator(x, y, element):
+    """
+    Make a spatial index of the elements of a mesh to find the element a
+    point is in. The mesh is split into square cells about the size of an
+    element and every cell lists the elements with a bounding box that
+    overlaps it, so only a few elements have to be checked for a point
+    """
+
+    element = np.asarray(element)
+    corner_x = np.ma.filled(np.asarray(x, dtype=float), np.nan)[element]
+    corner_y = np.ma.filled(np.asarray(y, dtype=float), np.nan)[element]
+    low_x, high_x = corner_x.min(axis=1), corner_x.max(axis=1)
+    low_y, high_y = corner_y.min(axis=1), corner_y.max(axis=1)
+    located = np.flatnonzero(np.isfinite(low_x + high_x + low_y + high_y))
+
+    size = float(np.median(np.maximum(high_x - low_x, high_y - low_y)[located]))
+    origin = (float(low_x[located].min()), float(low_y[located].min()))
+    num_y = int((high_y[located].max() - origin[1]) // size) + 1
+
+    # The cells the bounding box of every element overlaps
+    first_i = ((low_x[located] - origin[0]) // size).astype('i8')
+    first_j = ((low_y[located] - origin[1]) // size).astype('i8')
+    span_i = ((high_x[located] - origin[0]) // size).astype('i8') - first_i + 1
+    span_j = ((high_y[located] - origin[1]) // size).astype('i8') - first_j + 1
+    num_cells = span_i * span_j
+
+    # Big elements would be listed in too many cells
+    big = num_cells > LOCATOR_MAX_CELLS
+    small = ~big
+    first_i, first_j, span_j, num_cells = first_i[small], first_j[small], span_j[small], num_cells[small]
+
+    # One (cell, element) pair for every cell of every element
+    ends = np.cumsum(num_cells)
+    offsets = np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - num_cells, num_cells)
+    span_j = np.repeat(span_j, num_cells)
+    cells = (np.repeat(first_i, num_cells) + offsets // span_j) * num_y + np.repeat(first_j, num_cells) + offsets % span_j
+    elements = np.repeat(located[small], num_cells)
+
+    order = np.argsort(cells, kind='stable')
+    return {
+        'origin': origin,
+        'size': size,
+        'num_y': num_y,
+        'cells': cells[order],
+        'elements': elements[order],
+        'big': located[big],
+    }
+
+
+def barycentric_weights(x, y, corner_x, corner_y):
+    """
+    Return the barycentric weights (elements x 3) of the point (x, y) in every
+    triangle with corners corner_x, corner_y (elements x 3). The weights add
+    up to 1 and are all between 0 and 1 if the point is inside the triangle
+    """
+
+    x1, x2, x3 = corner_x.T
+    y1, y2, y3 = corner_y.T
+    det = (y2 - y3) * (x1 - x3) + (x3 - x2) * (y1 - y3)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w1 = ((y2 - y3) * (x - x3) + (x3 - x2) * (y - y3)) / det
+        w2 = ((y3 - y1) * (x - x3) + (x1 - x3) * (y - y3)) / det
+    return np.column_stack([w1, w2, 1 - w1 - w2])
+
+
+def locate_points(locator, x, y, element, lons, lats, tolerance=1e-9):
+    """
+    Find the element every point (lons, lats) is in with a locator (see
+    build_element_locator()). Returns the element of every point (-1 if it
+    isn't in any) and the barycentric weights of its corners
+    """
+
+    found = np.full(len(lons), -1, dtype='i8')
+    weights = np.zeros((len(lons), 3))
+    for i, (lon, lat) in enumerate(zip(lons, lats)):
+
+        # The elements listed in the cell of the point and the big elements
+        cell = int((lon - locator['origin'][0]) // locator['size']) * locator['num_y'] + \
+               int((lat - locator['origin'][1]) // locator['size'])
+        first, stop = np.searchsorted(locator['cells'], [cell, cell + 1])
+        candidates = np.concatenate([locator['elements'][first:stop], locator['big']])
+
+        corners = element[candidates]
+        candidate_weights = barycentric_weights(lon, lat, np.asarray(x)[corners], np.asarray(y)[corners])
+        inside = np.flatnonzero((candidate_weights >= -tolerance).all(axis=1))
+        if len(inside):
+            found[i] = candidates[inside[0]]
+            weights[i] = np.clip(candidate_weights[inside[0]], 0, 1)
+            weights[i] /= weights[i].sum()
+
+    return found, weights
+
+
+def barycentric_operator(z_data, mesh, sites, cache_dir=MESH_CACHE_DIR):
+    """
+    Return a sites x nodes sparse matrix that interpolates values at the
+    nodes of a mesh (see get_mesh()) to the sites (see load_sites()) from
+    the corners of the element each site is in (barycentric interpolation).
+    A site that is not in any element (i.e; on land) gets the value of the
+    nearest node. The values of a model run at the sites are then one
+    matrix multiply (operator @ values).
+
+    The matrix only changes with the mesh and the sites so it is worked out
+    once and stored in the mesh cache folder of the grid
+    """
+
+    fingerprint = mesh['fingerprint']
+    key = hashlib.sha1(json.dumps([fingerprint['checksum'], site_settings(sites)]).encode()).hexdigest()
+    fname = os.path.join(cache_dir, fingerprint['grid'], 'barycentric_operator_%s.npz' % key)
+
+    def build():
+        element = np.asarray(get_elements(z_data, mesh, cache_dir))
+        x, y = np.asarray(mesh['x']), np.asarray(mesh['y'])
+        with span('element search') as info:
+            locator = loaded_locators.get(fingerprint['checksum'])
+            if locator is None:
+                locator = build_element_locator(x, y, element)
+                loaded_locators[fingerprint['checksum']] = locator
+            found, weights = locate_points(locator, x, y, element, sites['lon'], sites['lat'])
+            site_nodes = element[np.maximum(found, 0)]
+            info['values'] = len(element)
+
+        # Sites outside the mesh use the nearest node
+        outside = found < 0
+        if outside.any():
+            print('%d sites are outside the %s mesh, the nearest node is used for them' %
+                  (outside.sum(), fingerprint['grid']))
+            nearest, dists = nearest_nodes(build_node_tree(x, y), sites['lon'][outside], sites['lat'][outside])
+            site_nodes[outside] = np.asarray(nearest)[:, None]
+            weights[outside] = [1, 0, 0]
+
+        rows = np.repeat(np.arange(len(found)), 3)
+        operator = sparse.csr_matrix((weights.ravel(), (rows, site_nodes.ravel())),
+                                     shape=(len(found), fingerprint['num_nodes']))
+        operator.sum_duplicates()
+        operator.eliminate_zeros()
+        return operator
+
+    return cached_operator(fname, build)
+
+
+def operator_plan(operator, mesh, sites):
+    """
+    The parts of a plan (see make_extraction_plan()) for sites that are
+    interpolated with a sites x nodes matrix (see isobath_operator() and
+    barycentric_operator()). "operator" is then a sites x nodes matrix with a
+    column for each of the plan's nodes. The node of a site is the one with
+    the most weight, the location and depth are interpolated the same way
+    as the values
+    """
+
+    nodes = np.unique(operator.indices)
+    operator = operator[:, nodes]
+    largest = np.asarray(operator.argmax(axis=1)).ravel()
+
+    return {
+        'nodes': nodes,
+        'operator': operator,
+        'node_ids': nodes[largest],
+        'sites': sites['name'],
+        'depth': operator @ np.asarray(mesh['depth'][nodes]),
+        'x': operator @ np.asarray(mesh['x'][nodes]),
+        'y': operator @ np.asarray(mesh['y'][nodes]),
+    }
+
+
+def site_reference_points(sites):
+    """
+    Return the lons and lats the sites (see load_sites()) are matched to
+    other grids from: the location of the site's node on the nc6b grid
+    (nc6b_lon and nc6b_lat) or the site's own location if that isn't known
+    """
+    has_nc6b = ~np.isnan(sites['nc6b_lon']) & ~np.isnan(sites['nc6b_lat'])
+    lons = np.where(has_nc6b, sites['nc6b_lon'], sites['lon'])
+    lats = np.where(has_nc6b, sites['nc6b_lat'], sites['lat'])
+    return lons, lats
+
+
+def node_map_settings(sites):
+    """
+    Return what a node map (see build_node_map()) depends on for the sites
+    """
+    lons, lats = site_reference_points(sites)
+    return [sites['name'], lons.tolist(), lats.tolist()]
+
+
+def build_node_map(sites, cache_dir=MESH_CACHE_DIR):
+    """
+    Make the node map of the sites (see load_sites()): the equivalent node of
+    every site on every grid in the mesh cache (see NODE_MAP_GRIDS). The
+    equivalent node is the nearest node to the site's reference point (see
+    site_reference_points()). Every entry has the node, its lon, lat, and
+    depth, the distance (km) from the reference point, and the depth
+    difference from the site's nc6b node (None if the nc6b mesh isn't cached)
+    """
+
+    lons, lats = site_reference_points(sites)
+    node_map = {
+        'version': NODE_MAP_VERSION,
+        'created': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'settings': node_map_settings(sites),
+        'grids': {},
+        'sites': OrderedDict((name, {}) for name in sites['name']),
+    }
+
+    for grid in NODE_MAP_GRIDS:
+        mesh = load_mesh_cache(grid, cache_dir=cache_dir)
+        if mesh is None:
+            node_map['grids'][grid] = None
+            continue
+        node_map['grids'][grid] = mesh['fingerprint']
+
+        with span('node map search') as info:
+            nodes, dists = nearest_nodes(build_node_tree(mesh['x'], mesh['y']), lons, lats)
+            info['values'] = len(mesh['x'])
+        for name, node, dist in zip(sites['name'], nodes, dists):
+            node_map['sites'][name][grid] = {
+                'node': int(node),
+                'lon': float(mesh['x'][node]),
+                'lat': float(mesh['y'][node]),
+                'depth': float(mesh['depth'][node]),
+                'distance_km': float(dist),
+            }
+
+    # The depths on every grid are compared to the nc6b node of the site
+    for entries in node_map['sites'].values():
+        for grid, entry in entries.items():
+            entry['depth_difference'] = entry['depth'] - entries['nc6b']['depth'] if 'nc6b' in entries else None
+
+    return node_map
+
+
+def save_node_map(node_map, cache_dir=MESH_CACHE_DIR):
+    """
+    Store a node map (see build_node_map()) in the mesh cache folder
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    fname = os.path.join(cache_dir, NODE_MAP_FILE)
+    temp_fname = '%s.%d.tmp' % (fname, os.getpid())
+    with open(temp_fname, 'w') as map_file:
+        json.dump(node_map, map_file, indent=2)
+    os.replace(temp_fname, fname)
+    loaded_node_maps[cache_dir] = node_map
+
+
+def load_node_map(cache_dir=MESH_CACHE_DIR):
+    """
+    Load the node map (see build_node_map()) from the mesh cache folder.
+    Returns None if there isn't one or it was made by another NODE_MAP_VERSION
+    """
+
+    node_map = loaded_node_maps.get(cache_dir)
+    if node_map is None:
+        try:
+            with open(os.path.join(cache_dir, NODE_MAP_FILE)) as map_file:
+                node_map = json.load(map_file)
+        except (IOError, ValueError):
+            return None
+        loaded_node_maps[cache_dir] = node_map
+
+    if node_map.get('version') != NODE_MAP_VERSION:
+        return None
+    return node_map
+
+
+def node_map_current(node_map, sites, cache_dir=MESH_CACHE_DIR):
+    """
+    Check that a node map is for the sites and the meshes that are in the
+    mesh cache right now
+    """
+    if node_map is None or node_map['settings'] != node_map_settings(sites):
+        return False
+    for grid in NODE_MAP_GRIDS:
+        mesh = load_mesh_cache(grid, cache_dir=cache_dir)
+        if node_map['grids'].get(grid) != (None if mesh is None else mesh['fingerprint']):
+            return False
+    return True
+
+
+def get_node_map(sites, cache_dir=MESH_CACHE_DIR):
+    """
+    Return the node map of the sites (see build_node_map()). It is loaded
+    from the mesh cache folder and only built again if the sites or the
+    cached meshes changed. While no mesh is cached there is nothing to map,
+    so the (empty) map isn't stored
+    """
+    node_map = load_node_map(cache_dir)
+    if not node_map_current(node_map, sites, cache_dir):
+        node_map = build_node_map(sites, cache_dir)
+        if any(node_map['grids'].values()):
+            print('Built the node map of the sites')
+            save_node_map(node_map, cache_dir)
+    return node_map
+
+
+def mapped_nodes(node_map, sites, grid):
+    """
+    Return the equivalent node of every site on a grid from a node map
+    """
+    return [node_map['sites'][name][grid]['node'] for name in sites['name']]
+
+
+def make_extraction_plan(hs_data, grid, bounding_box, use_gmt, deep_contour=-20, date=None, sites=None,
+                         method='node', z_data=None):
+    """
+    Do all the work for a model run that does not change between time steps
+    and return it as a dictionary (the "plan"). This narrows the mesh down to
+    the bounding box (bottom_lat, upper_lat, left_lon, right_lon, see
+    load_bounding_box()), finds the nodes to use at the sites (see
+    load_sites()), and converts every model time into a real time.
+    extract_cycle_data() then only has to download the variables that change
+    with time, at the plan's nodes.
+
+    Sites that are matched to the same node share it, every node is only
+    read once ("nodes") and "columns" has the column of each site in it.
+
+    deep_contour is the depth contour to find nodes on. This can be changed
+    but should be kept at -20. date is the model run (yyyymmddhh), it goes
+    in the "cycle" column of the output
+
+    method is one of SITE_METHODS. With 'isobath' or 'barycentric' the plan
+    has an "operator" (see operator_plan()) instead of "columns", and z_data
+    (the fort.63 dataset of the run) is needed for the mesh elements
+
+    On hsofs the 'node' method uses the node map (see get_node_map()), which
+    is searched over the whole mesh. A site whose mapped node is outside the
+    bounding box gets the nearest node inside the box instead, like the old
+    search over the box did
+    """
+
+    if sites is None:
+        sites = load_sites()
+    if method not in SITE_METHODS:
+        raise ValueError('Unknown site method: %s' % method)
+    if method != 'node' and z_data is None:
+        raise ValueError('The %s site method needs the fort.63 dataset (z_data)' % method)
+
+    # The mesh does not change between runs so it comes from the mesh cache
+    mesh = get_mesh(hs_data, grid)
+
+    # Put the sites on the contour line (the depths are positive on both
+    # grids) or interpolate at the sites themselves
+    if method != 'node':
+        if method == 'isobath':
+            operator = isobath_operator(z_data, mesh, bounding_box, deep_contour * -1, sites)
+        else:
+            operator = barycentric_operator(z_data, mesh, sites)
+        plan = operator_plan(operator, mesh, sites)
+        plan.update({'cycle': date, 'columns': None, 'times': get_model_times(hs_data, use_gmt)})
+        return plan
+
+    # Find the nodes at the defined contour
+    with span('node search') as info:
+        if grid == 'nc6b':
+
+            # Narrow down the lat/lon. The nodes are not numbered in order of
+            # longitude (or latitude), so every node is checked against the box
+            box = get_box(mesh, bounding_box)
+            x = np.asarray(mesh['x'][box['nodes']])
+            y = np.asarray(mesh['y'][box['nodes']])
+            use_depths, use_indexes = contour_nodes(mesh, box, deep_contour * -1)
+            node_ids = box['nodes'][finding_well_points(use_indexes, x, y, sites)]
+            info['values'] = len(x)
+
+        elif grid == 'hsofs':
+            # The hsofs nodes that match the sites' nc6b nodes are in the node map.
+            # The nearest node is only looked for in the box again if the
+            # mapped node isn't in it (the nearest node in the box is the
+            # mapped node whenever that is inside)
+            node_ids = np.array(mapped_nodes(get_node_map(sites), sites, grid))
+            outside = ~box_mask(mesh['x'][node_ids], mesh['y'][node_ids], bounding_box)
+            if outside.any():
+                box = get_box(mesh, bounding_box)
+                lons, lats = site_reference_points(sites)
+                tree = build_node_tree(mesh['x'][box['nodes']], mesh['y'][box['nodes']])
+                positions, dists = nearest_nodes(tree, lons[outside], lats[outside])
+                node_ids[outside] = box['nodes'][positions]
+            info['values'] = len(node_ids)
+
+    nodes, columns = np.unique(node_ids, return_inverse=True)
+
+    return {
+        'cycle': date,
+        'nodes': nodes,
+        'columns': columns,
+        'node_ids': node_ids,
+        'sites': sites['name'],
+        'depth': np.asarray(mesh['depth'][node_ids]),
+        'x': np.asarray(mesh['x'][node_ids]),
+        'y': np.asarray(mesh['y'][node_ids]),
+        'times': get_model_times(hs_data, use_gmt),
+    }
+
+
+def make_known_node_plan(hs_data, grid, nodes_used, use_gmt, date=None):
+    """
+    Same as make_extraction_plan() but for a list of known node IDs. The
+    locations and depths of the nodes come from the mesh cache
+    """
+
+    mesh = get_mesh(hs_data, grid)
+    nodes, columns = np.unique(np.asarray(nodes_used, dtype=int), return_inverse=True)
+
+    return {
+        'cycle': date,
+        'nodes': nodes,
+        'columns': columns,
+        'node_ids': list(nodes_used),
+        'sites': ['node %d' % node for node in nodes_used],
+        'depth': mesh['depth'][nodes_used],
+        'x': mesh['x'][nodes_used],
+        'y': mesh['y'][nodes_used],
+        'times': get_model_times(hs_data, use_gmt),
+    }
+
+
+def get_model_times(hs_data, use_gmt):
+    """
+    Convert every model time step into a real time. Returns a
+    datetime64[s] array with one time per time step
+    """
+
+    base_time_dt = get_model_base_time(hs_data)
+    model_times = read_variable(hs_data['time'])
+    with span('time conversion') as info:
+        info['values'] = len(model_times)
+        return convert_model_times(base_time_dt, model_times, use_gmt)
+
+
+def print_time_steps(cast, t0, t1, num_steps, times, use_gmt):
+    """
+    Print the block of time steps (t0 to t1) being worked on, one line for
+    the block. Nothing is printed when the metrics are on, the progress
+    lines (see show_progress()) take the place of this
+    """
+    if metrics_state['file'] is not None or t1 <= t0:
+        return
+    first_time, last_time = format_times([times[t0], times[t1 - 1]])
+    print('Currently working on %s time steps %d to %d of %d (Real time: %s to %s %s)' %
+          (cast, t0 + 1, t1, num_steps, first_time, last_time, 'GMT' if use_gmt else 'EST'))
+
+
+def output_attributes(use_gmt, use_navd88):
     """
-    Pulling lat long from csv file match every well location to the nearest node
-    X = long Y = lat.
+    Return the time zone and vertical datum of the output as a dictionary. These
+    are stored in the Parquet and netCDF files
+    """
+    return {
+        'time_zone': 'GMT' if use_gmt else 'US Eastern (EST/EDT)',
+        'vertical_datum': 'NAVD88' if use_navd88 else 'MSL',
+    }
 
-    Wells:
-    1. Shackleford Banks (DIAG)
-    2. South Core Banks (NS)
+
+def make_output_block(cycle, cast, times, sites, nodes, depth, lon, lat, elev, Hs, swan_TPS):
+    """
+    Make a block of output rows (a dictionary of OUTPUT_COLUMNS arrays) for
+    a model run (yyyymmddhh) and cast ('forecast', 'nowcast', or 'max').
+    times is a list or array of datetimes, sites, nodes, depth, lon, and
+    lat have one value per node, and elev, Hs, and swan_TPS are time x node
+    arrays. Masked values are stored as NaN
     """
 
-    # Can add new well locations, put the lat and lon in the appropriate list below
-    # CAN BE CHANGED !!
-    well_long = [-76.552499, -76.496324]
-    well_lat = [34.64928, 34.661199]
+    num_times, num_nodes = len(times), len(nodes)
+    num_rows = num_times * num_nodes
 
-    # This list store the general shoreline orientation of the beach where the wells
-    # are located. Make sure that this list is equal in number of items as well_long and
-    # well_lat. The values should correspond to the wells (i.e; if the first well_lon and
-    # well_lat is for Shackleford than the first orientation should be "DIAG", "NS" for Core)
-    # CAN BE CHANGED !!
-    orientation = ['DIAG', 'NS']
+    def per_node(values):
+        return np.tile(np.ma.filled(np.ma.asarray(values, dtype='f8'), np.nan), num_times)
 
-    min_dists = []
-    nodes_used = []
-    for i in range(0, len(well_long)):
+    def per_row(values):
+        return np.ma.filled(np.ma.asarray(values, dtype='f8'), np.nan).reshape(num_rows)
 
-        if orientation[i] == 'EW':
-            # If the orientation is EW than match the node that has the closest x-coordinate
-            # to that of the well. This function only considers nodes at the appropriate depth
-            # contour so the one at a similar x-coordinate should be good
-            temp_dist = []
-            for j in range(0, len(use_indexes)):
-                dist = abs(float(x[j]) - float(well_long[i]))
-                temp_dist.append(dist)
-            min_dist = min(temp_dist)
-            min_dists.append(min_dist)
-
-        elif orientation[i] == 'NS':
-            # If the orientation is EW than match the node that has the closest y-coordinate
-            # to that of the well. This function only considers nodes at the appropriate depth
-            # contour so the one at a similar y-coordinate should be good
-            temp_dist = []
-            for j in range(0, len(use_indexes)):
-                dist = abs(float(y[j]) - float(well_lat[i]))
-                temp_dist.append(dist)
-            min_dist = min(temp_dist)
-            min_dists.append(min_dist)
-
-        elif orientation[i] == 'DIAG':
-            # Setting the orientation to EW or NS will find a node in a straight X/Y line from the well, by
-            # setting the orientation to DIAG, a node will be found that is more considerate of the actual
-            # curvature of Earth
-            temp_dist = []
-            for j in range(1, len(use_indexes)):
-                dist = np.sqrt((float(well_long[i]) - float(x[j])) ** 2
-                               + (float(well_lat[i]) - float(y[j])) ** 2)
-                temp_dist.append(dist)
-            min_dist = min(temp_dist)
-            min_dists.append(min_dist)
+    return OrderedDict([
+        ('cycle', np.full(num_rows, cycle, dtype=object)),
+        ('cast', np.full(num_rows, cast, dtype=object)),
+        ('time', np.repeat(np.array(times, dtype='datetime64[s]'), num_nodes)),
+        ('site', np.tile(np.array(sites, dtype=object), num_times)),
+        ('node', np.tile(np.asarray(nodes, dtype='i8'), num_times)),
+        ('depth', per_node(depth)),
+        ('elevation', per_row(elev)),
+        ('hs', per_row(Hs)),
+        ('tp', per_row(swan_TPS)),
+        # Add new variable here (and to OUTPUT_COLUMNS)
+        ('lon', per_node(lon)),
+        ('lat', per_node(lat)),
+    ])
 
-        # The temp_dist vector is equal in length to the number of ADCIRC
-        # nodes in the study location. Loop through the temp_dist vector
-        # until min_dist is found, the index of this match will be equal
-        # to the number of the ADCIRC node to be used for the profile
-        for j in range(0, len(temp_dist)):
-            if temp_dist[j] == min_dist:
-                nodes_used.append(j)
 
-    return nodes_used
+def make_failed_block(cycle, cast):
+    """
+    Make the placeholder row for a model run (yyyymmddhh) that couldn't be
+    downloaded (the zeros the multiday output used to have). The row has the
+    start of the model run as its time, no site, a node of -1, and NaN values
+    """
+    cycle_time = dt.datetime.strptime(cycle, '%Y%m%d%H')
+    return make_output_block(cycle, cast, [cycle_time], [''], [-1], [np.nan], [np.nan], [np.nan],
+                             [[np.nan]], [[np.nan]], [[np.nan]])
 
 
-def retrieve_data(grid, depth, contour, Hs, swan_TPS, elev, x, y):
+def make_plan_block(plan, cast, t0, t1, elev, Hs, swan_TPS, use_navd88, msl_to_navd88=0.118):
     """
-    Download Hs, Tp, depth, and elevation from the specified contour line
+    Make the output rows for time steps t0 to t1 of a plan (see
+    make_extraction_plan()). elev, Hs, and swan_TPS are (t1 - t0) x node arrays
+    with a column for each of the plan's nodes, every site gets the column of
+    its node. If the plan has an "operator" (see operator_plan()) the values
+    at the sites are interpolated with it instead, one multiply for the block
     """
 
-    # Flip the depth sign if using the nc6b grid
-    if grid == 'nc6b':
-        contour *= -1
+    # Convert the values to NAVD88 if desired. The depth, elevation, and Hs are
+    # moved (like the old .csv rows did), Tp and the location aren't
+    if not use_navd88:
+        msl_to_navd88 = 0
 
-    # Identify the correct nodes to use based on the contour
-    use_depths, use_indexes = deep_water_nodes(depth, contour)
-    print(use_depths)
+    if plan.get('operator') is not None:
+        elev, Hs, swan_TPS = [apply_operator(plan['operator'], values) for values in [elev, Hs, swan_TPS]]
+    else:
+        columns = plan['columns']
+        elev, Hs, swan_TPS = [np.ma.asarray(values)[:, columns] for values in [elev, Hs, swan_TPS]]
 
-    # Get the data
-    Hs = Hs[use_indexes]
-    swan_TPS = swan_TPS[use_indexes]
-    depth = depth[use_indexes]
-    elev = elev[use_indexes]
-    lon = x[use_indexes]
-    lat = y[use_indexes]
+    return make_output_block(plan['cycle'], cast, plan['times'][t0:t1], plan['sites'], plan['node_ids'],
+                             np.asarray(plan['depth']) + msl_to_navd88, plan['x'], plan['y'],
+                             elev + msl_to_navd88, Hs + msl_to_navd88, swan_TPS)
 
-    # Identify the correct nodes within the use_indexes
-    nodes_used = finding_well_points(use_indexes, x, y)
 
-    # Get the data
-    Hs = Hs[nodes_used]
-    swan_TPS = swan_TPS[nodes_used]
-    depth = depth[nodes_used]
-    elev = elev[nodes_used]
-    lon = x[nodes_used]
-    lat = y[nodes_used]
+def apply_operator(operator, values):
+    """
+    Interpolate time x node values to the sites with a sites x nodes matrix
+    (see operator_plan()). Returns a time x sites array. A site with a
+    missing value at one of its nodes gets a missing value
+    """
+    values = np.ma.filled(np.ma.asarray(values, dtype='f8'), np.nan)
+    return np.ma.masked_invalid((operator @ values.T).T)
 
-    # Return the data as a tuple
-    print(Hs, swan_TPS, depth, elev, lon, lat)
 
+def open_output(fname, output_format='csv', attributes=None, resume_offset=None):
+    """
+    Open an output file to write blocks of rows (see make_output_block()) to.
+    output_format is 'csv', 'parquet', 'netcdf', or 'memory' (the blocks are
+    only kept in output['blocks']). attributes (i.e; from output_attributes())
+    are stored in the Parquet and netCDF files. Close it with close_output()
 
-def daterange(start_date, end_date):
-    for n in range(int ((end_date - start_date).days)):
-        yield start_date + dt.timedelta(n)
-     #figuring out the start and end dates --yielding how many days in range
-     #n is adding days 
+    If resume_offset is given (see resume_checkpoint()) an existing .csv file
+    is cut off there and the new rows are added to the end of it
 
+    Writing Parquet files needs the pyarrow package
+    """
 
-def adcirc_full_data_download_OLD(date):
+    if output_format != 'memory' and output_format not in OUTPUT_EXTENSIONS:
+        raise ValueError('Unknown output format: %s' % output_format)
+    if resume_offset is not None and output_format != 'csv':
+        raise ValueError('Only .csv output files can be added to')
+
+    output = {'format': output_format, 'fname': fname, 'blocks': [], 'buffered': 0, 'rows': 0, 'file': None}
+    if output_format == 'csv' and resume_offset is not None:
+        output['file'] = open(fname, 'r+', newline='')
+        output['file'].truncate(resume_offset)
+        output['file'].seek(resume_offset)
+        output['writer'] = csv.writer(output['file'], delimiter=',')
+    elif output_format == 'csv':
+        output['file'] = open(fname, 'w', newline='')
+        output['writer'] = csv.writer(output['file'], delimiter=',')
+        output['writer'].writerow(OUTPUT_COLUMNS)
+    elif output_format == 'parquet':
+        output['file'] = open_parquet_output(fname, attributes or {})
+    elif output_format == 'netcdf':
+        output['file'] = open_netcdf_output(fname, attributes or {})
+
+    return output
+
+
+def write_output_block(output, block):
     """
-    Go into the OpenDAP server and get date for the specified date
+    Add a block of rows to the output. The blocks are written to the
+    file once there are OUTPUT_BLOCK_ROWS rows waiting
     """
-    url_1 = 'http://opendap.renci.org:1935/thredds/dodsC/daily/nam/'
-    url_2 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_HS.63.nc'
-    url_3 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_TPS.63.nc'
-    url_4 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/fort.63.nc'
-    # url_1= website
-    # url_2= significant wave height (swan_Hs)
-    # url_3= peak period (swan_TPS)
-    # add in URL from file if add new variable
+    num_rows = len(block['node'])
+    output['blocks'].append(block)
+    output['buffered'] += num_rows
+    output['rows'] += num_rows
+    if output['format'] != 'memory' and output['buffered'] >= OUTPUT_BLOCK_ROWS:
+        flush_output(output)
 
-    # trying to make earlier dates work
-    # if date earlier than 8/3/2017 then will use these website links
-    test_date = dt.datetime(2017, 8, 3, 00)
-    cur_date = dt.datetime.strptime(date, "%Y%m%d%H")
-
-    # This is a list of dates that have an hsofs URL but come after the test_date. You can add/remove dates
-    # from this list by adding another element (separate with a comma) to the list "dt.datetime(year,month,day,hour)"
-    except_dates = [dt.datetime(2017, 9, 15, 00)]
 
-    if cur_date < test_date or cur_date in except_dates:
-        url_2 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_HS.63.nc'
-        url_3 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_TPS.63.nc'
-        url_4 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/fort.63.nc'
+def flush_output(output):
+    """
+    Write the waiting blocks to the output file as one block
+    """
 
-    tp_url = url_1 + date + url_3
-    hs_url = url_1 + date + url_2
-    z_url = url_1 + date + url_4
-    # add new url for new variable here
+    if not output['blocks'] or output['format'] == 'memory':
+        return
+    block = OrderedDict((column, np.concatenate([waiting[column] for waiting in output['blocks']]))
+                        for column in OUTPUT_COLUMNS)
+    output['blocks'], output['buffered'] = [], 0
 
-    try:
-        # Return the dataset from the netCDF file
-        hs_data = nc.Dataset(hs_url, 'r')
-        tp_data = nc.Dataset(tp_url, 'r')
-        z_data = nc.Dataset(z_url, 'r')
-        status = "good"
-        # add in new dataset here
+    with span('write output') as info:
+        info['values'] = len(block['node'])
+        if output['format'] == 'csv':
+            write_csv_block(output['writer'], block)
+        elif output['format'] == 'parquet':
+            write_parquet_block(output['file'], block)
+        elif output['format'] == 'netcdf':
+            write_netcdf_block(output['file'], block)
 
-    except IOError:
-        hs_data = 0
-        tp_data = 0
-        z_data = 0
-        status = "fail"
-        # add new variable here and set equal to 0
 
-    return hs_data, tp_data, z_data, status
+def close_output(output):
+    """
+    Write anything that is still waiting and close the output file
+    """
+    flush_output(output)
+    if output['file'] is not None:
+        output['file'].close()
+        output['file'] = None
 
 
-def adcirc_full_data_download(date):
+def write_csv_block(writer, block):
     """
-    Go into the OpenDAP server and get date for the specified date
-
-    url_1: Generic path to data
-    url_2: Significant wave heights
-    url_3: Peak periods
-    url_4: Depths
+    Write a block of rows to a .csv file. Times are written as yyyy-mm-dd HH:MM:SS
     """
+    columns = [block[column] for column in OUTPUT_COLUMNS]
+    columns[OUTPUT_COLUMNS.index('time')] = format_times(block['time'])
+    writer.writerows(zip(*[column.tolist() for column in columns]))
 
-    catalog_url = 'http://tds.renci.org:8080/thredds/catalog/daily/nam/'
-    url_1 = 'http://tds.renci.org:8080/thredds/dodsC/daily/nam/'
-    directory_url = catalog_url + date + '/catalog.html'
 
-    # Check if an nc6b grid exists for the date, if so use it.
-    # You can add more urls to these lists!
-    for file in listFD(directory_url):
-        if file.find('nc6b') != -1:
-            url_2 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_HS.63.nc'
-            url_3 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/swan_TPS.63.nc'
-            url_4 = '/nc6b/hatteras.renci.org/dailyv6c/namforecast/fort.63.nc'
-            grid = 'nc6b'
-            break
+def parquet_schema(attributes):
+    """
+    Return the pyarrow schema of the Parquet output
+    """
+    import pyarrow as pa
+
+    fields = []
+    for column in OUTPUT_COLUMNS:
+        if column in ['cycle', 'cast', 'site']:
+            fields.append(pa.field(column, pa.string()))
+        elif column == 'time':
+            fields.append(pa.field(column, pa.timestamp('s')))
+        elif column == 'node':
+            fields.append(pa.field(column, pa.int64()))
         else:
-            url_2 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_HS.63.nc'
-            url_3 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/swan_TPS.63.nc'
-            url_4 = '/hsofs/hatteras.renci.org/namhsofs/namforecast/fort.63.nc'
-            grid = 'hsofs'
+            fields.append(pa.field(column, pa.float64()))
+    return pa.schema(fields, metadata={key: str(value) for key, value in attributes.items()})
 
-    tp_url = url_1 + date + url_3
-    hs_url = url_1 + date + url_2
-    z_url = url_1 + date + url_4
-    # Can add more data here, make sure the addresses are correct
 
+def open_parquet_output(fname, attributes):
+    """
+    Open a Parquet file for writing. Every block is stored as a row group, so
+    readers can skip the blocks (i.e; model runs or times) they don't need
+    """
     try:
-        # Return the dataset from the netCDF file
-        hs_data = nc.Dataset(hs_url, 'r')
-        tp_data = nc.Dataset(tp_url, 'r')
-        z_data = nc.Dataset(z_url, 'r')
-        status = "good"
-        # add in new dataset here
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Writing Parquet files needs the pyarrow package (pip install pyarrow)')
+    return pq.ParquetWriter(fname, parquet_schema(attributes), compression='snappy')
 
-    except IOError:
-        hs_data = 0
-        tp_data = 0
-        z_data = 0
-        status = "fail"
-        # add new variable here and set equal to 0
 
-    return hs_data, tp_data, z_data, status, grid
+def write_parquet_block(writer, block):
+    import pyarrow as pa
+    writer.write_table(pa.Table.from_arrays([pa.array(block[column]) for column in OUTPUT_COLUMNS],
+                                            schema=writer.schema))
 
 
-def hsofs_node_find(x, y):
+def open_netcdf_output(fname, attributes):
     """
-    Find the appropiate nodes in the hsofs grid using the locations of the nodes used
-    from the nc6b grid. Similar to the finding_well_points function, you'll have to
-    enter in the general shoreline orientation of the well locations (DIAG, NS, EW)
+    Make a CF (point feature type) netCDF file to write the rows to. Every
+    column is a variable along the unlimited "obs" dimension
     """
 
-    # Store the locations of the nc6b nodes used in a dictionary (Python data structure type)
-    # Add more locations using the format: 'Location': [lat, lon],
-    # Don't forget the comma at the end!
-    nc6b_nodes = {
-        'Shackleford': [-76.6601, 34.482],
-        'South Core': [-76.10741, 34.66574],
-    }
+    data = nc.Dataset(fname, 'w', format='NETCDF4')
+    data.createDimension('obs', None)
+    data.setncattr('Conventions', 'CF-1.8')
+    data.setncattr('featureType', 'point')
+    data.setncattr('title', 'ADCIRC+SWAN output at the nodes')
+    data.setncattr('source', 'ADCIRC+SWAN model runs from the RENCI THREDDS server')
+    for key, value in attributes.items():
+        data.setncattr(key, str(value))
+
+    for column in ['cycle', 'cast', 'site']:
+        var = data.createVariable(column, str, ('obs',))
+        var.long_name = {'cycle': 'model run (yyyymmddhh)', 'cast': 'forecast, nowcast, or max',
+                         'site': 'site name'}[column]
+
+    time_var = data.createVariable('time', 'f8', ('obs',), zlib=True)
+    time_var.standard_name = 'time'
+    time_var.units = 'seconds since 1970-01-01 00:00:00'
+    time_var.calendar = 'standard'
+
+    for column, (units, long_name, standard_name) in OUTPUT_VARIABLES.items():
+        var = data.createVariable(column, 'i8' if column == 'node' else 'f8', ('obs',), zlib=True,
+                                  fill_value=None if column == 'node' else np.nan)
+        var.units = units
+        var.long_name = long_name
+        if standard_name is not None:
+            var.standard_name = standard_name
+        if column not in ['node', 'lon', 'lat']:
+            var.coordinates = 'time lat lon'
+
+    return data
+
+
+def write_netcdf_block(data, block):
+    """
+    Add a block of rows to the end of a file from open_netcdf_output()
+    """
+    start = len(data.dimensions['obs'])
+    stop = start + len(block['node'])
+    for column in OUTPUT_COLUMNS:
+        if column == 'time':
+            data['time'][start:stop] = block['time'].astype('datetime64[s]').astype('i8').astype('f8')
+        else:
+            data[column][start:stop] = block[column]
 
-    # Loop through the locations in the dictionaries
-    nodes_used = []
-    for key in nc6b_nodes:
 
-        # Set the lat/lon of the current nc6b location as a tuple (Python data structure type)
-        # of (lat, lon). The haversine function in Python uses lat, lon while all the other
-        # methods used here are lon, lat
-        curr_loc = (float(nc6b_nodes[key][1]), float(nc6b_nodes[key][0]))
+def slab_key(var, index):
+    """
+    Make the cache key for reading var[index] (index is a tuple of slices).
+    The key is a hash of the dataset url, the variable name, and the slices
+    """
+    url, shape = var.group().filepath(), var.shape
+    slices = [list(part.indices(length)) for part, length in zip(index, shape)]
+    key = json.dumps([url, var.name, slices])
+    return url, hashlib.sha256(key.encode('utf-8')).hexdigest()
 
-        # Initialize the min_dist variable with some number. It doesn't matter what the
-        # number is, it just has to be very big so that there is at least one node in the
-        # hsofs mesh that is closer to the nc6b node location than this number. It will get
-        # overwritten in the for-loop below immediately.
-        min_dist = 1000000
 
-        # Loop through the nodes in the box
-        for i in range(len(x)):
+def slab_cacheable(url):
+    """
+    Only slabs from the server for model runs that are finished are cached
+    """
+    return SLAB_CACHE_BYTES > 0 and url.startswith(('http://', 'https://')) and catalog_is_final(url)
 
-            # Set a tuple of the (lat, lon) of the current hsofs node being looked at
-            search_location = (float(y[i]), float(x[i]))
 
-            # Use the haversine function to calculate the distance between the nc6b node
-            # location and the current node being looked at. The function defaults to calculating
-            # distance in miles, by setting miles=False it calculates in kilometers.
-            dist = haversine.haversine(search_location, curr_loc, miles=False)
+def read_variable(var):
+    """
+    Download a whole variable (i.e; the mesh or the time axis), trying again
+    if the server has a hiccup (see with_retries())
+    """
+    url = var.group().filepath()
+    return with_retries(lambda: var[:], url)
 
-            if dist < min_dist:
-                # If the distance calculated above is less than the current value
-                # of min_dist, set min_dist to the current value of dist. Store the
-                # index of the current hsofs node too.
-                min_dist = dist
-                index = i
 
-        # Append the index of the closest hsofs node to the nodes_used list
-        nodes_used.append(index)
+def read_slab(var, index, cache_dir=SLAB_CACHE_DIR):
+    """
+    Return var[index] (index is a tuple of slices) using the slab cache. If the
+    slab is in the cache it is read off the disk, otherwise it is downloaded
+    and (if the model run is finished) stored in the cache
+    """
 
-    return nodes_used
+    with span('read ' + var.name) as info:
+        slab, from_cache = read_slab_data(var, tuple(index), cache_dir)
+        info['values'] = np.size(slab)
+        if not from_cache:
+            info['bytes'] = np.asarray(slab).nbytes
+    return slab
 
 
-def get_model_base_time(nc_file):
+def read_slab_data(var, index, cache_dir=SLAB_CACHE_DIR):
     """
-    Retrieve the base date for the model run and return
-    it as a datetime object
+    Do the work for read_slab(). Returns the slab and whether it came from the cache
     """
 
-    # Loop through the attributes of the time variable
-    # in the nc_file until "base_date" is found. Then
-    # store it as a string
-    for attr in nc_file['time'].ncattrs():
-        if attr == 'base_date':
-            base_time_str = getattr(nc_file['time'], attr)
-            break
-
-    # Convert the base_time string into a datetime object
-    dt_format = '%Y-%m-%d %H:%M:%S'
-    base_time_dt = dt.datetime.strptime(base_time_str, dt_format)
-
-    return base_time_dt
+    url, key = slab_key(var, index)
+    if not slab_cacheable(url):
+        return with_retries(lambda: var[index], url), False
 
+    fname = os.path.join(cache_dir, key[:2], key + '.npz')
+    try:
+        with np.load(fname) as cached:
+            data = cached['data']
+            mask = cached['mask'] if 'mask' in cached else np.ma.nomask
+        os.utime(fname, None)
+        with slab_cache_lock:
+            slab_cache_stats['hits'] += 1
+            slab_cache_stats['bytes_from_cache'] += data.nbytes
+        return np.ma.masked_array(data, mask=mask), True
+    except (IOError, ValueError, KeyError):
+        pass
+
+    slab = with_retries(lambda: var[index], url)
+    with slab_cache_lock:
+        slab_cache_stats['misses'] += 1
+        slab_cache_stats['bytes_downloaded'] += np.asarray(slab).nbytes
+
+    # Store the slab. Only keep the mask if something is actually masked
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    temp_fname = '%s.%d.%d.tmp.npz' % (fname[:-4], os.getpid(), threading.get_ident())
+    arrays = {'data': np.ma.getdata(slab)}
+    if np.ma.is_masked(slab):
+        arrays['mask'] = np.ma.getmaskarray(slab)
+    np.savez_compressed(temp_fname, **arrays)
+    os.replace(temp_fname, fname)
+    trim_slab_cache(os.path.getsize(fname), cache_dir)
+
+    return slab, False
+
+
+def trim_slab_cache(added_bytes=0, cache_dir=SLAB_CACHE_DIR):
+    """
+    Keep track of how big the slab cache is and remove the least recently used
+    slabs once it is bigger than SLAB_CACHE_BYTES (down to 90% of it)
+    """
 
-def dst_start_end(year):
+    with slab_cache_lock:
+        if slab_cache_state['size'] is not None:
+            slab_cache_state['size'] += added_bytes
+            if slab_cache_state['size'] <= SLAB_CACHE_BYTES:
+                return
+
+        # Look at what is actually on disk (other processes may be writing too)
+        cached_files = []
+        for folder, sub_folders, fnames in os.walk(cache_dir):
+            for fname in fnames:
+                if fname.endswith('.npz') and '.tmp' not in fname:
+                    path = os.path.join(folder, fname)
+                    try:
+                        stats = os.stat(path)
+                    except OSError:
+                        continue
+                    cached_files.append((stats.st_mtime, stats.st_size, path))
+
+        size = sum(file_size for mtime, file_size, path in cached_files)
+        if size > SLAB_CACHE_BYTES:
+            for mtime, file_size, path in sorted(cached_files):
+                if size <= SLAB_CACHE_BYTES * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    size -= file_size
+                except OSError:
+                    pass
+
+        slab_cache_state['size'] = size
+
+
+def slab_cache_info():
     """
-    Return the start and end times of daylight
-    savings based on the year being looked at
+    Return the slab cache hit/miss counters for this process
     """
+    with slab_cache_lock:
+        return dict(slab_cache_stats)
 
-    # Can add more years, just follow the pattern of the top
-    # year as "if year == ____:" and the rest as
-    # "elif year == ____:"
-    if year == 2016:
-        dst_start = dt.datetime(year, 3, 13, 2, 00)
-        dst_end = dt.datetime(year, 11, 6, 2, 00)
-    elif year == 2017:
-        dst_start = dt.datetime(year, 3, 12, 2, 00)
-        dst_end = dt.datetime(year, 11, 5, 2, 00)
-    elif year == 2018:
-        dst_start = dt.datetime(year, 3, 11, 2, 00)
-        dst_end = dt.datetime(year, 11, 4, 2, 00)
 
-    return dst_start, dst_end
+def time_chunk_size(num_nodes, variables, num_steps, memory_budget=SLAB_MEMORY_BUDGET):
+    """
+    Return how many time steps can be read at once from the variables
+    (netCDF variables) for num_nodes nodes without going over the memory budget
+    """
+    step_bytes = num_nodes * sum(var.dtype.itemsize for var in variables)
+    return int(max(1, min(num_steps, memory_budget // max(step_bytes, 1))))
 
 
-def get_real_time(base_time, time, gmt):
+def read_time_slabs(variables, nodes, num_steps, memory_budget=SLAB_MEMORY_BUDGET):
     """
-    Use the base time and the current time value to
-    determine the real time represented by the current
-    model time step
+    Read the variables (a list of time x node netCDF variables) at the nodes
+    in blocks of time steps. Every variable is downloaded with one request
+    per run of nodes (see coalesce_runs()) per block (i.e; swan_HS[t0:t1, first:stop])
+    instead of one request per time step. The number of time steps in a block
+    is set by the memory budget.
+
+    Yields (t0, t1, blocks) where blocks has one (t1 - t0) x node array per
+    variable, with a column for every node
+    """
+
+    chunk = time_chunk_size(len(nodes), variables, num_steps, memory_budget)
+    runs = coalesce_runs(nodes, free_gap=request_gap(variables, chunk))
+    for t0 in range(0, num_steps, chunk):
+        t1 = min(t0 + chunk, num_steps)
+        blocks = [read_nodes(var, nodes, runs, slice(t0, t1)) for var in variables]
+        yield t0, t1, blocks
 
-    The time in ADCIRC is in GMT, the optional GMT argument will convert the time to
-    Eastern time if set to true
 
-    Returns the real time as a string and as a datetime object
+def extract_cycle_data(hs_data, tp_data, z_data, plan, output, use_gmt, use_navd88,
+                       cast='forecast', msl_to_navd88=0.118):
+    """
+    Loop through every time step in the plan (see make_extraction_plan()),
+    download Hs, Tp, and elevation at the plan's nodes and write the values
+    to the output (see open_output())
     """
 
-    # The time argument comes from ADCIRC, it is equal to the number
-    # of seconds since the reference time included in the metadata. Set
-    # it as the timestep and then add it to the base time to calculate
-    # the real time in GMT
-    real_time_step = dt.timedelta(seconds=time)
-    real_time = base_time + real_time_step
-    real_time_str = real_time.strftime('%Y-%m-%d %H:%M:%S')
+    num_steps = len(plan['times'])
 
-    # If gmt is set to false than the time will convert to EDT
-    if ~gmt:
+    # Download the appropriate Hs, TPS, and elevation values. In the multiday
+    # script, the data can be thought of as a 2D vector (i.e; 1x*length*); Here,
+    # the data can be thought of as a matrix where there is a row for every time
+    # step and a column for every node. Whole blocks of rows are downloaded at once
+    # Put in new variable here
+    variables = [hs_data['swan_HS'], tp_data['swan_TPS'], z_data['zeta']]
+    for t0, t1, (Hs, swan_TPS, elev) in read_time_slabs(variables, plan['nodes'], num_steps):
 
-        # Check if the date is during daylight savings time
-        use_year = int(real_time_str[0:4])  # Get the year
-        dst_start, dst_end = dst_start_end(use_year)
-        if (dst_start < real_time < dst_end):
-            gmt_adjust = dt.timedelta(hours=4)
-            real_time = real_time - gmt_adjust
-            real_time_str = real_time.strftime('%Y-%m-%d %H:%M:%S')
-        else:
-            gmt_adjust = dt.timedelta(hours=5)
-            real_time = real_time - gmt_adjust
-            real_time_str = real_time.strftime('%Y-%m-%d %H:%M:%S')
+        print_time_steps(cast, t0, t1, num_steps, plan['times'], use_gmt)
 
-    return real_time, real_time_str
+        # Write the whole block of time steps at once
+        with span('write rows') as info:
+            write_output_block(output, make_plan_block(plan, cast, t0, t1, elev, Hs, swan_TPS,
+                                                       use_navd88, msl_to_navd88))
+            info['values'] = t1 - t0
 
 
-def find_nowcast(date):
+def node_runs(nodes):
     """
-    See if a nowcast run exists for the current data and return a
-    "True"/"False". This uses the same listFD function that checks
-    for an nc6b grid in the adcirc_full_data_download() function but
-    here a different URL is passed to listFD() which allows it to check
-    if a folder named "nowcast" exists
+    Group node IDs into runs of neighbouring nodes (i.e; [5, 6, 7, 20] becomes
+    [(5, 8), (20, 21)]). Each run is returned as (first node, last node + 1)
+    so it can be used as a slice
     """
+    nodes = np.unique(np.asarray(nodes, dtype=int))
+    breaks = np.where(np.diff(nodes) != 1)[0] + 1
+    return [(int(run[0]), int(run[-1]) + 1) for run in np.split(nodes, breaks) if len(run)]
 
-    gen_url = 'http://tds.renci.org:8080/thredds/catalog/daily/nam/'
-    casts_url = gen_url + date + '/hsofs/hatteras.renci.org/namhsofs/catalog.html'
-
-    for cast in listFD(casts_url):
-        if cast.find('nowcast') != -1:
-            res = True
-            break
-        else:
-            res = False
-
-    return res
 
+def read_nodes(var, nodes, runs=None, times=slice(None)):
+    """
+    Read the values at the given nodes from a netCDF variable without
+    downloading the whole mesh. var can be a node variable (i.e; depth) or
+    a time x node variable (i.e; swan_HS), in which case the time steps in
+    times (every time step by default) are read at once. One request is made
+    per run of nodes (see coalesce_runs()).
 
-def adcirc_full_nowcast_data_download(date):
+    Returns the values with the last axis in the same order as nodes
     """
-    Go into the OpenDAP server and get date for the specified date
 
-    url_1: Generic path to data
-    url_2: Significant wave heights
-    url_3: Peak periods
-    url_4: Depths
+    nodes = np.asarray(nodes, dtype=int)
+    if runs is None:
+        runs = coalesce_runs(nodes)
 
-    8/10/18: All nowcasts are on the hsofs grid so this function will just
-             assume an hsofs grid
-    """
+    # Download each run of nodes
+    if var.ndim == 1:
+        pieces = [read_slab(var, (slice(first, stop),)) for first, stop in runs]
+    else:
+        pieces = [read_slab(var, (times, slice(first, stop))) for first, stop in runs]
+    columns = np.ma.concatenate(pieces, axis=-1)
 
-    url_1 = 'http://tds.renci.org:8080/thredds/dodsC/daily/nam/'
-    url_2 = '/hsofs/hatteras.renci.org/namhsofs/nowcast/swan_HS.63.nc'
-    url_3 = '/hsofs/hatteras.renci.org/namhsofs/nowcast/swan_TPS.63.nc'
-    url_4 = '/hsofs/hatteras.renci.org/namhsofs/nowcast/fort.63.nc'
-    grid = 'hsofs'
+    # Put the columns back into the order the nodes were asked for
+    run_nodes = np.concatenate([np.arange(first, stop) for first, stop in runs])
+    return columns[..., np.searchsorted(run_nodes, nodes)]
 
-    # Print out which grid is being used
-    print('Using %s grid for nowcast data\n' % grid)
 
-    tp_url = url_1 + date + url_3
-    hs_url = url_1 + date + url_2
-    z_url = url_1 + date + url_4
-    # Can add more data here, make sure the addresses are correct
+def extract_known_node_data(hs_data, tp_data, z_data, plan, output, use_gmt, use_navd88,
+                            cast='forecast', msl_to_navd88=0.118):
+    """
+    Loop through every time step in the plan (see make_known_node_plan()),
+    and write Hs, Tp, and elevation at the known nodes to the output (see
+    open_output()). The whole time series for the nodes is downloaded first
+    """
 
-    try:
-        # Return the dataset from the netCDF file
-        hs_data = nc.Dataset(hs_url, 'r')
-        tp_data = nc.Dataset(tp_url, 'r')
-        z_data = nc.Dataset(z_url, 'r')
-        status = "good"
-        # add in new dataset here
+    nodes = plan['nodes']
+    num_steps = len(plan['times'])
 
-    except IOError:
-        hs_data = 0
-        tp_data = 0
-        z_data = 0
-        status = "fail"
-        # add new variable here and set equal to 0
+    # Grab data from the nodes, every array is time x node
+    # Put in new variable here
+    variables = [hs_data['swan_HS'], tp_data['swan_TPS'], z_data['zeta']]
+    runs = coalesce_runs(nodes, free_gap=request_gap(variables, num_steps))
+    Hs, swan_TPS, elev = [read_nodes(var, nodes, runs) for var in variables]
 
-    return hs_data, tp_data, z_data, status, grid
+    print_time_steps(cast, 0, num_steps, num_steps, plan['times'], use_gmt)
 
+    with span('write rows') as info:
+        write_output_block(output, make_plan_block(plan, cast, 0, num_steps, elev, Hs, swan_TPS,
+                                                   use_navd88, msl_to_navd88))
+        info['values'] = num_steps
 
-def download_nowcast_data(date, bottom_lat, upper_lat, left_lon, right_lon, writer, bad_dates_log, use_gmt, use_navd88):
+
+def download_nowcast_data(date, bottom_lat, upper_lat, left_lon, right_lon, output, bad_dates_log, use_gmt, use_navd88,
+                          sites=None, method='node'):
     """
     If a nowcast exists for the current date, this function will download
     all the nowcast data first before the main program runs. This function
@@ -763,112 +3817,10 @@ def download_nowcast_data(date, bottom_lat, upper_lat, left_lon, right_lon, writ
 
     if status == 'good':
 
-        x = hs_data['x']
-        y = hs_data['y']
-        time = hs_data['time']
-
-        # Setup the time
-        base_time_dt = get_model_base_time(hs_data)
-
-        # Narrow down the lat/lon
-        start, end = find_search_indexes(left_lon, right_lon, x)
-        x, y = x_y_refine(x, y, start, end)
-
-        # Loop through every time step and record the value of that
-        # variable at the current time
-        for t in range(len(time)):
-
-            # Calculate the "real" time from the model
-            real_time, real_time_str = get_real_time(base_time_dt, time[t], gmt=use_gmt)
-
-            # Print the current time step being worked on
-            if use_gmt:
-                print('Currently working on forecast time step %d of %d (Real time: %s GMT)' %
-                      (t + 1, len(time), real_time))
-            else:
-                print('Currently working on forecast time step %d of %d (Real time: %s EST)' %
-                      (t + 1, len(time), real_time))
-
-            # Download the appropriate Hs,TPS, depth values.
-            # The indexes where the netCDF is using the "nc6b" url
-            # path returns the start and end indexes in reverse order
-            # so swap them here.
-            # In the multiday script, the data can be thought of as
-            # a 2D vector (i.e; 1x*length*); Here, the data can be thought of as a matrix
-            # where there is a row for every time step and a column for every node. So, to
-            # find the right points here, not only are the nodes indexed "[start:end]" but
-            # the time is also indexed as "[t]"
-            if start > end:
-                Hs = hs_data['swan_HS'][t][end:start]
-                swan_TPS = tp_data['swan_TPS'][t][end:start]
-                depth = hs_data['depth'][end:start]
-                elev = z_data['zeta'][t][end:start]
-                # Put in vew variable here "[t][end:start]"
-                # If "IndexError: invalid index to scalar variable." then try removing the "[t]"
-                #   since not all variables (i.e; Depth) do not change with time
-            elif start <= end:
-                Hs = hs_data['swan_HS'][t][start:end]
-                swan_TPS = tp_data['swan_TPS'][t][start:end]
-                depth = hs_data['depth'][start:end]
-                elev = z_data['zeta'][t][start:end]
-                # Put in new variable here "[t][start:end]"
-                # If "IndexError: invalid index to scalar variable." then try removing the "[t]"
-                #   since not all variables (i.e; Depth) do not change with time
-
-            # Find the nodes at the defined contour. This can be changed but should be kept at -20
-            deep_contour = -20
-            mhw_contour = 0.34
-            if grid == 'nc6b':
-
-                # Get deep water data
-                deep_contour *= -1
-                use_depths, use_indexes = deep_water_nodes(depth, deep_contour)
-                Hs = Hs[use_indexes]
-                swan_TPS = swan_TPS[use_indexes]
-                elev = elev[use_indexes]
-                deep_nodes_used = finding_well_points(use_indexes, x, y)
-
-            elif grid == 'hsofs':
-
-                # Get deep water data
-                deep_nodes_used = hsofs_node_find(x, y)
-
-            # Every time step is one hour. Here, the date is adjusted
-            # using the dt.timedelta function by setting the "t" value
-            # being looped over to hours and then adding it to the date
-            # The date is briefly converted back into a datetime object
-            # to do this and then reconverted back into a string. The
-            # if-statement (if t != 0) makes sure that the time is correct
-            if t != 0:
-                time_step = dt.timedelta(hours=1)
-                date = dt.datetime.strptime(date, '%Y%m%d%H')
-                date += time_step
-                date = date.strftime('%Y%m%d%H')
-
-            line = []
-            line.append(real_time_str)
-            for deep_node in deep_nodes_used:
-
-                # Convert the values to NAVD88 if desired
-                msl_to_navd88 = -0.112  # Meters
-                if use_navd88:
-                    line.append(depth[deep_node] + msl_to_navd88)
-                    line.append(elev[deep_node] + msl_to_navd88)
-                    line.append(Hs[deep_node] + msl_to_navd88)
-                    line.append(swan_TPS[deep_node])
-                    # Add new variable here as "line.append(___[node])"
-                    line.append(x[deep_node])
-                    line.append(y[deep_node])
-                else:
-                    line.append(depth[deep_node])
-                    line.append(elev[deep_node])
-                    line.append(Hs[deep_node])
-                    line.append(swan_TPS[deep_node])
-                    # Add new variable here as "line.append(___[node])"
-                    line.append(x[deep_node])
-                    line.append(y[deep_node])
-
-            writer.writerow(line)
+        plan = make_extraction_plan(hs_data, grid, (bottom_lat, upper_lat, left_lon, right_lon), use_gmt,
+                                    date=date, sites=sites, method=method, z_data=z_data)
+        extract_cycle_data(hs_data, tp_data, z_data, plan, output, use_gmt, use_navd88,
+                           cast='nowcast', msl_to_navd88=-0.112)
 
     elif status != 'good':
         # Print the current date and status to the console
@@ -877,12 +3829,8 @@ def download_nowcast_data(date, bottom_lat, upper_lat, left_lon, right_lon, writ
         bad_dates_log.write(log_line)
         print('Date stored in bad_dates_log.txt\r\n')
 
-    # Clear the hour from the date string
-    # Return to: yyyymmdd
-    date = date[:-2]
-
 
-def download_nowcast_data_known_node(date, nodes_used, writer, bad_dates_log, use_gmt, use_navd88):
+def download_nowcast_data_known_node(date, nodes_used, output, bad_dates_log, use_gmt, use_navd88):
     """
     If a nowcast exists for the current date, this function will download
     all the nowcast data first before the main program runs. This function
@@ -898,74 +3846,9 @@ def download_nowcast_data_known_node(date, nodes_used, writer, bad_dates_log, us
 
     if status == 'good':
 
-        x = hs_data['x']
-        y = hs_data['y']
-        time = hs_data['time']
-
-        # Setup the time
-        base_time_dt = get_model_base_time(hs_data)
-
-        # Loop through every time step and record the value of that
-        # variable at the current time
-        for t in range(len(time)):
-
-            # Calculate the "real" time from the model
-            real_time, real_time_str = get_real_time(base_time_dt, time[t], gmt=use_gmt)
-
-            # Print the current time step being worked on
-            if use_gmt:
-                print('Currently working on nowcast time step %d of %d (Real time: %s GMT)' %
-                      (t + 1, len(time), real_time))
-            else:
-                print('Currently working on nowcast time step %d of %d (Real time: %s EST)' %
-                      (t + 1, len(time), real_time))
-
-            # Grab data from the node
-            Hs, swan_TPS, depth, elev, X, Y = [], [], [], [], [], []
-            for node in nodes_used:
-                Hs.append(hs_data['swan_HS'][t][node])
-                swan_TPS.append(tp_data['swan_TPS'][t][node])
-                depth.append(hs_data['depth'][node])
-                elev.append(z_data['zeta'][t][node])
-                X.append(x[node])
-                Y.append(y[node])
-
-            # Every time step is one hour. Here, the date is adjusted
-            # using the dt.timedelta function by setting the "t" value
-            # being looped over to hours and then adding it to the date
-            # The date is briefly converted back into a datetime object
-            # to do this and then reconverted back into a string. The
-            # if-statement (if t != 0) makes sure that the time is correct
-            if t != 0:
-                time_step = dt.timedelta(hours=1)
-                date = dt.datetime.strptime(date, '%Y%m%d%H')
-                date += time_step
-                date = date.strftime('%Y%m%d%H')
-
-            line = []
-            line.append(real_time_str)
-            for node in range(len(nodes_used)):
-
-                # Convert the values to NAVD88 if desired
-                msl_to_navd88 = 0.118  # Meters
-                if use_navd88:
-                    line.append(depth[node] + msl_to_navd88)
-                    line.append(elev[node] + msl_to_navd88)
-                    line.append(Hs[node] + msl_to_navd88)
-                    line.append(swan_TPS[node])
-                    # Add new variable here as "line.append(___[node])"
-                    line.append(X[node])
-                    line.append(Y[node])
-                else:
-                    line.append(depth[node])
-                    line.append(elev[node])
-                    line.append(Hs[node])
-                    line.append(swan_TPS[node])
-                    # Add new variable here as "line.append(___[node])"
-                    line.append(X[node])
-                    line.append(Y[node])
-
-            writer.writerow(line)
+        plan = make_known_node_plan(hs_data, grid, nodes_used, use_gmt, date=date)
+        extract_known_node_data(hs_data, tp_data, z_data, plan, output, use_gmt, use_navd88,
+                                cast='nowcast')
 
     elif status != 'good':
         # Print the current date and status to the console
@@ -974,9 +3857,123 @@ def download_nowcast_data_known_node(date, nodes_used, writer, bad_dates_log, us
         bad_dates_log.write(log_line)
         print('Date stored in bad_dates_log.txt\r\n')
 
-    # Clear the hour from the date string
-    # Return to: yyyymmdd
-    date = date[:-2]
+    return status
+
+
+def extract_max_cycle(date, bounding_box, contour=20, sites=None, method='node'):
+    """
+    Download the maximum Hs, Tp, and elevation for one model run (yyyymmddhh)
+    and make the output rows (see make_output_block()) for the nodes at the
+    sites (see load_sites()) in the bounding box (see load_bounding_box()).
+    The time of the rows is the start of the model run. method is one of
+    SITE_METHODS. This is one cycle of ADCIRC_Multiday_Data_Download.py
+
+    Returns (date, status, block). block is None if the data couldn't be loaded
+    """
+
+    # Download the data
+    hs_data, tp_data, z_data, status = adcirc_data_download(date)
+    if status != 'good':
+        return date, status, None
+
+    # If the server stops answering part way through, the model run gets
+    # the status of the error so it can be tried again later
+    try:
+        block = make_max_block(date, hs_data, tp_data, z_data, bounding_box, contour, sites, method)
+    except (IOError, RuntimeError) as error:
+        print('ERROR: Could not read the data for %s (%s)\r\n' % (date, error))
+        block, status = None, classify_error(error)
+
+    for dataset in [hs_data, tp_data, z_data]:
+        dataset.close()
+
+    return date, status, block
+
+
+def make_max_block(date, hs_data, tp_data, z_data, bounding_box, contour=20, sites=None, method='node'):
+    """
+    Do the work for extract_max_cycle() once the datasets are open
+    """
+
+    if sites is None:
+        sites = load_sites()
+    if method not in SITE_METHODS:
+        raise ValueError('Unknown site method: %s' % method)
+
+    # Put in new variable here
+    variables = [hs_data['swan_HS_max'], tp_data['swan_TPS_max'], z_data['zeta_max']]
+    cycle_time = dt.datetime.strptime(date, '%Y%m%d%H')
+
+    # Narrow down the lat/lon. The node locations come from the mesh cache
+    # and the nodes in the box are only worked out once per grid
+    mesh = get_mesh(hs_data, dataset_grid(hs_data))
+
+    # Put the sites on the contour line or interpolate at the sites
+    # themselves, only the nodes around them are downloaded
+    if method != 'node':
+        if method == 'isobath':
+            operator = isobath_operator(z_data, mesh, bounding_box, contour, sites)
+        else:
+            operator = barycentric_operator(z_data, mesh, sites)
+        plan = operator_plan(operator, mesh, sites)
+        plan.update({'cycle': date, 'times': [cycle_time]})
+        max_Hs, swan_TPS_max, elev = [read_nodes(var, plan['nodes']) for var in variables]
+        return make_plan_block(plan, 'max', 0, 1, elev[None], max_Hs[None], swan_TPS_max[None], False)
+
+    box = get_box(mesh, bounding_box, request_gap(variables))
+    x = np.asarray(mesh['x'][box['nodes']])
+    y = np.asarray(mesh['y'][box['nodes']])
+    depth = np.asarray(mesh['depth'][box['nodes']])
+
+    # Find the nodes at the contour (20m is standard) closest to the wells.
+    # These only depend on the mesh, the contour nodes are only worked out
+    # for the first model run
+    with span('node search') as info:
+        use_depths, use_indexes = contour_nodes(mesh, box, contour)
+        nodes_used = finding_well_points(use_indexes, x, y, sites)
+        info['values'] = len(depth)
+
+    # Download the appropriate Hs, TPS values at the sites' nodes only (every
+    # node once, one request per run of nodes). The depths are the same in
+    # every model run so they come from the mesh cache
+    # Add new variable here as "___[None]"
+    site_nodes = box['nodes'][nodes_used]
+    runs = coalesce_runs(site_nodes, free_gap=request_gap(variables))
+    max_Hs, swan_TPS_max, elev = [read_nodes(var, site_nodes, runs) for var in variables]
+
+    block = make_output_block(date, 'max', [cycle_time], sites['name'],
+                              site_nodes, depth[nodes_used],
+                              x[nodes_used], y[nodes_used], elev[None],
+                              max_Hs[None], swan_TPS_max[None])
+
+    return block
+
+
+def extract_known_node_cycle(date, nodes_used, use_gmt, use_navd88):
+    """
+    Download the nowcast data at the known nodes for one model run (yyyymmddhh),
+    if it has a nowcast. This is one cycle of
+    ADCIRC_Known_Node_Multiday_Data_Download_Updated.py
+
+    Returns (date, status, blocks, log). The output blocks (see
+    make_output_block()) and bad date log lines are returned so they can be
+    written to the files in order. The status is "missing" if there is no nowcast
+    """
+
+    rows, log = open_output(None, 'memory'), io.StringIO()
+    status = 'missing'
+    try:
+        if find_nowcast(date):
+            status = download_nowcast_data_known_node(date, nodes_used, rows, log, use_gmt, use_navd88)
+
+    # If the server stops answering part way through, the rows so far are
+    # thrown away and the model run gets the status of the error
+    except (IOError, RuntimeError) as error:
+        print('ERROR: Could not read the data for %s (%s)\r\n' % (date, error))
+        log.write('\r\n' + date + '\tCould not read nowcast data')
+        rows['blocks'], status = [], classify_error(error)
+
+    return date, status, rows['blocks'], log.getvalue()
 
 
 def make_date_range():
@@ -1004,8 +4001,8 @@ def make_date_range():
     print('---------------------')
 
     # Set the time zone and vertical datum
-    use_gmt = bool(input('Use GMT (T) or EST (F): '))
-    use_navd88 = bool(input('Use NAVD88 (T) or MSL (F): '))
+    use_gmt = yes_no(input('Use GMT (T) or EST (F): '))
+    use_navd88 = yes_no(input('Use NAVD88 (T) or MSL (F): '))
 
     # Enter the node IDs
     print('---------------------')
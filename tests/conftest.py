@@ -0,0 +1,11 @@
+"""
+Put the repository folder and the benchmarks folder on the path so the
+tests can import functions.py and the synthetic model runs
+"""
+
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+sys.path.insert(0, REPO_DIR)
@@ -0,0 +1,51 @@
+"""
+Check that the depth contour search in deep_water_nodes() finds the same
+nodes as the old loop (deep_water_nodes_OLD) and that contour_nodes() gives
+the same nodes every time it is called. The cases are in
+benchmarks/contour_cases.py, contour_benchmark.py times them.
+
+Run from the repository folder: python -m pytest tests
+"""
+
+import numpy as np
+import pytest
+
+import functions as func
+import synthetic_adcirc as syn
+from contour_cases import EDGE_CASES, contour_cases, loop_nodes, same_nodes
+
+
+@pytest.fixture(scope='module', params=[(20000, True), (20000, False), (200000, True)],
+                ids=['20000 random', '20000 longitude', '200000 random'])
+def mesh_box(request):
+    """
+    A synthetic mesh with random or longitude ordered node numbers and the
+    nodes in the default bounding box
+    """
+    num_nodes, shuffle = request.param
+    bounding_box = func.load_bounding_box()
+    mesh = syn.make_mesh(num_nodes, shuffle=shuffle)
+    mesh['fingerprint'] = func.mesh_fingerprint('hsofs', mesh['x'], mesh['y'])
+    nodes = np.flatnonzero(func.box_mask(mesh['x'], mesh['y'], bounding_box))
+    return mesh, {'nodes': nodes, 'bounding_box': tuple(bounding_box)}
+
+
+@pytest.mark.parametrize('name, depths, contour', EDGE_CASES, ids=[case[0] for case in EDGE_CASES])
+def test_edge_cases(name, depths, contour):
+    assert same_nodes(loop_nodes(depths, contour), func.deep_water_nodes(depths, contour))
+
+
+def test_mesh_cases(mesh_box):
+    mesh, box = mesh_box
+    for name, depths, contour in contour_cases(mesh, box['nodes']):
+        assert same_nodes(loop_nodes(depths, contour), func.deep_water_nodes(depths, contour)), name
+
+
+def test_contour_nodes(mesh_box):
+    # The first call searches, after that the same nodes come from memory
+    mesh, box = mesh_box
+    func.loaded_contours.clear()
+    first_result = func.contour_nodes(mesh, box, 20)
+    cached_result = func.contour_nodes(mesh, box, 20)
+    assert np.array_equal(first_result[1], cached_result[1])
+    assert np.array_equal(first_result[1], func.deep_water_nodes(mesh['depth'][box['nodes']], 20)[1])
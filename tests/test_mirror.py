@@ -0,0 +1,107 @@
+"""
+Mirror model runs from a fake THREDDS server (benchmarks/fake_thredds.py)
+serving a small synthetic model run, and check that the mirror can be
+verified, that files are tried again when the server fails, and that a file
+that can't be downloaded doesn't stop the others.
+
+Run from the repository folder: python -m pytest tests
+"""
+
+import os
+import threading
+
+import pytest
+
+import fake_thredds
+import functions as func
+import synthetic_adcirc as syn
+
+DATE = '2017081000'
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    """
+    A fake THREDDS server for a folder with one synthetic model run
+    """
+    folder = str(tmp_path_factory.mktemp('server'))
+    syn.make_cycle(folder, DATE, num_nodes=2000, num_times=3, nowcast=False)
+    server = fake_thredds.make_server(folder, seed=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def root(server, tmp_path, monkeypatch):
+    """
+    Point the downloads at the server and return the catalog root. The
+    catalogs are cached in a temporary folder (the default folder of
+    fetch_catalog() is set when functions.py is imported) and the waits
+    between tries are made short
+    """
+    address = 'http://127.0.0.1:%d' % server.server_address[1]
+    server.settings['error_rate'] = 0.0
+    monkeypatch.setenv('no_proxy', '127.0.0.1')
+    monkeypatch.setattr(func, 'FILESERVER_ROOT', address + fake_thredds.FILESERVER_PATH)
+    monkeypatch.setattr(func.fetch_catalog, '__defaults__', (str(tmp_path / 'catalog_cache'),))
+    monkeypatch.setattr(func, 'catalog_cache', func.OrderedDict())
+    monkeypatch.setattr(func, 'breakers', {})
+    monkeypatch.setattr(func, 'RETRY_WAIT', 0.01)
+    return address + fake_thredds.CATALOG_PATH
+
+
+def test_verify_mirror(root, tmp_path):
+    mirror = str(tmp_path / 'mirror')
+    num_downloaded, failed = func.mirror_cycles([DATE], mirror, root=root)
+    assert num_downloaded == len(func.VARIABLE_FILES) and failed == []
+    assert func.verify_mirror(mirror) == []
+
+    # A changed file is reported and is the only one downloaded again
+    paths = sorted(func.load_mirror_checksums(mirror))
+    with open(os.path.join(mirror, *paths[0].split('/')), 'ab') as data_file:
+        data_file.write(b'0')
+    assert func.verify_mirror(mirror) == [paths[0]]
+    assert func.mirror_cycles([DATE], mirror, root=root) == (1, [])
+    assert func.verify_mirror(mirror) == []
+
+
+def test_retry_files(server, root, tmp_path, monkeypatch):
+    # Every file is tried again on its own until the server sends it
+    monkeypatch.setattr(func, 'RETRY_ATTEMPTS', 10)
+    monkeypatch.setattr(func, 'BREAKER_FAILURES', 1000)
+    server.settings['error_rate'] = 0.3
+    errors = server.stats['errors']
+
+    mirror = str(tmp_path / 'mirror')
+    num_downloaded, failed = func.mirror_cycles([DATE], mirror, root=root)
+    assert num_downloaded == len(func.VARIABLE_FILES) and failed == []
+    assert server.stats['errors'] > errors
+    assert func.verify_mirror(mirror) == []
+
+
+def test_skip_failed_files(root, tmp_path, monkeypatch):
+    mirror = str(tmp_path / 'mirror')
+    download_mirror_file = func.download_mirror_file
+    bad_path = []
+
+    def fail_first(path, folder):
+        if not bad_path:
+            bad_path.append(path)
+        if path == bad_path[0]:
+            raise IOError('Injected error for %s' % path)
+        return download_mirror_file(path, folder)
+
+    # The other files are still downloaded and their checksums stored
+    monkeypatch.setattr(func, 'download_mirror_file', fail_first)
+    num_downloaded, failed = func.mirror_cycles([DATE], mirror, root=root)
+    assert failed == bad_path and num_downloaded == len(func.VARIABLE_FILES) - 1
+    assert bad_path[0] not in func.load_mirror_checksums(mirror)
+    assert func.verify_mirror(mirror) == []
+
+    # Running it again only downloads the file that failed
+    monkeypatch.setattr(func, 'download_mirror_file', download_mirror_file)
+    assert func.mirror_cycles([DATE], mirror, root=root) == (1, [])
+    assert func.verify_mirror(mirror) == []